@@ -0,0 +1,9 @@
+"""
+Benchmarks of the ClaimChain public API.
+
+Run them with ``python -m benchmarks run``, and compare two runs with
+``python -m benchmarks compare``. See ``python -m benchmarks --help``.
+"""
+
+from .harness import benchmark, load_benchmarks, run_benchmarks
+from .harness import compare_results, Workload, DEFAULT_CONFIG
@@ -0,0 +1,105 @@
+"""
+Command line interface of the benchmarks.
+
+    python -m benchmarks run --claims 100,1000 --readers 50 -o current.json
+    python -m benchmarks compare baseline.json current.json --threshold 0.1
+
+``compare`` exits with status 1 if the throughput of any benchmark that
+is in both runs dropped by more than the threshold.
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import argparse
+
+from .harness import run_benchmarks, compare_results, format_comparison
+
+
+def _int_list(value):
+    try:
+        values = [int(item) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+                'Expected comma-separated integers: %s' % value)
+    if any(item < 1 for item in values):
+        raise argparse.ArgumentTypeError('Sizes have to be positive.')
+    return values
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def run(args):
+    config = {}
+    for name in ('claims', 'readers', 'grants'):
+        values = getattr(args, name)
+        if values is not None:
+            config[name] = values
+    results = run_benchmarks(config, pattern=args.filter,
+                             repeat=args.repeat, memory=not args.no_memory,
+                             log=lambda line: print(line, file=sys.stderr))
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    return 0
+
+
+def compare(args):
+    rows = compare_results(_load(args.baseline), _load(args.current),
+                           threshold=args.threshold)
+    print(format_comparison(rows))
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        print('%d of %d benchmarks regressed by more than %.0f%%.' % (
+              len(regressions), len(rows), args.threshold * 100),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='ClaimChain benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='Run benchmarks')
+    run_parser.add_argument('--claims', type=_int_list,
+                            help='Numbers of claims, such as 100,1000')
+    run_parser.add_argument('--readers', type=_int_list,
+                            help='Numbers of readers')
+    run_parser.add_argument('--grants', type=_int_list,
+                            help='Numbers of claims per reader')
+    run_parser.add_argument('-k', '--filter',
+                            help='Only run benchmarks with this in the name')
+    run_parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of timed runs (default: 5)')
+    run_parser.add_argument('--no-memory', action='store_true',
+                            help='Skip the peak memory run')
+    run_parser.add_argument('-o', '--output',
+                            help='JSON file to write the results to. '
+                                 'By default, standard output.')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser(
+            'compare', help='Compare throughput of two runs')
+    compare_parser.add_argument('baseline', help='Results of the baseline')
+    compare_parser.add_argument('current', help='Results to check')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Relative drop of throughput that '
+                                     'fails the comparison (default: 0.1)')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Benchmarks of :py:mod:`claimchain.core`.
+"""
+
+from claimchain import core
+
+from .harness import benchmark
+
+
+@benchmark('core.encode_claim', params=('claims',))
+def encode_claim(workload):
+    claims = workload.claims
+    nonce = workload.nonce
+
+    def run():
+        for claim_label, claim_content in claims:
+            core.encode_claim(nonce, claim_label, claim_content)
+    return run, len(claims)
+
+
+@benchmark('core.encode_claim_batch', params=('claims',))
+def encode_claim_batch(workload):
+    claims = workload.claims
+    nonce = workload.nonce
+
+    def run():
+        core.encode_claim_batch(nonce, claims)
+    return run, len(claims)
+
+
+@benchmark('core.Codec.encode_claim', params=('claims',))
+def codec_encode_claim(workload):
+    codec = core.Codec(local_params=workload.owner_params)
+    claims = workload.claims
+    nonce = workload.nonce
+
+    def run():
+        for claim_label, claim_content in claims:
+            codec.encode_claim(nonce, claim_label, claim_content)
+    return run, len(claims)
+
+
+@benchmark('core.decode_claim', params=('claims',))
+def decode_claim(workload):
+    owner_vrf_pk = workload.owner_params.vrf.pk
+    nonce = workload.nonce
+    encoded = list(workload.encoded_claims.items())
+
+    def run():
+        for claim_label, (vrf_value, _, enc_claim) in encoded:
+            core.decode_claim(owner_vrf_pk, nonce, claim_label, vrf_value,
+                              enc_claim)
+    return run, len(encoded)
+
+
+@benchmark('core.Codec.decode_claim', params=('claims',))
+def codec_decode_claim(workload):
+    codec = core.Codec(local_params=workload.owner_params)
+    owner_vrf_pk = workload.owner_params.vrf.pk
+    nonce = workload.nonce
+    encoded = list(workload.encoded_claims.items())
+
+    def run():
+        for claim_label, (vrf_value, _, enc_claim) in encoded:
+            codec.decode_claim(owner_vrf_pk, nonce, claim_label, vrf_value,
+                               enc_claim)
+    return run, len(encoded)
+
+
+@benchmark('core.encode_capability', params=('claims', 'readers', 'grants'))
+def encode_capability(workload):
+    nonce = workload.nonce
+    grants = [(workload.reader_params[reader].dh.pk, claim_label,
+               workload.encoded_claims[claim_label][0])
+              for reader, claim_label in workload.grants]
+
+    def run():
+        for reader_dh_pk, claim_label, vrf_value in grants:
+            core.encode_capability(reader_dh_pk, nonce, claim_label,
+                                   vrf_value)
+    return run, len(grants)
+
+
+@benchmark('core.Codec.encode_capability',
+           params=('claims', 'readers', 'grants'))
+def codec_encode_capability(workload):
+    codec = core.Codec(local_params=workload.owner_params)
+    nonce = workload.nonce
+    grants = [(workload.reader_params[reader].dh.pk, claim_label,
+               workload.encoded_claims[claim_label][0])
+              for reader, claim_label in workload.grants]
+
+    def run():
+        for reader_dh_pk, claim_label, vrf_value in grants:
+            codec.encode_capability(reader_dh_pk, nonce, claim_label,
+                                    vrf_value)
+    return run, len(grants)
+
+
+@benchmark('core.CapabilityContext.encode',
+           params=('claims', 'readers', 'grants'))
+def capability_context_encode(workload):
+    nonce = workload.nonce
+    grants = [(workload.reader_params[reader].dh.pk,
+               [(claim_label, workload.encoded_claims[claim_label][0])
+                for claim_label in claim_labels])
+              for reader, claim_labels in workload.grants_by_reader]
+
+    def run():
+        for reader_dh_pk, reader_grants in grants:
+            context = core.CapabilityContext(reader_dh_pk, nonce)
+            for claim_label, vrf_value in reader_grants:
+                context.encode(claim_label, vrf_value)
+    return run, len(workload.grants)
+
+
+def _capabilities_by_reader(workload):
+    caps_by_reader = {}
+    for reader, claim_label, _, enc_cap in workload.encoded_capabilities:
+        caps_by_reader.setdefault(reader, []).append((claim_label, enc_cap))
+    return [(workload.reader_params[reader], caps)
+            for reader, caps in sorted(caps_by_reader.items())]
+
+
+@benchmark('core.get_capability_lookup_key',
+           params=('claims', 'readers', 'grants'))
+def get_capability_lookup_key(workload):
+    owner_dh_pk = workload.owner_params.dh.pk
+    nonce = workload.nonce
+    caps_by_reader = _capabilities_by_reader(workload)
+
+    def run():
+        for reader_params, caps in caps_by_reader:
+            with reader_params.as_default():
+                for claim_label, _ in caps:
+                    core.get_capability_lookup_key(
+                            owner_dh_pk, nonce, claim_label)
+    return run, len(workload.grants)
+
+
+@benchmark('core.decode_capability', params=('claims', 'readers', 'grants'))
+def decode_capability(workload):
+    owner_dh_pk = workload.owner_params.dh.pk
+    nonce = workload.nonce
+    caps_by_reader = _capabilities_by_reader(workload)
+
+    def run():
+        for reader_params, caps in caps_by_reader:
+            with reader_params.as_default():
+                for claim_label, enc_cap in caps:
+                    core.decode_capability(owner_dh_pk, nonce, claim_label,
+                                           enc_cap)
+    return run, len(workload.grants)
+
+
+@benchmark('core.Codec.decode_capability',
+           params=('claims', 'readers', 'grants'))
+def codec_decode_capability(workload):
+    owner_dh_pk = workload.owner_params.dh.pk
+    nonce = workload.nonce
+    caps_by_reader = [(core.Codec(local_params=reader_params), caps)
+                      for reader_params, caps
+                      in _capabilities_by_reader(workload)]
+
+    def run():
+        for codec, caps in caps_by_reader:
+            for claim_label, enc_cap in caps:
+                codec.decode_capability(owner_dh_pk, nonce, claim_label,
+                                        enc_cap)
+    return run, len(workload.grants)
+
+
+@benchmark('core.CapabilityContext.decode',
+           params=('claims', 'readers', 'grants'))
+def capability_context_decode(workload):
+    owner_dh_pk = workload.owner_params.dh.pk
+    nonce = workload.nonce
+    caps_by_reader = _capabilities_by_reader(workload)
+
+    def run():
+        for reader_params, caps in caps_by_reader:
+            with reader_params.as_default():
+                context = core.CapabilityContext(owner_dh_pk, nonce)
+                for claim_label, enc_cap in caps:
+                    context.lookup_key(claim_label)
+                    context.decode(claim_label, enc_cap)
+    return run, len(workload.grants)
@@ -0,0 +1,113 @@
+"""
+Benchmarks of :py:mod:`claimchain.crypto`.
+"""
+
+from claimchain import crypto
+
+from .harness import benchmark
+
+
+# Number of key generations per run
+_NUM_PARAMS = 20
+
+
+def _messages(workload):
+    return [claim_label for claim_label, _ in workload.claims]
+
+
+@benchmark('crypto.LocalParams.generate')
+def generate_params(workload):
+    def run():
+        for _ in range(_NUM_PARAMS):
+            crypto.LocalParams.generate()
+    return run, _NUM_PARAMS
+
+
+@benchmark('crypto.LocalParams.public_export', params=('readers',))
+def public_export(workload):
+    readers = workload.reader_params
+
+    def run():
+        for params in readers:
+            params.public_export(binary=True)
+    return run, len(readers)
+
+
+@benchmark('crypto.LocalParams.from_dict', params=('readers',))
+def from_dict(workload):
+    exported = [params.public_export(binary=True)
+                for params in workload.reader_params]
+
+    def run():
+        for params in exported:
+            crypto.LocalParams.from_dict(params, binary=True)
+    return run, len(exported)
+
+
+@benchmark('crypto.sign', params=('claims',))
+def sign(workload):
+    messages = _messages(workload)
+
+    def run():
+        for message in messages:
+            crypto.sign(message)
+    return run, len(messages)
+
+
+@benchmark('crypto.verify_signature', params=('claims',))
+def verify_signature(workload):
+    sig_pk = workload.owner_params.sig.pk
+    with workload.owner_params.as_default():
+        signed = [(crypto.sign(message), message)
+                  for message in _messages(workload)]
+
+    def run():
+        for sig, message in signed:
+            crypto.verify_signature(sig_pk, sig, message)
+    return run, len(signed)
+
+
+@benchmark('crypto.compute_vrf', params=('claims',))
+def compute_vrf(workload):
+    messages = _messages(workload)
+
+    def run():
+        for message in messages:
+            crypto.compute_vrf(message)
+    return run, len(messages)
+
+
+@benchmark('crypto.compute_vrf_batch', params=('claims',))
+def compute_vrf_batch(workload):
+    messages = _messages(workload)
+
+    def run():
+        crypto.compute_vrf_batch(messages)
+    return run, len(messages)
+
+
+def _vrfs(workload):
+    messages = _messages(workload)
+    with workload.owner_params.as_default():
+        return crypto.compute_vrf_batch(messages), messages
+
+
+@benchmark('crypto.verify_vrf', params=('claims',))
+def verify_vrf(workload):
+    pub = workload.owner_params.vrf.pk
+    vrfs, messages = _vrfs(workload)
+
+    def run():
+        for vrf, message in zip(vrfs, messages):
+            crypto.verify_vrf(pub, vrf, message)
+    return run, len(messages)
+
+
+@benchmark('crypto.verify_vrf_batch', params=('claims',))
+def verify_vrf_batch(workload):
+    pub = workload.owner_params.vrf.pk
+    vrfs, messages = _vrfs(workload)
+
+    def run():
+        crypto.verify_vrf_batch(pub, vrfs, messages)
+    return run, len(messages)
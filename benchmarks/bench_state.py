@@ -0,0 +1,225 @@
+"""
+Benchmarks of :py:mod:`claimchain.state`.
+"""
+
+import itertools
+
+import hippiehug
+
+from claimchain import State, View, ViewCache
+from claimchain.state import Payload
+from claimchain.utils import ObjectStore, verify_evidence_bundle
+
+from .harness import benchmark
+
+
+_STATE_PARAMS = ('claims', 'readers', 'grants')
+
+# Number of payloads built or parsed per run
+_NUM_PAYLOADS = 100
+
+# Number of blocks of the validated chain
+_NUM_BLOCKS = 20
+
+# Number of worker processes of parallel commits
+_NUM_WORKERS = 4
+
+
+def _num_entries(workload):
+    return workload.num_claims + len(workload.grants)
+
+
+@benchmark('state.State.commit', params=_STATE_PARAMS)
+def commit(workload):
+    state = workload.make_state()
+
+    def run():
+        state.commit(hippiehug.Chain(ObjectStore()))
+    return run, _num_entries(workload)
+
+
+@benchmark('state.State.commit[process_pool]', params=_STATE_PARAMS)
+def commit_process_pool(workload):
+    from concurrent.futures import ProcessPoolExecutor
+    state = workload.make_state()
+    executor = ProcessPoolExecutor(max_workers=_NUM_WORKERS)
+    # Start the workers, and import the params in them
+    state.commit(hippiehug.Chain(ObjectStore()), executor=executor)
+
+    def run():
+        state.commit(hippiehug.Chain(ObjectStore()), executor=executor)
+    return run, _num_entries(workload)
+
+
+@benchmark('state.State.commit[incremental]', params=_STATE_PARAMS)
+def commit_incremental(workload):
+    state = workload.make_state()
+    chain = hippiehug.Chain(ObjectStore())
+    state.commit(chain, incremental=True)
+    claim_label, _ = workload.claims[0]
+    contents = (b"incremental-content%d" % i for i in itertools.count())
+
+    def run():
+        # One claim is changed between commits
+        state[claim_label] = next(contents)
+        state.commit(chain, incremental=True)
+    return run, 1
+
+
+@benchmark('state.State.compute_evidence_bundle', params=_STATE_PARAMS)
+def compute_evidence_bundle(workload):
+    state, _ = workload.committed
+    pairs = [(workload.reader_params[reader].dh.pk, claim_label)
+             for reader, claim_label in workload.grants]
+
+    def run():
+        state.compute_evidence_bundle(pairs)
+    return run, len(pairs)
+
+
+@benchmark('state.State.compute_evidence_keys_bulk', params=_STATE_PARAMS)
+def compute_evidence_keys_bulk(workload):
+    state, _ = workload.committed
+    pairs = [(workload.reader_params[reader].dh.pk, claim_label)
+             for reader, claim_label in workload.grants]
+
+    def run():
+        state.compute_evidence_keys_bulk(pairs)
+    return run, len(pairs)
+
+
+@benchmark('utils.verify_evidence_bundle', params=_STATE_PARAMS)
+def verify_bundle(workload):
+    state, _ = workload.committed
+    pairs = [(workload.reader_params[reader].dh.pk, claim_label)
+             for reader, claim_label in workload.grants]
+    bundle = state.compute_evidence_bundle(pairs)
+    root_hash = state.tree.root_hash
+
+    def run():
+        verify_evidence_bundle(bundle, root_hash)
+    return run, len(pairs)
+
+
+@benchmark('state.View', params=_STATE_PARAMS)
+def view(workload):
+    _, chain = workload.committed
+
+    def run():
+        # A fresh cache, so that every view parses the head
+        for reader_params in workload.reader_params:
+            with reader_params.as_default():
+                View(chain, cache=ViewCache())
+    return run, workload.num_readers
+
+
+def _reader_views(workload):
+    _, chain = workload.committed
+    views = []
+    for reader, claim_labels in workload.grants_by_reader:
+        reader_params = workload.reader_params[reader]
+        with reader_params.as_default():
+            views.append((reader_params, View(chain), claim_labels))
+    return views
+
+
+@benchmark('state.View.__getitem__', params=_STATE_PARAMS)
+def view_getitem(workload):
+    views = _reader_views(workload)
+
+    def run():
+        for reader_params, view, claim_labels in views:
+            with reader_params.as_default():
+                for claim_label in claim_labels:
+                    view[claim_label]
+    return run, len(workload.grants)
+
+
+@benchmark('state.View.get_many', params=_STATE_PARAMS)
+def view_get_many(workload):
+    views = _reader_views(workload)
+
+    def run():
+        for reader_params, view, claim_labels in views:
+            with reader_params.as_default():
+                view.get_many(claim_labels)
+    return run, len(workload.grants)
+
+
+@benchmark('state.View.__getitem__[owner]', params=('claims',))
+def view_getitem_owner(workload):
+    _, chain = workload.committed
+    view = View(chain)
+    claim_labels = [claim_label for claim_label, _ in workload.claims]
+
+    def run():
+        for claim_label in claim_labels:
+            view[claim_label]
+    return run, len(claim_labels)
+
+
+@benchmark('state.View.__getitem__[owner_index]', params=('claims',))
+def view_getitem_owner_index(workload):
+    state, chain = workload.committed
+    view = View(chain, owner_index=state.owner_index)
+    claim_labels = [claim_label for claim_label, _ in workload.claims]
+
+    def run():
+        for claim_label in claim_labels:
+            view[claim_label]
+    return run, len(claim_labels)
+
+
+@benchmark('state.View.validate')
+def view_validate(workload):
+    state = State()
+    chain = hippiehug.Chain(ObjectStore())
+    for _ in range(_NUM_BLOCKS):
+        state.commit(chain)
+    view = View(chain)
+
+    def run():
+        view.validate()
+    return run, _NUM_BLOCKS
+
+
+@benchmark('state.Payload.build')
+def payload_build(workload):
+    tree = workload.tree
+    nonce = workload.nonce
+
+    def run():
+        for _ in range(_NUM_PAYLOADS):
+            Payload.build(tree, nonce).serialize()
+    return run, _NUM_PAYLOADS
+
+
+@benchmark('state.Payload.parse')
+def payload_parse(workload):
+    item = Payload.build(workload.tree, workload.nonce).serialize()
+
+    def run():
+        for _ in range(_NUM_PAYLOADS):
+            Payload.parse(item).decode_params()
+    return run, _NUM_PAYLOADS
+
+
+@benchmark('state.Payload.build[v1]')
+def payload_build_v1(workload):
+    tree = workload.tree
+    nonce = workload.nonce
+
+    def run():
+        for _ in range(_NUM_PAYLOADS):
+            Payload.build(tree, nonce, version=1).serialize()
+    return run, _NUM_PAYLOADS
+
+
+@benchmark('state.Payload.parse[v1]')
+def payload_parse_v1(workload):
+    item = Payload.build(workload.tree, workload.nonce, version=1).serialize()
+
+    def run():
+        for _ in range(_NUM_PAYLOADS):
+            Payload.parse(item).decode_params()
+    return run, _NUM_PAYLOADS
@@ -0,0 +1,113 @@
+"""
+Benchmarks of :py:mod:`claimchain.utils.wrappers`.
+"""
+
+from claimchain.utils import Blob, ObjectStore, Tree, check_evidence
+
+from .harness import benchmark
+
+
+_TREE_PARAMS = ('claims', 'readers', 'grants')
+
+# Number of keys changed by an incremental update
+_NUM_UPDATES = 10
+
+
+def _lookup_keys(workload):
+    return sorted(workload.tree_items)
+
+
+@benchmark('wrappers.Tree.from_items', params=_TREE_PARAMS)
+def tree_from_items(workload):
+    items = workload.tree_items
+
+    def run():
+        Tree.from_items(ObjectStore(), items)
+    return run, len(items)
+
+
+@benchmark('wrappers.Tree.update', params=_TREE_PARAMS)
+def tree_update(workload):
+    tree = workload.tree
+    changes = {lookup_key: Blob(b'changed')
+               for lookup_key in _lookup_keys(workload)[:_NUM_UPDATES]}
+
+    def run():
+        # Changes go into a copy, so that every run starts from the tree
+        # of the workload
+        Tree(tree.object_store, root_hash=tree.root_hash).update(changes)
+    return run, len(changes)
+
+
+@benchmark('wrappers.Tree.__getitem__', params=_TREE_PARAMS)
+def tree_getitem(workload):
+    tree = workload.tree
+    lookup_keys = _lookup_keys(workload)
+
+    def run():
+        for lookup_key in lookup_keys:
+            tree[lookup_key]
+    return run, len(lookup_keys)
+
+
+@benchmark('wrappers.Tree.get_many', params=_TREE_PARAMS)
+def tree_get_many(workload):
+    tree = workload.tree
+    lookup_keys = _lookup_keys(workload)
+
+    def run():
+        tree.get_many(lookup_keys)
+    return run, len(lookup_keys)
+
+
+@benchmark('wrappers.Tree.evidence', params=_TREE_PARAMS)
+def tree_evidence(workload):
+    tree = workload.tree
+    lookup_keys = _lookup_keys(workload)
+
+    def run():
+        for lookup_key in lookup_keys:
+            tree.evidence(lookup_key)
+    return run, len(lookup_keys)
+
+
+@benchmark('wrappers.Tree.evidence_many', params=_TREE_PARAMS)
+def tree_evidence_many(workload):
+    tree = workload.tree
+    lookup_keys = _lookup_keys(workload)
+
+    def run():
+        tree.evidence_many(lookup_keys)
+    return run, len(lookup_keys)
+
+
+@benchmark('wrappers.check_evidence', params=_TREE_PARAMS)
+def tree_check_evidence(workload):
+    tree = workload.tree
+    evidence = [(lookup_key,) + tuple(tree.evidence(lookup_key))
+                for lookup_key in _lookup_keys(workload)]
+
+    def run():
+        for lookup_key, root_hash, nodes in evidence:
+            check_evidence(root_hash, nodes, lookup_key)
+    return run, len(evidence)
+
+
+@benchmark('wrappers.ObjectStore.__getitem__', params=_TREE_PARAMS)
+def object_store_getitem(workload):
+    store = workload.tree.object_store
+    lookup_keys = list(store.keys())
+
+    def run():
+        for lookup_key in lookup_keys:
+            store[lookup_key]
+    return run, len(lookup_keys)
+
+
+@benchmark('wrappers.ObjectStore.update', params=_TREE_PARAMS)
+def object_store_update(workload):
+    items = list(workload.tree.object_store.items())
+
+    def run():
+        ObjectStore().update(items)
+    return run, len(items)
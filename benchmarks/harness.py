@@ -0,0 +1,380 @@
+"""
+Registry, workloads, timing and comparison of benchmarks.
+
+A benchmark is a setup function registered with :py:func:`benchmark`.
+It gets a :py:class:`Workload` and returns a function that runs the
+measured code once, and the number of operations done in a run:
+
+    @benchmark('core.encode_claim', params=('claims',))
+    def encode_claim(workload):
+        def run():
+            for claim_label, claim_content in workload.claims:
+                core.encode_claim(workload.nonce, claim_label, claim_content)
+        return run, len(workload.claims)
+
+Runs are done with the owner's params as defaults. Every run has to
+leave the workload as it found it, so that it can be repeated.
+"""
+
+from __future__ import division
+
+import gc
+import os
+import time
+import random
+import platform
+import importlib
+import itertools
+import subprocess
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import hippiehug
+
+from claimchain import State, LocalParams, PublicParams
+from claimchain.core import encode_claim_batch, CapabilityContext
+from claimchain.utils import Blob, ObjectStore, Tree, cached_property
+
+
+RESULTS_FORMAT = 1
+
+BENCHMARK_MODULES = ['bench_core', 'bench_crypto', 'bench_wrappers',
+                     'bench_state']
+
+# Sizes of the old end-to-end timings: 200 friends, 5 claims each
+DEFAULT_CONFIG = {
+    'claims': [200],
+    'readers': [200],
+    'grants': [5],
+}
+
+WORKLOAD_PARAMS = ('claims', 'readers', 'grants')
+
+_benchmarks = []
+
+
+class Benchmark(object):
+    def __init__(self, name, setup, params):
+        self.name = name
+        self.setup = setup
+        self.params = params
+
+
+def benchmark(name, params=()):
+    """Register a benchmark setup function.
+
+    :param str name: Name of the benchmark, such as the benchmarked
+            function
+    :param tuple params: Workload parameters the benchmark depends on.
+            The benchmark runs once per distinct combination of them.
+    """
+    unknown = set(params) - set(WORKLOAD_PARAMS)
+    if unknown:
+        raise ValueError('Unknown workload parameters: %s' %
+                         ', '.join(sorted(unknown)))
+
+    def register(setup):
+        _benchmarks.append(Benchmark(name, setup, tuple(params)))
+        return setup
+    return register
+
+
+def load_benchmarks():
+    """Import the benchmark modules, and return registered benchmarks."""
+    for module_name in BENCHMARK_MODULES:
+        importlib.import_module('benchmarks.' + module_name)
+    return list(_benchmarks)
+
+
+def _label(i):
+    return b'friend-%d@example.com' % i
+
+
+class Workload(object):
+    """
+    Synthetic data of an owner with claims and readers.
+
+    Every reader has access to ``grants`` claims, picked at random. The
+    data is generated from a fixed seed, and only when first used.
+
+    :param int claims: Number of claims
+    :param int readers: Number of readers
+    :param int grants: Number of claims every reader can access
+    :param int seed: Seed of the random choices
+    """
+    def __init__(self, claims, readers, grants, seed=0):
+        self.num_claims = claims
+        self.num_readers = readers
+        self.num_grants = min(grants, claims)
+        self._random = random.Random(seed)
+
+    @cached_property
+    def owner_params(self):
+        return LocalParams.generate()
+
+    @cached_property
+    def reader_params(self):
+        return [LocalParams.generate() for _ in range(self.num_readers)]
+
+    @cached_property
+    def nonce(self):
+        return os.urandom(PublicParams.get_default().nonce_size)
+
+    @cached_property
+    def claims(self):
+        """List of ``(claim_label, claim_content)`` pairs."""
+        return [(_label(i), os.urandom(32)) for i in range(self.num_claims)]
+
+    @cached_property
+    def grants(self):
+        """List of ``(reader_index, claim_label)`` pairs."""
+        labels = [claim_label for claim_label, _ in self.claims]
+        return [(reader, claim_label)
+                for reader in range(self.num_readers)
+                for claim_label in self._random.sample(labels,
+                                                       self.num_grants)]
+
+    @cached_property
+    def grants_by_reader(self):
+        grants_by_reader = {}
+        for reader, claim_label in self.grants:
+            grants_by_reader.setdefault(reader, []).append(claim_label)
+        return sorted(grants_by_reader.items())
+
+    @cached_property
+    def encoded_claims(self):
+        """Dictionary mapping claim labels to ``(vrf_value, lookup_key,
+        enc_claim)`` tuples."""
+        with self.owner_params.as_default():
+            encoded = encode_claim_batch(self.nonce, self.claims)
+        return {claim_label: enc for (claim_label, _), enc
+                in zip(self.claims, encoded)}
+
+    @cached_property
+    def encoded_capabilities(self):
+        """List of ``(reader_index, claim_label, lookup_key, enc_cap)``."""
+        encoded = []
+        with self.owner_params.as_default():
+            for reader, claim_labels in self.grants_by_reader:
+                context = CapabilityContext(
+                        self.reader_params[reader].dh.pk, self.nonce)
+                for claim_label in claim_labels:
+                    vrf_value = self.encoded_claims[claim_label][0]
+                    lookup_key, enc_cap = context.encode(
+                            claim_label, vrf_value)
+                    encoded.append((reader, claim_label, lookup_key, enc_cap))
+        return encoded
+
+    @cached_property
+    def tree_items(self):
+        """Dictionary of encoded claims and capabilities, as in the tree
+        of a commit."""
+        items = {lookup_key: Blob(enc_claim) for _, lookup_key, enc_claim
+                 in self.encoded_claims.values()}
+        items.update((lookup_key, Blob(enc_cap)) for _, _, lookup_key, enc_cap
+                     in self.encoded_capabilities)
+        return items
+
+    @cached_property
+    def tree(self):
+        return Tree.from_items(ObjectStore(), self.tree_items)
+
+    def make_state(self):
+        """Owner state with all claims and grants, not committed."""
+        state = State()
+        for claim_label, claim_content in self.claims:
+            state[claim_label] = claim_content
+        for reader, claim_labels in self.grants_by_reader:
+            state.grant_access(self.reader_params[reader].dh.pk, claim_labels)
+        return state
+
+    @cached_property
+    def committed(self):
+        """Committed owner state, and the chain it is committed to."""
+        state = self.make_state()
+        chain = hippiehug.Chain(ObjectStore())
+        with self.owner_params.as_default():
+            state.commit(chain)
+        return state, chain
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def _measure(run, repeat):
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = default_timer()
+            run()
+            times.append(default_timer() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return times
+
+
+def _peak_memory(run):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def _configs(config):
+    names = sorted(config)
+    for values in itertools.product(*[config[name] for name in names]):
+        yield dict(zip(names, values))
+
+
+def _git_revision():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            revision = subprocess.check_output(
+                    ['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                    cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision.decode('ascii').strip()
+
+
+def run_benchmarks(config=None, pattern=None, repeat=5, memory=True,
+                   log=None):
+    """Run the registered benchmarks.
+
+    Every benchmark runs once per distinct combination of the values of
+    the parameters it depends on. Workloads are shared between the
+    benchmarks.
+
+    :param dict config: Lists of values of the workload parameters. By
+            default, :py:data:`DEFAULT_CONFIG`.
+    :param str pattern: Only run benchmarks with this in their name
+    :param int repeat: Number of timed runs
+    :param bool memory: Measure peak memory in an extra run. Requires
+            ``tracemalloc``, otherwise the peak is ``None``.
+    :param log: Function to report progress to, such as ``print``
+    :return: JSON-serializable results
+    """
+    full_config = dict(DEFAULT_CONFIG)
+    full_config.update(config or {})
+    benchmarks = [bench for bench in load_benchmarks()
+                  if pattern is None or pattern in bench.name]
+
+    workloads = {}
+    results = []
+    for bench in benchmarks:
+        done = set()
+        for params in _configs(full_config):
+            bench_params = tuple((name, params[name])
+                                 for name in bench.params)
+            if bench_params in done:
+                continue
+            done.add(bench_params)
+            workload_key = tuple(sorted(params.items()))
+            workload = workloads.get(workload_key)
+            if workload is None:
+                workload = workloads[workload_key] = Workload(**params)
+
+            with workload.owner_params.as_default():
+                run, ops = bench.setup(workload)
+                # Warm-up run, which also fills lazy caches
+                run()
+                times = _measure(run, repeat)
+                peak = _peak_memory(run) if memory else None
+
+            best = min(times)
+            result = {
+                'name': bench.name,
+                'params': dict(bench_params),
+                'ops': ops,
+                'times': times,
+                'min_s': best,
+                'median_s': _median(times),
+                'ops_per_sec': ops / best if best > 0 else None,
+                'peak_memory_bytes': peak,
+            }
+            results.append(result)
+            if log is not None:
+                log(format_result(result))
+
+    return {
+        'format': RESULTS_FORMAT,
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'revision': _git_revision(),
+            'repeat': repeat,
+            'config': full_config,
+        },
+        'results': results,
+    }
+
+
+def _format_params(params):
+    return ','.join('%s=%s' % item for item in sorted(params.items()))
+
+
+def format_result(result):
+    peak = result['peak_memory_bytes']
+    return '%-45s %-30s %12.1f ops/s %10s' % (
+            result['name'], _format_params(result['params']),
+            result['ops_per_sec'] or 0,
+            '-' if peak is None else '%.1f KiB' % (peak / 2 ** 10))
+
+
+def _result_key(result):
+    return result['name'], tuple(sorted(result['params'].items()))
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """Compare throughput of two runs.
+
+    :param dict baseline: Results of :py:func:`run_benchmarks`
+    :param dict current: Results of :py:func:`run_benchmarks`
+    :param float threshold: Relative drop of throughput that counts as
+            a regression
+    :return: List of ``(name, params, baseline_ops_per_sec,
+             current_ops_per_sec, change, regressed)`` tuples, for the
+             benchmarks in both runs
+    """
+    baseline_results = {_result_key(result): result
+                        for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        old = baseline_results.get(_result_key(result))
+        if old is None or not old['ops_per_sec'] \
+                or not result['ops_per_sec']:
+            continue
+        change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        rows.append((result['name'], result['params'], old['ops_per_sec'],
+                     result['ops_per_sec'], change, change < -threshold))
+    return rows
+
+
+def format_comparison(rows):
+    lines = []
+    for name, params, old, new, change, regressed in rows:
+        lines.append('%-45s %-30s %12.1f -> %12.1f ops/s %+7.1f%%%s' % (
+                name, _format_params(params), old, new, change * 100,
+                '  REGRESSION' if regressed else ''))
+    return '\n'.join(lines)
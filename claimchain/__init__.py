@@ -1,2 +1,3 @@
-from .state import State, View
+from .state import State, View, ViewCache, OwnerIndex
+from .history import ChainIndex
 from .crypto import LocalParams, PublicParams
@@ -0,0 +1,387 @@
+"""
+Asyncio interface for chains and trees kept in remote storage.
+
+Requires Python 3.5 or later. It is not imported by :py:mod:`claimchain`.
+
+:py:class:`AsyncObjectStore` wraps a backend that is either
+asynchronous, with coroutine methods ``get_many(lookup_keys)``, which
+returns the values in order with ``None`` for the missing ones, and
+``update(items)``, or an ordinary dictionary-like store.
+
+Cryptography runs in an executor, with the caller's default parameters,
+so that the event loop only waits for storage.
+"""
+
+import asyncio
+import threading
+import weakref
+
+from hippiehug import Chain
+
+from .crypto import PublicParams, LocalParams
+from .state import view_cache, _ChainHead
+from .state import _own_claim_keys, _capability_lookup_keys
+from .state import _open_capabilities, _open_claims
+from .utils import ensure_binary
+from .utils.wrappers import _descend, _VerifyingStore, VERIFY_ALWAYS
+
+
+try:
+    _get_running_loop = asyncio.get_running_loop
+except AttributeError:
+    # Python < 3.7, where the event loop of a running coroutine is the
+    # one of its thread
+    _get_running_loop = asyncio.get_event_loop
+
+
+class AsyncObjectStore(_VerifyingStore):
+    """
+    Asynchronous object store.
+
+    Values are checked against their lookup keys according to the
+    verification policy, like in :py:class:`utils.ObjectStore`.
+
+    :param backend: Asynchronous or dictionary-like backend
+    :param str verify: Verification policy
+    :param executor: Executor to access a dictionary-like backend in.
+            If ``None``, it is accessed directly from the event loop,
+            which is only fine for in-memory backends.
+    """
+    def __init__(self, backend=None, verify=VERIFY_ALWAYS, executor=None):
+        self._set_verify(verify)
+        self._backend = backend if backend is not None else {}
+        self._verified = set()
+        self._executor = executor
+        self._is_async = asyncio.iscoroutinefunction(
+                getattr(self._backend, 'get_many', None))
+        # Blocking stores are kept per loop, so that a state committing
+        # to the store keeps seeing the same tree store
+        self._blocking_stores = weakref.WeakKeyDictionary()
+
+    def _get_many_sync(self, lookup_keys):
+        values = []
+        for lookup_key in lookup_keys:
+            try:
+                values.append(self._backend[lookup_key])
+            except KeyError:
+                values.append(None)
+        return values
+
+    def _update_sync(self, items):
+        if hasattr(self._backend, 'update'):
+            self._backend.update(items)
+        else:
+            for lookup_key, value in items:
+                self._backend[lookup_key] = value
+
+    async def _call(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        loop = _get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def get_many(self, lookup_keys):
+        """Get values of many lookup keys in one request to the backend.
+
+        :param lookup_keys: Iterable of lookup keys
+        :return: Dictionary mapping the keys that are in the store to
+                 their values
+        """
+        lookup_keys = list(lookup_keys)
+        if not lookup_keys:
+            return {}
+        if self._is_async:
+            values = await self._backend.get_many(lookup_keys)
+        else:
+            values = await self._call(self._get_many_sync, lookup_keys)
+        result = {}
+        for lookup_key, value in zip(lookup_keys, values):
+            if value is not None:
+                self._check_read(lookup_key, value)
+                result[lookup_key] = value
+        return result
+
+    async def get(self, lookup_key):
+        """Get value of a lookup key.
+
+        :raises: ``KeyError`` if the key is not in the store
+        """
+        values = await self.get_many([lookup_key])
+        return values[lookup_key]
+
+    async def update(self, items):
+        """Add many values in one request to the backend.
+
+        :param items: Iterable of ``(lookup_key, value)`` pairs
+        """
+        items = list(items)
+        self._check_writes(items)
+        if not items:
+            return
+        if self._is_async:
+            await self._backend.update(items)
+        else:
+            await self._call(self._update_sync, items)
+        self._mark_written(lookup_key for lookup_key, _ in items)
+
+    def _blocking(self, loop):
+        blocking_store = self._blocking_stores.get(loop)
+        if blocking_store is None:
+            blocking_store = _BlockingStore(self, loop)
+            self._blocking_stores[loop] = blocking_store
+        return blocking_store
+
+
+class _BlockingStore(object):
+    """
+    Synchronous store for use outside of the event loop thread.
+
+    Reads wait for the asynchronous store. Writes are buffered until
+    :py:meth:`flush`, so that they reach the backend in one batch.
+
+    Commits running concurrently on the same loop share the store, so the
+    buffer is accessed under a lock.
+    """
+    def __init__(self, async_store, loop):
+        self._async_store = async_store
+        # The store is cached by loop, so it must not keep the loop alive
+        self._loop_ref = weakref.ref(loop)
+        # Created from within the loop
+        self._loop_thread = threading.current_thread()
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def _wait(self, coro):
+        if threading.current_thread() is self._loop_thread:
+            raise RuntimeError('Can not block the event loop. '
+                               'Use the asynchronous interface.')
+        loop = self._loop_ref()
+        if loop is None:
+            raise RuntimeError('The event loop of the store is gone.')
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def __getitem__(self, lookup_key):
+        with self._lock:
+            value = self._pending.get(lookup_key)
+        if value is None:
+            value = self._wait(self._async_store.get(lookup_key))
+        return value
+
+    def get(self, lookup_key):
+        try:
+            return self[lookup_key]
+        except KeyError:
+            return None
+
+    def __contains__(self, lookup_key):
+        return self.get(lookup_key) is not None
+
+    def __setitem__(self, lookup_key, value):
+        self.update([(lookup_key, value)])
+
+    def update(self, items):
+        items = list(items)
+        with self._lock:
+            self._pending.update(items)
+
+    async def flush(self):
+        with self._lock:
+            items = list(self._pending.items())
+        await self._async_store.update(items)
+        with self._lock:
+            for lookup_key, value in items:
+                if self._pending.get(lookup_key) is value:
+                    del self._pending[lookup_key]
+
+
+async def _run_with_params(executor, func, *args):
+    """Run ``func`` in the executor with the caller's default params."""
+    pp = PublicParams.get_default()
+    params = LocalParams.get_default()
+
+    def call():
+        # The global default public params do not have ``as_default``
+        with PublicParams.set_default(pp), LocalParams.set_default(params):
+            return func(*args)
+
+    return await _get_running_loop().run_in_executor(executor, call)
+
+
+class AsyncTree(object):
+    """
+    Read-only asynchronous tree.
+
+    Lookups walk the tree level by level, fetching every level of the
+    paths to all keys in one request to the store.
+
+    :param AsyncObjectStore object_store: Store holding the tree
+    :param bytes root_hash: Root hash
+    """
+    def __init__(self, object_store, root_hash):
+        self.object_store = object_store
+        self.root_hash = root_hash
+
+    async def evidence_many(self, lookup_keys):
+        """Gather evidence for many lookup keys.
+
+        Same as :py:meth:`utils.Tree.evidence_many`.
+        """
+        lookup_keys = sorted({ensure_binary(key) for key in lookup_keys})
+        if self.root_hash is None or not lookup_keys:
+            return self.root_hash, [], {}
+
+        nodes = []
+        leaves = {}
+        level = [(self.root_hash, 0, len(lookup_keys))]
+        while level:
+            fetched = await self.object_store.get_many(
+                    {node_hash for node_hash, _, _ in level})
+            next_level = []
+            for node_hash, start, end in level:
+                node = fetched[node_hash]
+                nodes.append(node)
+                next_level.extend(
+                        _descend(node, lookup_keys, start, end, leaves))
+            level = next_level
+        return self.root_hash, nodes, leaves
+
+    async def get_many(self, lookup_keys):
+        """Get values of many lookup keys.
+
+        :return: Dictionary mapping the keys that are in the tree to
+                 their values
+        """
+        _, _, leaves = await self.evidence_many(lookup_keys)
+        found = {key: leaf.item for key, leaf in leaves.items()
+                 if leaf.key == key}
+        values = await self.object_store.get_many(set(found.values()))
+        return {key: values[item_hash] for key, item_hash in found.items()}
+
+
+class AsyncView(object):
+    """
+    Asynchronous view of a chain in an :py:class:`AsyncObjectStore`.
+
+    Create views with :py:meth:`load`.
+    """
+    def __init__(self, chain_head, store, executor=None):
+        self._viewer_params = LocalParams.get_default()
+        self._chain_head = chain_head
+        self._executor = executor
+        self.store = store
+        self.tree = None
+        if chain_head.mtr_hash is not None:
+            self.tree = AsyncTree(store, chain_head.mtr_hash)
+
+    @staticmethod
+    async def load(store, head, executor=None, cache=None):
+        """Load view of the chain with a given head.
+
+        :param AsyncObjectStore store: Store holding the chain and the tree
+        :param bytes head: Chain's head
+        :param executor: Executor for cryptographic operations. By
+                default, the default executor of the event loop.
+        :param ViewCache cache: Cache of parsed heads. By default, the
+                process-wide :py:data:`claimchain.state.view_cache`.
+        """
+        if cache is None:
+            cache = view_cache
+        chain_head = cache._lookup(store, head)
+        if chain_head is None:
+            block = await store.get(head)
+            chain_head = _ChainHead(head, block)
+            cache._insert(store, chain_head)
+        return AsyncView(chain_head, store, executor=executor)
+
+    @property
+    def head(self):
+        """Chain's head (latest block hash)."""
+        return self._chain_head.head
+
+    @property
+    def payload(self):
+        """Chain's latest block payload."""
+        return self._chain_head.payload
+
+    async def _run(self, func, *args):
+        return await _run_with_params(self._executor, func, *args)
+
+    async def get_many(self, claim_labels):
+        """Get many claims by label.
+
+        See :py:meth:`claimchain.View.get_many`.
+        """
+        claim_labels = list(claim_labels)
+        if self.tree is None:
+            error = ValueError("The chain does not have a claim map.")
+            return {claim_label: error for claim_label in claim_labels}
+
+        chain_head = self._chain_head
+        nonce = chain_head.nonce
+        # Importing the owner's params is parsing work as well
+        params = await self._run(lambda: chain_head.params)
+
+        results = {}
+        is_owner = self._viewer_params.vrf.pk == params.vrf.pk
+        if is_owner:
+            claim_keys = await self._run(
+                    _own_claim_keys, nonce, claim_labels)
+        else:
+            context, cap_lookup_keys = await self._run(
+                    _capability_lookup_keys, params.dh.pk, nonce,
+                    claim_labels)
+            caps = await self.tree.get_many(cap_lookup_keys.values())
+            claim_keys = await self._run(
+                    _open_capabilities, context, cap_lookup_keys, caps,
+                    results)
+        enc_claims = await self.tree.get_many(
+                claim_lookup_key for _, claim_lookup_key in claim_keys.values())
+        await self._run(_open_claims, params.vrf.pk, nonce, claim_keys,
+                        enc_claims, results, not is_owner)
+        return results
+
+    async def lookup(self, claim_label):
+        """Get claim by label.
+
+        :raises: ``KeyError`` if claim not found or not accessible
+        """
+        result = (await self.get_many([claim_label]))[claim_label]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def get(self, claim_label):
+        """Get claim by label.
+
+        :return: Claim or ``None`` if not found or not accessible.
+        """
+        try:
+            return await self.lookup(claim_label)
+        except (KeyError, ValueError):
+            return None
+
+
+async def commit_async(state, target_chain, tree_store=None, nonce=None,
+                       incremental=False, executor=None,
+                       thread_executor=None):
+    """Commit state to a chain in an :py:class:`AsyncObjectStore`.
+
+    See :py:meth:`claimchain.State.commit_async`.
+    """
+    loop = _get_running_loop()
+    chain_store = target_chain.store._blocking(loop)
+    if tree_store is None:
+        tree_store = chain_store
+    else:
+        tree_store = tree_store._blocking(loop)
+
+    chain = Chain(chain_store, root_hash=target_chain.head)
+    head = await _run_with_params(
+            thread_executor, lambda: state.commit(
+                    chain, tree_store=tree_store, nonce=nonce,
+                    incremental=incremental, executor=executor))
+    await tree_store.flush()
+    if chain_store is not tree_store:
+        await chain_store.flush()
+    target_chain.head = head
+    return head
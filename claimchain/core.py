@@ -2,37 +2,29 @@
 Low-level operations for encoding and decoding claims and capabilities.
 """
 
+import os
+
 from petlib.ec import EcGroup, EcPt
 from petlib.bn import Bn
 from petlib.pack import encode, decode
 from profiled import profiled
 
-from .crypto import compute_vrf, verify_vrf, VrfContainer
+from .crypto import VrfContainer
 from .crypto import PublicParams, LocalParams
-from .utils import ensure_binary
-
+from .crypto.vrf import _compute_vrfs, _compute_vrf_value, _verify_vrfs
+from .crypto.vrf import compute_vrf_batch
+from .instrumentation import counts_bytes
+from .utils import cached_property, ensure_binary, LRUCache
 
-def _compute_claim_key(vrf_value, mode='enc'):
-    if mode not in ['enc', 'lookup']:
-        raise ValueError('Invalid mode')
-    pp = PublicParams.get_default()
-    size = pp.enc_key_size if mode == 'enc' else pp.lookup_key_size
-    mode = ensure_binary(mode)
-    return pp.hash_func(b"clm_%s|%s" % (mode, vrf_value)).digest()[:size]
 
+#: Hashes of DH shared secrets, keyed by the exported own and peer DH
+#: public keys. Inspect ``shared_secret_cache.stats()`` for hit rates.
+shared_secret_cache = LRUCache(maxsize=4096)
 
-def _compute_capability_key(nonce, shared_secret, claim_label, mode='enc'):
-    if mode not in ['enc', 'lookup']:
-        ValueError('Invalid mode')
-    pp = PublicParams.get_default()
-    size = pp.enc_key_size if mode == 'enc' else pp.lookup_key_size
-    shared_secret_hash = pp.hash_func(shared_secret.export()).digest()
-    nonce = ensure_binary(nonce)
-    claim_label = ensure_binary(claim_label)
-    mode = ensure_binary(mode)
-    return pp.hash_func(b"cap_%s|%s|%s|%s" %
-            (mode, nonce, shared_secret_hash, claim_label)) \
-            .digest()[:size]
+# Size of the random IVs of claims. A claim is encrypted under a key
+# that only depends on the nonce and the label, so the IV is what makes
+# encryptions of a changed claim under the same nonce differ.
+_CLAIM_IV_SIZE = 12
 
 
 def _salt_label(nonce, claim_label):
@@ -47,25 +39,321 @@ def _fix_bytes(tag):
     return bytes(_FFI.buffer(tag)[:])
 
 
+class Codec(object):
+    """Claim and capability operations with bound parameters.
+
+    The module-level functions look up the default public and local
+    parameters on every call, and are wrappers around a codec of the
+    current defaults. A codec binds the parameters once, together with
+    the values derived from the public parameters, such as the cipher,
+    the key sizes, and the encoded group generator. Use it directly in
+    loops over many claims or capabilities.
+
+    The keys are read from the local parameters on every use, so a
+    codec stays valid when they are replaced.
+
+    :param PublicParams public_params: Public parameters. Default ones
+            if not given
+    :param LocalParams local_params: Local parameters. Default ones if
+            not given
+
+    >>> params = LocalParams.generate()
+    >>> codec = Codec(PublicParams(), params)
+    >>> vrf_value, _, enc_claim = codec.encode_claim(
+    ...         b"nonce", b"label", b"content")
+    >>> codec.decode_claim(params.vrf.pk, b"nonce", b"label",
+    ...                    vrf_value, enc_claim)
+    b'content'
+    """
+    def __init__(self, public_params=None, local_params=None):
+        if public_params is None:
+            public_params = PublicParams.get_default()
+        if local_params is None:
+            local_params = LocalParams.get_default()
+        self.public_params = public_params
+        self.local_params = local_params
+
+        self._hash_func = public_params.hash_func
+        self._enc_cipher = public_params.enc_cipher
+        self._enc_key_size = public_params.enc_key_size
+        self._lookup_key_size = public_params.lookup_key_size
+        self._iv = b"\x00" * public_params.enc_key_size
+        self._dh_pk = None
+        self._exported_dh_pk = None
+
+    @cached_property
+    def _encoded_g(self):
+        return encode(self.public_params.ec_group.generator())
+
+    def compute_claim_key(self, vrf_value, mode='enc'):
+        """Compute claim encryption or lookup key.
+
+        :param bytes vrf_value: Exported VRF value (hash)
+        :param str mode: ``'enc'`` or ``'lookup'``
+        """
+        if mode == 'enc':
+            h = self._hash_func(b"clm_enc|" + vrf_value)
+            return h.digest()[:self._enc_key_size]
+        if mode == 'lookup':
+            h = self._hash_func(b"clm_lookup|" + vrf_value)
+            return h.digest()[:self._lookup_key_size]
+        raise ValueError('Invalid mode')
+
+    def compute_shared_secret_hash(self, peer_dh_pk):
+        """Compute hash of the DH shared secret with a peer.
+
+        :param petlib.EcPt peer_dh_pk: DH public key of the other party
+        """
+        params = self.local_params
+        if params.dh.pk is None:
+            shared_secret = params.dh.sk * peer_dh_pk
+            return self._hash_func(shared_secret.export()).digest()
+
+        if params.dh.pk is not self._dh_pk:
+            self._exported_dh_pk = params.dh.pk.export()
+            self._dh_pk = params.dh.pk
+        cache_key = (self._exported_dh_pk, peer_dh_pk.export())
+        shared_secret_hash = shared_secret_cache.get(cache_key)
+        if shared_secret_hash is None:
+            shared_secret = params.dh.sk * peer_dh_pk
+            shared_secret_hash = self._hash_func(
+                    shared_secret.export()).digest()
+            shared_secret_cache[cache_key] = shared_secret_hash
+        return shared_secret_hash
+
+    def capability_context(self, peer_dh_pk, nonce):
+        """Create a :py:class:`CapabilityContext` bound to this codec.
+
+        :param petlib.EcPt peer_dh_pk: DH public key of the other party
+        :param bytes nonce: Nonce
+        """
+        return CapabilityContext(peer_dh_pk, nonce, codec=self)
+
+    def compute_vrf_value(self, message):
+        """Compute VRF value without a proof.
+
+        See :py:func:`claimchain.crypto.vrf.compute_vrf_value`.
+
+        :param bytes message: Message
+        """
+        return _compute_vrf_value(
+                self.public_params, self.local_params.vrf, message)
+
+    def _encrypt_claim(self, vrf, claim_content):
+        lookup_key = self.compute_claim_key(vrf.value, mode='lookup')
+        enc_key = self.compute_claim_key(vrf.value, mode='enc')
+
+        claim = encode([vrf.proof, claim_content])
+        iv = os.urandom(_CLAIM_IV_SIZE)
+        enc_body, tag = self._enc_cipher.quick_gcm_enc(enc_key, iv, claim)
+        tag = _fix_bytes(tag)
+
+        enc_claim = encode([enc_body, tag, iv])
+        return (vrf.value, lookup_key, enc_claim)
+
+    def _decrypt_claim(self, vrf_value, encrypted_claim):
+        fields = decode(encrypted_claim)
+        encrypted_body, tag = fields[:2]
+        # Claims encoded before random IVs were introduced have none
+        iv = fields[2] if len(fields) > 2 else self._iv
+        enc_key = self.compute_claim_key(vrf_value, mode='enc')
+        raw_body = self._enc_cipher.quick_gcm_dec(
+                enc_key, iv, encrypted_body, tag)
+        (proof, claim_content) = decode(raw_body)
+        return VrfContainer(value=vrf_value, proof=proof), claim_content
+
+    def encode_claim(self, nonce, claim_label, claim_content):
+        """Encode claim.
+
+        See :py:func:`encode_claim`.
+        """
+        nonce = ensure_binary(nonce)
+        claim_label = ensure_binary(claim_label)
+        claim_content = ensure_binary(claim_content)
+
+        salted_label = _salt_label(nonce, claim_label)
+        vrf, = _compute_vrfs(self.public_params, self.local_params.vrf,
+                             [salted_label], encoded_g=self._encoded_g)
+        return self._encrypt_claim(vrf, claim_content)
+
+    def encode_claim_batch(self, nonce, claims):
+        """Encode many claims.
+
+        See :py:func:`encode_claim_batch`.
+        """
+        nonce = ensure_binary(nonce)
+        salted_labels = [_salt_label(nonce, claim_label)
+                         for claim_label, _ in claims]
+        vrfs = compute_vrf_batch(salted_labels, pp=self.public_params,
+                                 vrf_keypair=self.local_params.vrf,
+                                 encoded_g=self._encoded_g)
+        return [self._encrypt_claim(vrf, ensure_binary(claim_content))
+                for vrf, (_, claim_content) in zip(vrfs, claims)]
+
+    def decode_claim(self, owner_vrf_pk, nonce, claim_label, vrf_value,
+                     encrypted_claim):
+        """Decode claim.
+
+        See :py:func:`decode_claim`.
+        """
+        claim_label = ensure_binary(claim_label)
+
+        salted_label = _salt_label(nonce, claim_label)
+        vrf, claim_content = self._decrypt_claim(vrf_value, encrypted_claim)
+        valid, = _verify_vrfs(self.public_params, owner_vrf_pk, [vrf],
+                              [salted_label], encoded_g=self._encoded_g)
+        if not valid:
+            raise Exception("Wrong VRF value")
+
+        return claim_content
+
+    def get_capability_lookup_key(self, owner_dh_pk, nonce, claim_label):
+        """Compute capability lookup key.
+
+        See :py:func:`get_capability_lookup_key`.
+        """
+        return self.capability_context(owner_dh_pk, nonce).lookup_key(
+                claim_label)
+
+    def encode_capability(self, reader_dh_pk, nonce, claim_label,
+                          vrf_value):
+        """Encode capability.
+
+        See :py:func:`encode_capability`.
+        """
+        return self.capability_context(reader_dh_pk, nonce).encode(
+                claim_label, vrf_value)
+
+    def decode_capability(self, owner_dh_pk, nonce, claim_label,
+                          encrypted_capability):
+        """Decode capability.
+
+        See :py:func:`decode_capability`.
+        """
+        return self.capability_context(owner_dh_pk, nonce).decode(
+                claim_label, encrypted_capability)
+
+
+_last_default_codec = None
+
+
+def _default_codec():
+    global _last_default_codec
+    pp = PublicParams.get_default()
+    params = LocalParams.get_default()
+    codec = _last_default_codec
+    if codec is None or codec.public_params is not pp \
+            or codec.local_params is not params:
+        codec = Codec(pp, params)
+        _last_default_codec = codec
+    return codec
+
+
+def _compute_claim_key(vrf_value, mode='enc'):
+    return _default_codec().compute_claim_key(vrf_value, mode=mode)
+
+
+class CapabilityContext(object):
+    """Capability keys shared by an owner and a reader under a nonce.
+
+    Computes the shared secret of the two parties once, and derives the
+    lookup and encryption keys of capabilities for any number of labels
+    from it.
+
+    :param petlib.EcPt peer_dh_pk: DH public key of the other party:
+            reader's when encoding, owner's when decoding
+    :param bytes nonce: Nonce
+    :param Codec codec: Codec of the parameters to use. Codec of the
+            default ones if not given
+    """
+    def __init__(self, peer_dh_pk, nonce, codec=None):
+        if codec is None:
+            codec = _default_codec()
+        self._codec = codec
+        self.nonce = ensure_binary(nonce)
+        shared_secret_hash = codec.compute_shared_secret_hash(peer_dh_pk)
+        # Keys of all labels share the prefix of the hashed string
+        self._lookup_prefix = codec._hash_func(b"cap_lookup|%s|%s|" %
+                (self.nonce, shared_secret_hash))
+        self._enc_prefix = codec._hash_func(b"cap_enc|%s|%s|" %
+                (self.nonce, shared_secret_hash))
+
+    def _derive(self, prefix, claim_label, size):
+        h = prefix.copy()
+        h.update(ensure_binary(claim_label))
+        return h.digest()[:size]
+
+    @profiled
+    @counts_bytes('claim_label')
+    def lookup_key(self, claim_label):
+        """Compute capability lookup key.
+
+        :param bytes claim_label: Claim label
+        """
+        return self._derive(self._lookup_prefix, claim_label,
+                            self._codec._lookup_key_size)
+
+    def enc_key(self, claim_label):
+        """Compute capability encryption key.
+
+        :param bytes claim_label: Claim label
+        """
+        return self._derive(self._enc_prefix, claim_label,
+                            self._codec._enc_key_size)
+
+    @profiled
+    @counts_bytes('vrf_value')
+    def encode(self, claim_label, vrf_value):
+        """Encode capability.
+
+        :param bytes claim_label: Claim label
+        :param bytes vrf_value: Exported VRF value (hash)
+        :return: Pair of lookup key and encrypted capability
+        """
+        codec = self._codec
+        enc_body, tag = codec._enc_cipher.quick_gcm_enc(
+                self.enc_key(claim_label), codec._iv, vrf_value)
+        tag = _fix_bytes(tag)
+        return self.lookup_key(claim_label), encode([enc_body, tag])
+
+    @profiled
+    @counts_bytes('encrypted_capability')
+    def decode(self, claim_label, encrypted_capability):
+        """Decode capability.
+
+        :param bytes claim_label: Claim label
+        :param bytes encrypted_capability: Encrypted capability
+        :return: Pair of VRF value and claim lookup key
+        """
+        codec = self._codec
+        enc_body, tag = decode(encrypted_capability)
+        vrf_value = codec._enc_cipher.quick_gcm_dec(
+                self.enc_key(claim_label), codec._iv, enc_body, tag)
+        claim_lookup_key = codec.compute_claim_key(vrf_value, mode='lookup')
+        return vrf_value, claim_lookup_key
+
+
 @profiled
+@counts_bytes('claim_label')
 def get_capability_lookup_key(owner_dh_pk, nonce, claim_label):
     """Compute capability lookup key.
 
+    To compute keys for many labels, use :py:class:`CapabilityContext`.
+
     :param petlib.EcPt owner_dh_pk: Owner's DH public key
     :param bytes nonce: Nonce
     :param bytes claim_label: Corresponding claim label
     """
-    nonce = ensure_binary(nonce)
-    claim_label = ensure_binary(claim_label)
-    pp = PublicParams.get_default()
-    params = LocalParams.get_default()
-    shared_secret = params.dh.sk * owner_dh_pk
-    shared_secret_key = pp.hash_func(shared_secret.export()).digest()
-    return _compute_capability_key(
-            nonce, shared_secret, claim_label, mode='lookup')
+    return _default_codec().get_capability_lookup_key(
+            owner_dh_pk, nonce, claim_label)
+
+
+def _encrypt_claim(vrf, claim_content):
+    return _default_codec()._encrypt_claim(vrf, claim_content)
 
 
 @profiled
+@counts_bytes('claim_content')
 def encode_claim(nonce, claim_label, claim_content):
     """Encode claim.
 
@@ -73,26 +361,30 @@ def encode_claim(nonce, claim_label, claim_content):
     :param bytes claim_label: Claim label
     :param bytes claim_content: Claim content
     """
-    nonce = ensure_binary(nonce)
-    claim_label = ensure_binary(claim_label)
-    claim_content = ensure_binary(claim_content)
+    return _default_codec().encode_claim(nonce, claim_label, claim_content)
 
-    pp = PublicParams.get_default()
-    salted_label = _salt_label(nonce, claim_label)
-    vrf = compute_vrf(salted_label)
-    lookup_key = _compute_claim_key(vrf.value, mode='lookup')
-    enc_key = _compute_claim_key(vrf.value, mode='enc')
 
-    claim = encode([vrf.proof, claim_content])
-    enc_body, tag = pp.enc_cipher.quick_gcm_enc(
-            enc_key, b"\x00"*pp.enc_key_size, claim)
-    tag = _fix_bytes(tag)
+@profiled
+@counts_bytes('claims')
+def encode_claim_batch(nonce, claims):
+    """Encode many claims.
+
+    Same as calling :py:func:`encode_claim` on each claim, but computes
+    the VRFs with :py:func:`claimchain.crypto.vrf.compute_vrf_batch`.
 
-    enc_claim = encode([enc_body, tag])
-    return (vrf.value, lookup_key, enc_claim)
+    :param bytes nonce: Nonce
+    :param list claims: List of ``(claim_label, claim_content)`` pairs
+    :return: List of ``(vrf_value, lookup_key, enc_claim)`` tuples
+    """
+    return _default_codec().encode_claim_batch(nonce, claims)
+
+
+def _decrypt_claim(vrf_value, encrypted_claim):
+    return _default_codec()._decrypt_claim(vrf_value, encrypted_claim)
 
 
 @profiled
+@counts_bytes('encrypted_claim')
 def decode_claim(owner_vrf_pk, nonce, claim_label, vrf_value, encrypted_claim):
     """Decode claim.
 
@@ -102,54 +394,29 @@ def decode_claim(owner_vrf_pk, nonce, claim_label, vrf_value, encrypted_claim):
     :param bytes vrf_value: Exported VRF value (hash)
     :param bytes encrypted_claim: Claim content
     """
-    claim_label = ensure_binary(claim_label)
-
-    pp = PublicParams.get_default()
-    cipher = pp.enc_cipher
-    salted_label = _salt_label(nonce, claim_label)
-    (encrypted_body, tag) = decode(encrypted_claim)
-
-    lookup_key = _compute_claim_key(vrf_value, mode='lookup')
-    enc_key = _compute_claim_key(vrf_value, mode='enc')
-    raw_body = cipher.quick_gcm_dec(
-            enc_key, b"\x00"*pp.enc_key_size, encrypted_body, tag)
-    (proof, claim_content) = decode(raw_body)
-
-    vrf = VrfContainer(value=vrf_value, proof=proof)
-    if not verify_vrf(owner_vrf_pk, vrf, salted_label):
-        raise Exception("Wrong VRF value")
-
-    return claim_content
+    return _default_codec().decode_claim(
+            owner_vrf_pk, nonce, claim_label, vrf_value, encrypted_claim)
 
 
 @profiled
+@counts_bytes('vrf_value')
 def encode_capability(reader_dh_pk, nonce, claim_label, vrf_value):
     """Encode capability.
 
+    To encode many capabilities for a reader, use
+    :py:class:`CapabilityContext`.
+
     :param petlib.EcPt reader_dh_pk: Reader's VRF public key
     :param bytes nonce: Nonce
     :param bytes claim_label: Corresponding claim label
     :param bytes vrf_value: Exported VRF value (hash)
     """
-    claim_label = ensure_binary(claim_label)
-    pp = PublicParams.get_default()
-    cipher = pp.enc_cipher
-    params = LocalParams.get_default()
-    shared_secret = params.dh.sk * reader_dh_pk
-
-    lookup_key = _compute_capability_key(
-            nonce, shared_secret, claim_label, mode='lookup')
-    enc_key = _compute_capability_key(
-            nonce, shared_secret, claim_label, mode='enc')
-
-    enc_body, tag = cipher.quick_gcm_enc(
-            enc_key, b"\x00"*pp.enc_key_size, vrf_value)
-    tag = _fix_bytes(tag)
-
-    return lookup_key, encode([enc_body, tag])
+    return _default_codec().encode_capability(
+            reader_dh_pk, nonce, claim_label, vrf_value)
 
 
 @profiled
+@counts_bytes('encrypted_capability')
 def decode_capability(owner_dh_pk, nonce, claim_label, encrypted_capability):
     """Decode capability.
 
@@ -158,15 +425,5 @@ def decode_capability(owner_dh_pk, nonce, claim_label, encrypted_capability):
     :param bytes claim_label: Corresponding claim label
     :param bytes encrypted_capability: Encrypted capability
     """
-    pp = PublicParams.get_default()
-    cipher = pp.enc_cipher
-    params = LocalParams.get_default()
-    shared_secret = params.dh.sk * owner_dh_pk
-    enc_key = _compute_capability_key(
-            nonce, shared_secret, claim_label, mode='enc')
-    enc_body, tag = decode(encrypted_capability)
-    vrf_value = cipher.quick_gcm_dec(
-            enc_key, b"\x00"*pp.enc_key_size, enc_body, tag)
-    claim_lookup_key = _compute_claim_key(vrf_value, mode='lookup')
-    return vrf_value, claim_lookup_key
-
+    return _default_codec().decode_capability(
+            owner_dh_pk, nonce, claim_label, encrypted_capability)
@@ -1,3 +1,4 @@
 from .params import PublicParams, LocalParams, Keypair
-from .vrf import compute_vrf, verify_vrf, VrfContainer
+from .vrf import compute_vrf, compute_vrf_value, verify_vrf, VrfContainer
+from .vrf import compute_vrf_batch, verify_vrf_batch
 from .sign import sign, verify_signature
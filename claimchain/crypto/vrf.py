@@ -11,6 +11,7 @@ from profiled import profiled
 from hashlib import sha256
 
 from .params import PublicParams, LocalParams
+from ..instrumentation import counts_bytes
 
 
 @attrs
@@ -24,7 +25,60 @@ class VrfContainer(object):
     proof = attrib()
 
 
+def _compute_vrfs(pp, vrf_keypair, messages, encoded_g=None):
+    G = pp.ec_group
+    order = G.order()
+    k = vrf_keypair.sk
+    if encoded_g is None:
+        encoded_g = encode(G.generator())
+    encoded_pub = encode(vrf_keypair.pk)
+
+    result = []
+    for message in messages:
+        h = G.hash_to_point(b"1||" + message)
+        v = k * h
+        r = order.random()
+        R = pp.mul_generator(r)
+        Hr = r * h
+        # Same as encode([g, h, pub, v, R, Hr])
+        transcript = b"\x96" + encoded_g + encode(h) + encoded_pub + \
+                encode(v) + encode(R) + encode(Hr)
+        s = Bn.from_binary(sha256(transcript).digest())
+        t = (r - s * k) % order
+        result.append(VrfContainer(value=v.export(), proof=encode((s, t))))
+    return result
+
+
+def _compute_vrf_value(pp, vrf_keypair, message):
+    h = pp.ec_group.hash_to_point(b"1||" + message)
+    return (vrf_keypair.sk * h).export()
+
+
+def _verify_vrfs(pp, pub, vrfs, messages, encoded_g=None):
+    if len(vrfs) != len(messages):
+        raise ValueError("Number of VRFs and messages differ")
+
+    G = pp.ec_group
+    if encoded_g is None:
+        encoded_g = encode(G.generator())
+    encoded_pub = encode(pub)
+
+    result = []
+    for vrf, message in zip(vrfs, messages):
+        h = G.hash_to_point(b"1||" + message)
+        v = EcPt.from_binary(vrf.value, G)
+        s, t = decode(vrf.proof)
+        R = pp.mul_generator(t, pub, s)
+        Hr = G.wsum([t, s], [h, v])
+        transcript = b"\x96" + encoded_g + encode(h) + encoded_pub + \
+                encode(v) + encode(R) + encode(Hr)
+        s2 = Bn.from_binary(sha256(transcript).digest())
+        result.append(s2 == s)
+    return result
+
+
 @profiled
+@counts_bytes('message')
 def compute_vrf(message):
     """Compute VRF.
 
@@ -35,22 +89,28 @@ def compute_vrf(message):
     """
     pp = PublicParams.get_default()
     local_params = LocalParams.get_default()
+    return _compute_vrfs(pp, local_params.vrf, [message])[0]
 
-    G = pp.ec_group
-    g = G.generator()
-    k = local_params.vrf.sk
-    pub = local_params.vrf.pk
-    h = G.hash_to_point(b"1||" + message)
-    v = k * h
-    r = G.order().random()
-    R = r * g
-    Hr = r * h
-    s = Bn.from_binary(sha256(encode([g, h, pub, v, R, Hr])).digest())
-    t = (r - s * k) % G.order()
-    return VrfContainer(value=v.export(), proof=encode((s, t)))
+
+@profiled
+@counts_bytes('message')
+def compute_vrf_value(message):
+    """Compute VRF value without a proof.
+
+    Same as ``compute_vrf(message).value``, at the cost of one hash to
+    a point and one scalar multiplication. Enough for the owner of the
+    key, who needs no proof to trust their own values.
+
+    :param bytes message: Message
+    :return: Exported VRF value (hash)
+    """
+    pp = PublicParams.get_default()
+    local_params = LocalParams.get_default()
+    return _compute_vrf_value(pp, local_params.vrf, message)
 
 
 @profiled
+@counts_bytes('message')
 def verify_vrf(pub, vrf, message):
     """Verify a VRF.
 
@@ -60,15 +120,47 @@ def verify_vrf(pub, vrf, message):
     :param VrfContainer vrf: VRF value and proof
     :param bytes message: Message
     """
-
     pp = PublicParams.get_default()
+    return _verify_vrfs(pp, pub, [vrf], [message])[0]
 
-    G = pp.ec_group
-    g = G.generator()
-    h = G.hash_to_point(b"1||" + message)
-    v = EcPt.from_binary(vrf.value, G)
-    s, t = decode(vrf.proof)
-    R = t*g + s*pub
-    Hr = t*h + s*v
-    s2 = Bn.from_binary(sha256(encode([g, h, pub, v, R, Hr])).digest())
-    return s2 == s
+
+@profiled
+@counts_bytes('messages')
+def compute_vrf_batch(messages, pp=None, vrf_keypair=None, encoded_g=None):
+    """Compute VRFs of many messages.
+
+    Equivalent to calling :py:func:`compute_vrf` on each message, but
+    looks up the parameters and encodes the generator and the public key
+    once per batch.
+
+    :param list messages: List of messages (bytes)
+    :param PublicParams pp: Public parameters. By default, the default
+            ones
+    :param Keypair vrf_keypair: VRF key pair. By default, the one of the
+            default local parameters
+    :param bytes encoded_g: Encoded generator of the group, if known
+    :return: List of :py:class:`VrfContainer`
+    """
+    if pp is None:
+        pp = PublicParams.get_default()
+    if vrf_keypair is None:
+        vrf_keypair = LocalParams.get_default().vrf
+    return _compute_vrfs(pp, vrf_keypair, messages, encoded_g=encoded_g)
+
+
+@profiled
+@counts_bytes('messages')
+def verify_vrf_batch(pub, vrfs, messages):
+    """Verify VRFs of many messages under the same public key.
+
+    The proofs are Fiat-Shamir transcripts that hash the commitments
+    ``R`` and ``Hr`` themselves, so they can not be combined into a
+    randomized batch equation: every VRF is checked individually.
+
+    :param petlib.EcPt pub: VRF public key
+    :param list vrfs: List of :py:class:`VrfContainer`
+    :param list messages: List of messages (bytes)
+    :return: List of booleans, one per VRF
+    """
+    pp = PublicParams.get_default()
+    return _verify_vrfs(pp, pub, vrfs, messages)
@@ -0,0 +1,176 @@
+"""
+Index of the blocks of a chain by position and by time.
+"""
+
+import os
+import struct
+import threading
+from bisect import bisect_right
+
+
+_INDEX_MAGIC = b'CCCHAIN1'
+# Record: timestamp, hash length; followed by the block hash
+_RECORD_PREFIX = struct.Struct('>dH')
+
+
+def _block_timestamp(block):
+    item = block.items[0]
+    if isinstance(item, bytes):
+        from .state import Payload
+        item = Payload.parse(item).export()
+    # Timestamp of the payload, without parsing the rest of it
+    return float(item['timestamp'])
+
+
+class ChainIndex(object):
+    """
+    Index mapping block indexes and timestamps of a chain to block hashes.
+
+    The index is extended with :py:meth:`update` as blocks are appended
+    to the chain, reading only the new blocks. Looking up a block by its
+    index takes constant time, and by timestamp logarithmic time.
+
+    >>> import hippiehug
+    >>> chain = hippiehug.Chain({})
+    >>> for i in range(3):
+    ...     chain.multi_add([{'timestamp': 10 * i}])
+    >>> chain_index = ChainIndex(chain.store)
+    >>> chain_index.update(chain.head)
+    3
+    >>> chain_index.block_hash(2) == chain.head
+    True
+    >>> chain_index.index_at(15)
+    1
+
+    Timestamps of the blocks are expected not to decrease. If a block has
+    an earlier timestamp than a block before it, it is indexed at the
+    timestamp of the latest of the earlier blocks.
+
+    :param store: Store holding the chain
+    :param str path: File to persist the index in, such as a file in
+            the directory of a :py:class:`utils.FileStore`. It is read
+            if it exists, and new blocks are appended to it.
+    """
+    def __init__(self, store, path=None):
+        self.store = store
+        self.path = path
+        self._lock = threading.Lock()
+        self._hashes = []
+        self._timestamps = []
+        self._file = None
+        if path is not None:
+            self._open(path)
+
+    def _open(self, path):
+        valid_size = len(_INDEX_MAGIC)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            if data[:len(_INDEX_MAGIC)] != _INDEX_MAGIC:
+                raise ValueError('Not a chain index: %s' % path)
+            offset = valid_size
+            while offset + _RECORD_PREFIX.size <= len(data):
+                timestamp, hash_size = \
+                        _RECORD_PREFIX.unpack_from(data, offset)
+                end = offset + _RECORD_PREFIX.size + hash_size
+                if end > len(data):
+                    break
+                self._hashes.append(data[end - hash_size:end])
+                self._timestamps.append(timestamp)
+                offset = valid_size = end
+        else:
+            with open(path, 'wb') as f:
+                f.write(_INDEX_MAGIC)
+        self._file = open(path, 'ab')
+        # Discard a record cut short by an interrupted append
+        self._file.truncate(valid_size)
+
+    def close(self):
+        """Close the index file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    @property
+    def head(self):
+        """Hash of the latest indexed block, or ``None``."""
+        return self._hashes[-1] if self._hashes else None
+
+    def _read_block(self, block_hash):
+        block = self.store[block_hash]
+        if block.hid != block_hash:
+            raise ValueError('Hash of the block is not the lookup key')
+        return block
+
+    def update(self, head):
+        """Index the blocks up to ``head``.
+
+        :param bytes head: Head of the chain
+        :return: Number of new blocks
+        :raises ValueError: If the chain does not extend the indexed one
+        """
+        with self._lock:
+            new_blocks = []
+            block_hash = head
+            while block_hash is not None:
+                block = self._read_block(block_hash)
+                if block.index < len(self._hashes):
+                    if self._hashes[block.index] != block_hash:
+                        raise ValueError(
+                                'Chain does not extend the indexed chain.')
+                    break
+                new_blocks.append((block_hash, block))
+                # The first finger points at the previous block
+                block_hash = block.fingers[0][1] if block.fingers else None
+
+            last_timestamp = self._timestamps[-1] if self._timestamps \
+                    else float('-inf')
+            records = []
+            for block_hash, block in reversed(new_blocks):
+                last_timestamp = max(last_timestamp, _block_timestamp(block))
+                self._hashes.append(block_hash)
+                self._timestamps.append(last_timestamp)
+                records.append(_RECORD_PREFIX.pack(
+                        last_timestamp, len(block_hash)) + block_hash)
+            if self._file is not None and records:
+                self._file.write(b''.join(records))
+                self._file.flush()
+            return len(new_blocks)
+
+    def block_hash(self, index):
+        """Hash of the block with a given index.
+
+        :raises IndexError: If the block is not indexed
+        """
+        if not 0 <= index < len(self._hashes):
+            raise IndexError('Block %d is not indexed.' % index)
+        return self._hashes[index]
+
+    def timestamp(self, index):
+        """Timestamp the block with a given index is indexed at."""
+        if not 0 <= index < len(self._timestamps):
+            raise IndexError('Block %d is not indexed.' % index)
+        return self._timestamps[index]
+
+    def index_at(self, timestamp, end=None):
+        """Index of the latest block committed by ``timestamp``.
+
+        :param timestamp: Unix-format timestamp
+        :param int end: Only consider blocks before this index
+        :raises KeyError: If no block was committed by then
+        """
+        if end is None:
+            end = len(self._timestamps)
+        index = bisect_right(self._timestamps, timestamp, 0, end) - 1
+        if index < 0:
+            raise KeyError('No block committed by %s.' % timestamp)
+        return index
@@ -0,0 +1,445 @@
+"""
+Hosting of the chains of many owners in worker processes.
+
+Owners are assigned to shards by a hash of their identifiers. Every
+shard is a worker process that keeps the states and chains of its
+owners, and commits for them one at a time. Shards commit in parallel.
+
+As in :py:mod:`claimchain.parallel`, parameters are exported to plain
+values and imported in the workers. Each owner's params are passed
+explicitly, and only made the defaults inside the worker, around the
+commits of that owner.
+
+Stores are created in the workers by a factory, so that they never cross
+process boundaries. To read the chains from other processes, use stores
+that can be shared, such as :py:class:`utils.FileStore` or
+:py:class:`utils.RedisObjectStore`.
+"""
+
+import itertools
+import multiprocessing
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import Future
+from timeit import default_timer
+
+from six.moves import queue
+
+from hippiehug import Chain
+from petlib.ec import EcPt, POINT_CONVERSION_UNCOMPRESSED
+
+from .crypto import PublicParams, LocalParams
+from .parallel import export_public_params, import_public_params
+from .state import State
+from .utils import ObjectStore, ensure_binary
+
+
+# Number of latest request latencies per shard to compute percentiles of
+_LATENCY_WINDOW = 1024
+
+_ADD_OWNER = 'add_owner'
+_COMMIT = 'commit'
+_STOP = 'stop'
+
+_CLAIM = 'claim'
+_GRANT = 'grant'
+_REVOKE = 'revoke'
+
+
+def _memory_store(owner_id):
+    return ObjectStore()
+
+
+class _HostedOwner(object):
+    """State and chain of an owner, in a worker."""
+
+    def __init__(self, params, store, head):
+        self.params = params
+        self.store = store
+        self.state = State()
+        self.chain = Chain(store, root_hash=head)
+
+    def commit(self, pp, operations, incremental):
+        with pp.as_default(), self.params.as_default():
+            for operation in operations:
+                kind = operation[0]
+                if kind == _CLAIM:
+                    _, claim_label, claim_content = operation
+                    self.state[claim_label] = claim_content
+                else:
+                    _, exported_pk, claim_labels = operation
+                    reader_dh_pk = EcPt.from_binary(exported_pk, pp.ec_group)
+                    if kind == _GRANT:
+                        self.state.grant_access(reader_dh_pk, claim_labels)
+                    else:
+                        self.state.revoke_access(reader_dh_pk, claim_labels)
+            return self.state.commit(self.chain, incremental=incremental)
+
+
+def _send_reply(conn, request_id, head, error, seconds):
+    try:
+        conn.send((request_id, head, error, seconds))
+    except Exception:
+        # The exception could not be pickled
+        conn.send((request_id, None, RuntimeError(repr(error)), seconds))
+
+
+def _run_shard(conn, exported_pp, store_factory, incremental):
+    pp = import_public_params(dict(exported_pp))
+    owners = {}
+    try:
+        while True:
+            message = conn.recv()
+            kind = message[0]
+            if kind == _STOP:
+                break
+            elif kind == _ADD_OWNER:
+                _, owner_id, exported_params, head = message
+                try:
+                    with pp.as_default():
+                        params = LocalParams.from_dict(dict(exported_params))
+                    owners[owner_id] = _HostedOwner(
+                            params, store_factory(owner_id), head)
+                except Exception as e:
+                    # Commits of the owner fail with the same error
+                    owners[owner_id] = e
+            elif kind == _COMMIT:
+                _, request_id, owner_id, operations = message
+                start = default_timer()
+                head, error = None, None
+                try:
+                    owner = owners[owner_id]
+                    if isinstance(owner, Exception):
+                        raise owner
+                    head = owner.commit(pp, operations, incremental)
+                except Exception as e:
+                    error = e
+                _send_reply(conn, request_id, head, error,
+                            default_timer() - start)
+    finally:
+        for owner in owners.values():
+            if isinstance(owner, _HostedOwner) \
+                    and hasattr(owner.store, 'close'):
+                owner.store.close()
+        conn.close()
+
+
+class _OwnerQueue(object):
+    """Commit requests of an owner, in the host process."""
+
+    def __init__(self, owner_id, shard, head):
+        self.owner_id = owner_id
+        self.shard = shard
+        self.head = head
+        # Requests waiting for the commit in flight to finish
+        self.operations = []
+        self.waiting = []
+        # Requests of the commit in flight, or None
+        self.in_flight = None
+
+
+class _Shard(object):
+    def __init__(self, index, context, exported_pp, store_factory,
+                 incremental):
+        self.index = index
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+                target=_run_shard,
+                args=(child_conn, exported_pp, store_factory, incremental))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+        # Messages are sent from a thread of their own, so that neither
+        # callers nor the receiver block on a full pipe
+        self.outbox = queue.Queue()
+        self.requests = {}
+        self.num_owners = 0
+        self.num_requests = 0
+        self.num_commits = 0
+        self.num_failures = 0
+        self.commit_seconds = 0.0
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+
+    def send(self, message):
+        self.outbox.put(message)
+
+    def run_sender(self):
+        while True:
+            message = self.outbox.get()
+            try:
+                self.conn.send(message)
+            except (IOError, OSError):
+                break
+            if message[0] == _STOP:
+                break
+
+
+def _percentile(values, fraction):
+    index = min(len(values) - 1, int(fraction * len(values)))
+    return values[index]
+
+
+class ClaimChainHost(object):
+    """
+    Commit service for the chains of many owners.
+
+    Commits of an owner are queued: while one is in progress, further
+    requests of the owner are coalesced, and committed together in one
+    block. Commits of owners in different shards run in parallel.
+
+    >>> from claimchain import LocalParams
+    >>> with ClaimChainHost(num_shards=2) as host:
+    ...     host.add_owner('alice', LocalParams.generate())
+    ...     future = host.commit('alice', claims={'marios': 'test'})
+    ...     head = future.result()
+    >>> head == host.head('alice')
+    True
+
+    :param int num_shards: Number of worker processes. By default, the
+            number of CPUs.
+    :param store_factory: Picklable callable, that gets an owner
+            identifier, and returns the store for the owner's chain and
+            tree. Called in the workers. By default, in-memory stores.
+    :param PublicParams public_params: Public parameters. By default,
+            the current default ones.
+    :param bool incremental: Commit incrementally, see
+            :py:meth:`State.commit`.
+    :param mp_context: ``multiprocessing`` context to start the workers
+            with. By default, the ``multiprocessing`` module.
+    """
+    def __init__(self, num_shards=None, store_factory=None,
+                 public_params=None, incremental=False, mp_context=None):
+        if num_shards is None:
+            num_shards = multiprocessing.cpu_count()
+        if num_shards < 1:
+            raise ValueError('Number of shards has to be positive.')
+        if public_params is None:
+            public_params = PublicParams.get_default()
+        if store_factory is None:
+            store_factory = _memory_store
+        if mp_context is None:
+            mp_context = multiprocessing
+
+        self._ec_group = public_params.ec_group
+        exported_pp = tuple(sorted(
+                export_public_params(public_params).items()))
+        self._lock = threading.Lock()
+        self._owners = {}
+        self._request_ids = itertools.count()
+        self._closed = False
+        self._start_time = default_timer()
+
+        # Start the workers before any threads
+        self._shards = [_Shard(index, mp_context, exported_pp,
+                               store_factory, incremental)
+                        for index in range(num_shards)]
+        self._threads = []
+        for shard in self._shards:
+            self._start_thread(shard.run_sender)
+            self._start_thread(self._receive, shard)
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _shard_of(self, owner_id):
+        index = zlib.crc32(ensure_binary(owner_id)) % len(self._shards)
+        return self._shards[index]
+
+    def add_owner(self, owner_id, params, head=None):
+        """Host the chain of an owner.
+
+        :param owner_id: Owner identifier, bytes or text
+        :param LocalParams params: Owner's params, with private keys
+        :param bytes head: Head of the owner's chain in their store, if
+                it already has blocks
+        :raises ValueError: If the owner is already hosted
+        """
+        exported_params = tuple(sorted(params.private_export().items()))
+        with self._lock:
+            self._check_open()
+            if owner_id in self._owners:
+                raise ValueError('Owner %r is already hosted.' % owner_id)
+            shard = self._shard_of(owner_id)
+            self._owners[owner_id] = _OwnerQueue(owner_id, shard, head)
+            shard.num_owners += 1
+            shard.send((_ADD_OWNER, owner_id, exported_params, head))
+
+    def _export_pk(self, reader_dh_pk):
+        return reader_dh_pk.export(POINT_CONVERSION_UNCOMPRESSED)
+
+    def commit(self, owner_id, claims=None, grants=None, revocations=None):
+        """Request a commit of changes to an owner's state.
+
+        Changes are applied in the order of the requests: claims, then
+        grants, then revocations of every request. Labels and contents
+        are encoded to bytes. If the commit fails, the changes stay in
+        the state, and go into the next commit.
+
+        :param owner_id: Owner identifier
+        :param claims: Dictionary, or iterable of ``(claim_label,
+                claim_content)`` pairs, to add
+        :param grants: Iterable of ``(reader_dh_pk, claim_labels)``
+                pairs to grant access to
+        :param revocations: Iterable of ``(reader_dh_pk, claim_labels)``
+                pairs to revoke access to
+        :return: ``concurrent.futures.Future`` of the new head of the
+                 chain, which may include later requests
+        :raises KeyError: If the owner is not hosted
+        """
+        if isinstance(claims, dict):
+            claims = claims.items()
+        operations = [(_CLAIM, ensure_binary(claim_label),
+                       ensure_binary(claim_content))
+                      for claim_label, claim_content in (claims or [])]
+        for kind, changes in ((_GRANT, grants), (_REVOKE, revocations)):
+            operations.extend(
+                    (kind, self._export_pk(reader_dh_pk),
+                     [ensure_binary(claim_label)
+                      for claim_label in claim_labels])
+                    for reader_dh_pk, claim_labels in (changes or []))
+
+        future = Future()
+        with self._lock:
+            self._check_open()
+            try:
+                owner = self._owners[owner_id]
+            except KeyError:
+                raise KeyError('Owner %r is not hosted.' % owner_id)
+            owner.operations.extend(operations)
+            owner.waiting.append((future, default_timer()))
+            if owner.in_flight is None:
+                self._send_commit(owner)
+        return future
+
+    def _send_commit(self, owner):
+        request_id = next(self._request_ids)
+        shard = owner.shard
+        shard.requests[request_id] = owner
+        shard.send((_COMMIT, request_id, owner.owner_id, owner.operations))
+        owner.in_flight = owner.waiting
+        owner.operations = []
+        owner.waiting = []
+
+    def _receive(self, shard):
+        while True:
+            try:
+                request_id, head, error, seconds = shard.conn.recv()
+            except (EOFError, IOError, OSError):
+                break
+            now = default_timer()
+            with self._lock:
+                owner = shard.requests.pop(request_id)
+                requests = owner.in_flight
+                owner.in_flight = None
+                if error is None:
+                    owner.head = head
+                    shard.num_commits += 1
+                else:
+                    shard.num_failures += 1
+                shard.num_requests += len(requests)
+                shard.commit_seconds += seconds
+                shard.latencies.extend(now - start for _, start in requests)
+                if owner.waiting:
+                    self._send_commit(owner)
+            for future, _ in requests:
+                if error is None:
+                    future.set_result(head)
+                else:
+                    future.set_exception(error)
+        self._fail_requests(shard)
+
+    def _fail_requests(self, shard):
+        with self._lock:
+            owners = list(shard.requests.values())
+            shard.requests.clear()
+            futures = []
+            for owner in owners:
+                futures.extend(owner.in_flight or [])
+                futures.extend(owner.waiting)
+                owner.in_flight = None
+                owner.operations = []
+                owner.waiting = []
+        for future, _ in futures:
+            future.set_exception(RuntimeError('Shard %d stopped.'
+                                              % shard.index))
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError('Host is closed.')
+
+    def head(self, owner_id):
+        """Head of an owner's chain after the last finished commit."""
+        with self._lock:
+            return self._owners[owner_id].head
+
+    def stats(self):
+        """
+        Return counters, throughput, and latencies of requests, per shard.
+
+        Latencies are from a request to the end of the commit including
+        it, over the latest requests.
+        """
+        elapsed = default_timer() - self._start_time
+        result = []
+        with self._lock:
+            for shard in self._shards:
+                latencies = sorted(shard.latencies)
+                stats = {
+                    'shard': shard.index,
+                    'owners': shard.num_owners,
+                    'requests': shard.num_requests,
+                    'commits': shard.num_commits,
+                    'failures': shard.num_failures,
+                    'commit_seconds': shard.commit_seconds,
+                    'commits_per_second': shard.num_commits / elapsed,
+                    'utilization': shard.commit_seconds / elapsed,
+                }
+                if latencies:
+                    stats.update({
+                        'latency_mean': sum(latencies) / len(latencies),
+                        'latency_p50': _percentile(latencies, 0.5),
+                        'latency_p99': _percentile(latencies, 0.99),
+                        'latency_max': latencies[-1],
+                    })
+                result.append(stats)
+        return result
+
+    def close(self):
+        """Finish the queued commits, and stop the workers."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        # Requests coalesced behind commits in flight are still sent by
+        # the receivers, so wait for the owners to drain first
+        for owner in list(self._owners.values()):
+            while True:
+                with self._lock:
+                    futures = [future for future, _
+                               in (owner.in_flight or []) + owner.waiting]
+                if not futures:
+                    break
+                for future in futures:
+                    try:
+                        future.exception()
+                    except Exception:
+                        pass
+        for shard in self._shards:
+            shard.send((_STOP,))
+        for shard in self._shards:
+            shard.process.join()
+        for thread in self._threads:
+            thread.join()
+        for shard in self._shards:
+            shard.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
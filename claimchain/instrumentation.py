@@ -0,0 +1,352 @@
+"""
+Collection and export of the timings of ``profiled`` functions.
+
+The cryptographic operations of :py:mod:`claimchain.core` and
+:py:mod:`claimchain.crypto.vrf`, and the tree building of commits, are
+decorated with ``profiled``. While a :py:class:`Recorder` is enabled,
+every call of them is counted, its latency added to a histogram, and
+the size of its input to a byte counter. Calls are attributed to the
+enclosing :py:meth:`State.commit <claimchain.State.commit>` or
+:py:class:`View <claimchain.View>` call, if any.
+
+>>> from claimchain.core import encode_claim
+>>> from claimchain.crypto import LocalParams
+>>> with LocalParams.generate().as_default(), Recorder() as recorder:
+...     _ = encode_claim(b'nonce', b'label', b'content')
+>>> metric = recorder.snapshot()['metrics'][-1]
+>>> metric['function'], metric['scope'], metric['calls'], metric['bytes']
+('encode_claim', None, 1, 7)
+
+While no recorder is enabled, the decorators only check whether one is.
+
+Recorders hook into ``profiled.Profiler``, so a recorder can not be
+enabled at the same time as a plain ``Profiler``. Calls that run in
+worker processes, such as the parallel encodings of
+:py:mod:`claimchain.parallel`, are not recorded.
+"""
+
+import json
+import threading
+from bisect import bisect_left
+from functools import wraps
+from timeit import default_timer
+
+try:
+    from collections.abc import ItemsView, Iterator
+except ImportError:
+    from collections import ItemsView, Iterator
+
+import six
+from profiled import Profiler
+
+
+__all__ = ['Recorder', 'enable', 'disable', 'get_recorder',
+           'DEFAULT_BUCKETS']
+
+
+#: Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_PROMETHEUS_PREFIX = 'claimchain_'
+
+# Enabled recorder and its profiler, or None
+_recorder = None
+_profiler = None
+_local = threading.local()
+
+
+def _func_id(func):
+    # Same as the identifier that ``profiled`` records timings under
+    return getattr(func, '__qualname__', func.__name__)
+
+
+def _size(value):
+    if isinstance(value, (bytes, six.text_type)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_size(item) for item in value.values())
+    if isinstance(value, (list, tuple, ItemsView)):
+        return sum(_size(item) for item in value)
+    return 0
+
+
+def _counting_iter(recorder, func_id, items):
+    for item in items:
+        recorder.record_bytes(func_id, _size(item))
+        yield item
+
+
+def _current_scope():
+    return getattr(_local, 'scope', None)
+
+
+class _Metric(object):
+    def __init__(self, num_buckets):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        # Last bucket counts the calls over the highest bound
+        self.bucket_counts = [0] * (num_buckets + 1)
+
+
+class _RecordingProfiler(Profiler):
+    """``Profiler`` whose timings go to a recorder.
+
+    Installed and removed through the public context manager protocol
+    of ``Profiler``.
+    """
+    def __init__(self, recorder):
+        self.recorder = recorder
+        super(_RecordingProfiler, self).__init__()
+
+    def reset(self):
+        self.data = _Timings(self.recorder)
+
+
+class _Timings(object):
+    """Mapping of function identifiers to series of timings, in place
+    of the data of a ``Profiler``."""
+    def __init__(self, recorder):
+        self._recorder = recorder
+
+    def __getitem__(self, func_id):
+        return _Series(self._recorder, func_id)
+
+
+class _Series(object):
+    def __init__(self, recorder, func_id):
+        self._recorder = recorder
+        self._func_id = func_id
+
+    def append(self, seconds):
+        self._recorder.record(self._func_id, seconds)
+
+
+class Recorder(object):
+    """
+    Aggregated call counts, latencies, and input sizes of instrumented
+    functions, per function and enclosing call.
+
+    Enable a recorder with :py:func:`enable`, or use it as a context
+    manager.
+
+    :param tuple buckets: Upper bounds of the latency histogram
+            buckets, in seconds
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _metric(self, func_id):
+        key = (func_id, _current_scope())
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = self._metrics[key] = _Metric(len(self.buckets))
+        return metric
+
+    def record(self, func_id, seconds):
+        """Record a call of a function.
+
+        :param str func_id: Function identifier
+        :param float seconds: Duration of the call
+        """
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            metric = self._metric(func_id)
+            metric.calls += 1
+            metric.seconds += seconds
+            metric.bucket_counts[bucket] += 1
+
+    def record_bytes(self, func_id, num_bytes):
+        """Record the input size of a call of a function."""
+        with self._lock:
+            self._metric(func_id).bytes += num_bytes
+
+    def reset(self):
+        """Drop everything recorded."""
+        with self._lock:
+            self._metrics.clear()
+
+    def snapshot(self):
+        """
+        Return everything recorded, as a JSON-serializable dictionary.
+
+        Histogram buckets are cumulative, as in Prometheus: every bucket
+        counts the calls that took at most its upper bound.
+        """
+        with self._lock:
+            items = sorted(self._metrics.items(),
+                           key=lambda item: (item[0][1] or '', item[0][0]))
+            metrics = []
+            for (func_id, scope), metric in items:
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(self.buckets + (None,),
+                                        metric.bucket_counts):
+                    cumulative += count
+                    buckets.append([bound, cumulative])
+                metrics.append({
+                    'function': func_id,
+                    'scope': scope,
+                    'calls': metric.calls,
+                    'seconds': metric.seconds,
+                    'bytes': metric.bytes,
+                    'buckets': buckets,
+                })
+        return {'metrics': metrics}
+
+    def to_json(self, **kwargs):
+        """Export a snapshot as JSON.
+
+        :param kwargs: Arguments of ``json.dumps``
+        """
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self):
+        """Export a snapshot in the Prometheus text exposition format."""
+        metrics = self.snapshot()['metrics']
+        calls_name = _PROMETHEUS_PREFIX + 'calls_total'
+        bytes_name = _PROMETHEUS_PREFIX + 'input_bytes_total'
+        duration_name = _PROMETHEUS_PREFIX + 'call_duration_seconds'
+        lines = [
+            '# HELP %s Calls of instrumented functions.' % calls_name,
+            '# TYPE %s counter' % calls_name,
+        ]
+        lines.extend('%s{%s} %d' % (calls_name, _labels(metric),
+                                    metric['calls'])
+                     for metric in metrics)
+        lines += [
+            '# HELP %s Input bytes of instrumented functions.' % bytes_name,
+            '# TYPE %s counter' % bytes_name,
+        ]
+        lines.extend('%s{%s} %d' % (bytes_name, _labels(metric),
+                                    metric['bytes'])
+                     for metric in metrics)
+        lines += [
+            '# HELP %s Duration of calls of instrumented functions.'
+            % duration_name,
+            '# TYPE %s histogram' % duration_name,
+        ]
+        for metric in metrics:
+            labels = _labels(metric)
+            for bound, count in metric['buckets']:
+                le = '+Inf' if bound is None else repr(float(bound))
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                        duration_name, labels, le, count))
+            lines.append('%s_sum{%s} %r' % (duration_name, labels,
+                                            metric['seconds']))
+            lines.append('%s_count{%s} %d' % (duration_name, labels,
+                                              metric['calls']))
+        return '\n'.join(lines) + '\n'
+
+    def __enter__(self):
+        enable(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        disable()
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+                .replace('\n', '\\n')
+
+
+def _labels(metric):
+    return 'function="%s",scope="%s"' % (
+            _escape_label(metric['function']),
+            _escape_label(metric['scope'] or ''))
+
+
+def enable(recorder=None):
+    """Start recording calls of instrumented functions.
+
+    :param Recorder recorder: Recorder to record to. By default, a new
+            one.
+    :return: The enabled recorder
+    """
+    global _recorder, _profiler
+    if recorder is None:
+        recorder = Recorder()
+    profiler = _RecordingProfiler(recorder)
+    profiler.__enter__()
+    _recorder, _profiler = recorder, profiler
+    return recorder
+
+
+def disable():
+    """Stop recording calls of instrumented functions."""
+    global _recorder, _profiler
+    if _profiler is not None and Profiler.get_default() is _profiler:
+        _profiler.__exit__(None, None, None)
+    _recorder = _profiler = None
+
+
+def get_recorder():
+    """Return the enabled recorder, or ``None``."""
+    return _recorder
+
+
+def counts_bytes(arg_name):
+    """Decorator recording the size of an argument of a ``profiled``
+    function while a recorder is enabled.
+
+    Goes under ``@profiled``, so that sizes are recorded under the same
+    function identifier as timings. Sizes of lists and dictionaries are
+    the total sizes of their byte strings. Iterators are passed on
+    wrapped, and their items are counted as they are consumed.
+
+    :param str arg_name: Name of the argument
+    """
+    def decorate(func):
+        code = func.__code__
+        arg_index = list(code.co_varnames[:code.co_argcount]).index(arg_name)
+        func_id = _func_id(func)
+
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            recorder = _recorder
+            if recorder is not None:
+                if arg_index < len(args):
+                    value = args[arg_index]
+                else:
+                    value = kwargs.get(arg_name)
+                if isinstance(value, Iterator):
+                    value = _counting_iter(recorder, func_id, value)
+                    if arg_index < len(args):
+                        args = args[:arg_index] + (value,) \
+                                + args[arg_index + 1:]
+                    else:
+                        kwargs[arg_name] = value
+                else:
+                    recorder.record_bytes(func_id, _size(value))
+            return func(*args, **kwargs)
+        return wrapped
+    return decorate
+
+
+def scope(name):
+    """Decorator attributing instrumented calls to calls of the
+    decorated function, and recording its own calls under ``name``.
+
+    Calls are attributed to the outermost scope only.
+
+    :param str name: Name of the scope, such as ``State.commit``
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None or _current_scope() is not None:
+                return func(*args, **kwargs)
+            _local.scope = name
+            start = default_timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recorder.record(name, default_timer() - start)
+                _local.scope = None
+        return wrapped
+    return decorate
@@ -0,0 +1,220 @@
+"""
+Encoding of claims and capabilities in worker processes.
+
+Cryptographic parameters live in thread-local default contexts, which do
+not cross process boundaries, and petlib objects can not be pickled.
+Hence parameters are exported to plain values, shipped along with every
+task, and imported (once per worker process) on the other side.
+"""
+
+from petlib.cipher import Cipher
+from petlib.ec import EcGroup, EcPt, POINT_CONVERSION_UNCOMPRESSED
+
+from .core import encode_claim_batch, CapabilityContext
+from .crypto import PublicParams, LocalParams
+
+
+DEFAULT_CHUNK_SIZE = 64
+
+
+def export_public_params(pp):
+    """Export public parameters to a picklable dictionary.
+
+    The cipher is always an AES-GCM cipher (see :py:mod:`claimchain.core`),
+    so it is identified by its key length.
+
+    :param PublicParams pp: Public parameters
+    """
+    return {
+        'nid': pp.ec_group.nid(),
+        'hash_func': pp.hash_func,
+        'cipher_key_len': pp.enc_cipher.len_key(),
+        'enc_key_size': pp.enc_key_size,
+        'lookup_key_size': pp.lookup_key_size,
+        'nonce_size': pp.nonce_size,
+    }
+
+
+def import_public_params(exported):
+    """Import public parameters exported by :py:func:`export_public_params`.
+
+    :param dict exported: Exported public parameters
+    """
+    return PublicParams(
+        ec_group=EcGroup(exported['nid']),
+        hash_func=exported['hash_func'],
+        enc_cipher=Cipher('aes-%d-gcm' % (exported['cipher_key_len'] * 8)),
+        enc_key_size=exported['enc_key_size'],
+        lookup_key_size=exported['lookup_key_size'],
+        nonce_size=exported['nonce_size'])
+
+
+def export_params():
+    """Export the current default parameters for shipping to workers."""
+    exported_pp = export_public_params(PublicParams.get_default())
+    exported_params = LocalParams.get_default().private_export()
+    return (tuple(sorted(exported_pp.items())),
+            tuple(sorted(exported_params.items())))
+
+
+# Imported parameters in this (worker) process, keyed by their export
+_imported_params = {}
+
+
+def _import_params(exported):
+    params = _imported_params.get(exported)
+    if params is None:
+        exported_pp, exported_params = exported
+        params = (import_public_params(dict(exported_pp)),
+                  LocalParams.from_dict(dict(exported_params)))
+        _imported_params.clear()
+        _imported_params[exported] = params
+    return params
+
+
+def _encode_claims_chunk(exported, nonce, claims):
+    pp, params = _import_params(exported)
+    with pp.as_default(), params.as_default():
+        return encode_claim_batch(nonce, claims)
+
+
+def _encode_capabilities_chunk(exported, nonce, grants):
+    pp, params = _import_params(exported)
+    with pp.as_default(), params.as_default():
+        return _encode_capabilities(
+                nonce, grants,
+                lambda exported_pk: EcPt.from_binary(exported_pk, pp.ec_group))
+
+
+def _encode_capabilities(nonce, grants, import_pk=None):
+    # One capability context per reader
+    contexts = {}
+    results = []
+    for reader_pk, claim_label, vrf_value in grants:
+        context = contexts.get(reader_pk)
+        if context is None:
+            reader_dh_pk = import_pk(reader_pk) if import_pk else reader_pk
+            context = CapabilityContext(reader_dh_pk, nonce)
+            contexts[reader_pk] = context
+        results.append(context.encode(claim_label, vrf_value))
+    return results
+
+
+def _chunks(items, chunk_size):
+    """Split an iterable into lists of ``chunk_size`` items (of all items
+    if ``chunk_size`` is ``None``)."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _map_chunks(executor, func, exported, nonce, items, chunk_size):
+    futures = [executor.submit(func, exported, nonce, chunk)
+               for chunk in _chunks(items, chunk_size)]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
+
+
+def encode_claims(nonce, claims, executor=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encode claims, possibly in parallel.
+
+    Results are in the order of the input. Apart from the randomness of
+    the VRF proofs, they are the same as of calling
+    :py:func:`claimchain.core.encode_claim_batch`.
+
+    :param bytes nonce: Nonce
+    :param list claims: List of ``(claim_label, claim_content)`` pairs
+    :param executor: ``concurrent.futures`` executor, e.g. a
+            ``ProcessPoolExecutor``. If ``None``, encode serially.
+    :param int chunk_size: Number of claims per task
+    :return: List of ``(vrf_value, lookup_key, enc_claim)`` tuples
+    """
+    claims = list(claims)
+    if executor is None or not claims:
+        return encode_claim_batch(nonce, claims)
+    return _map_chunks(executor, _encode_claims_chunk, export_params(),
+                       nonce, claims, chunk_size)
+
+
+def iter_encode_claims(nonce, claims, executor=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, batch_size=None):
+    """Encode claims a batch at a time.
+
+    Claims are consumed and encoded ``batch_size`` at a time, so that at
+    most one batch of encoded claims is held in memory if the results are
+    consumed as they come.
+
+    :param bytes nonce: Nonce
+    :param claims: Iterable of ``(claim_label, claim_content)`` pairs
+    :param executor: ``concurrent.futures`` executor. If ``None``, encode
+            serially.
+    :param int chunk_size: Number of claims per task
+    :param int batch_size: Number of claims per batch. By default, all
+            claims are encoded at once.
+    :return: Iterator over ``(vrf_value, lookup_key, enc_claim)`` tuples,
+             in the order of the input
+    """
+    for batch in _chunks(claims, batch_size):
+        for encoded in encode_claims(nonce, batch, executor, chunk_size):
+            yield encoded
+
+
+def encode_capabilities(nonce, grants, executor=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encode capabilities, possibly in parallel.
+
+    Results are in the order of the input.
+
+    :param bytes nonce: Nonce
+    :param list grants: List of ``(reader_dh_pk, claim_label, vrf_value)``
+            tuples
+    :param executor: ``concurrent.futures`` executor. If ``None``, encode
+            serially.
+    :param int chunk_size: Number of capabilities per task
+    :return: List of ``(lookup_key, enc_cap)`` pairs
+    """
+    grants = list(grants)
+    if executor is None or not grants:
+        return _encode_capabilities(nonce, grants)
+    # Uncompressed points are much cheaper to import than compressed ones
+    exported_pks = {}
+    exported_grants = []
+    for reader_dh_pk, claim_label, vrf_value in grants:
+        exported_pk = exported_pks.get(reader_dh_pk)
+        if exported_pk is None:
+            exported_pk = reader_dh_pk.export(POINT_CONVERSION_UNCOMPRESSED)
+            exported_pks[reader_dh_pk] = exported_pk
+        exported_grants.append((exported_pk, claim_label, vrf_value))
+    return _map_chunks(executor, _encode_capabilities_chunk, export_params(),
+                       nonce, exported_grants, chunk_size)
+
+
+def iter_encode_capabilities(nonce, grants, executor=None,
+                             chunk_size=DEFAULT_CHUNK_SIZE, batch_size=None):
+    """Encode capabilities a batch at a time.
+
+    See :py:func:`iter_encode_claims`.
+
+    :param bytes nonce: Nonce
+    :param grants: Iterable of ``(reader_dh_pk, claim_label, vrf_value)``
+            tuples
+    :param executor: ``concurrent.futures`` executor. If ``None``, encode
+            serially.
+    :param int chunk_size: Number of capabilities per task
+    :param int batch_size: Number of capabilities per batch. By default,
+            all capabilities are encoded at once.
+    :return: Iterator over ``(lookup_key, enc_cap)`` pairs, in the order
+             of the input
+    """
+    for batch in _chunks(grants, batch_size):
+        for encoded in encode_capabilities(nonce, batch, executor,
+                                           chunk_size):
+            yield encoded
@@ -5,12 +5,16 @@ High-level ClaimChain interface.
 
 import os
 import warnings
+import weakref
 from time import time
 from base64 import b64encode
 from hashlib import sha256
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
-from attr import attrs, attrib, asdict, Factory
+import msgpack
+from six.moves import zip
+from attr import attrs, attrib, Factory
+from petlib.pack import encode, decode
 from profiled import profiled
 
 from hippiehug import Chain
@@ -20,14 +24,27 @@ from .core import get_capability_lookup_key
 from .core import encode_capability, decode_capability
 from .core import encode_claim, decode_claim
 from .core import _compute_claim_key
+from .core import CapabilityContext
+from .core import _salt_label, _decrypt_claim
+from .parallel import encode_claims, encode_capabilities
+from .parallel import iter_encode_claims, iter_encode_capabilities
+from .history import ChainIndex
+from .instrumentation import counts_bytes, scope
 from .crypto import PublicParams, LocalParams
-from .crypto import sign, verify_signature
+from .crypto import sign
+from .crypto import compute_vrf_batch, verify_vrf, verify_vrf_batch
+from .crypto import compute_vrf_value
 from .utils import bytes2ascii, ascii2bytes, pet2ascii, ascii2pet
-from .utils import cached_property
-from .utils import Tree, Blob, ObjectStore
+from .utils import cached_property, LRUCache, ensure_binary
+from .utils import Tree, Blob, ObjectStore, VERIFY_ON_INGEST
+from .utils import encode_evidence_bundle, COMPRESSION_ZLIB
+from .utils.wrappers import _batch
 
 
-PROTOCOL_VERSION = 1
+#: Version of the payloads of new blocks. Payloads of version 1 are
+#: dictionaries of ASCII-encoded values. Payloads of version 2 are
+#: msgpack-encoded, with raw bytes and uncompressed points.
+PROTOCOL_VERSION = 2
 
 
 @attrs
@@ -45,6 +62,21 @@ class Metadata(object):
 class Payload(object):
     """Block payload.
 
+    Values are encoded according to the version: in version 1, hashes,
+    nonces, and keys are ASCII-encoded, and in version 2 they are raw
+    bytes and uncompressed points. Use :py:meth:`decode_mtr_hash`,
+    :py:meth:`decode_nonce`, and :py:meth:`decode_params` to read them
+    regardless of the version.
+
+    >>> with LocalParams.generate().as_default():
+    ...     payload = Payload.build(Tree(), b'nonce')
+    ...     parsed = Payload.parse(payload.serialize())
+    ...     params = parsed.decode_params()
+    >>> parsed == payload
+    True
+    >>> parsed.decode_nonce()
+    b'nonce'
+
     :param bytes mtr_hash: Hash of the Merkle tree root
     :param Metadata metadata: Block's metadata
     :param bytes nonce: Nonce
@@ -59,23 +91,27 @@ class Payload(object):
     version   = attrib(default=PROTOCOL_VERSION)
 
     @staticmethod
-    def build(tree, nonce, identity_info=None):
+    def build(tree, nonce, identity_info=None, version=PROTOCOL_VERSION):
         """Build a payload.
 
         :param tree: Tree object
         :param bytes nonce: Nonce
         :param identity_info: Owner's identity info (public key)
+        :param int version: Protocol version
         """
+        binary = version >= 2
+        encode_bytes = bytes if binary else bytes2ascii
         metadata = Metadata(
-                params=LocalParams.get_default().public_export(),
+                params=LocalParams.get_default().public_export(binary=binary),
                 identity_info=identity_info)
         if tree.root_hash is not None:
-            mtr_hash = bytes2ascii(tree.root_hash)
+            mtr_hash = encode_bytes(tree.root_hash)
         else:
             mtr_hash = None
         return Payload(metadata=metadata,
                        mtr_hash=mtr_hash,
-                       nonce=bytes2ascii(nonce))
+                       nonce=encode_bytes(nonce),
+                       version=version)
 
     @staticmethod
     def from_dict(exported):
@@ -88,26 +124,175 @@ class Payload(object):
         raw_payload['metadata'] = Metadata(**raw_metadata)
         return Payload(**raw_payload)
 
+    @staticmethod
+    def parse(item):
+        """Import payload from a block item of any version.
+
+        :param item: Block item, as made by :py:meth:`serialize`
+        """
+        if isinstance(item, bytes):
+            item = msgpack.unpackb(item, raw=False)
+        return Payload.from_dict(item)
+
     def export(self):
         """Export to dictionary."""
-        return asdict(self)
+        return {
+            'mtr_hash': self.mtr_hash,
+            'metadata': {
+                'params': dict(self.metadata.params),
+                'identity_info': self.metadata.identity_info,
+            },
+            'nonce': self.nonce,
+            'timestamp': self.timestamp,
+            'version': self.version,
+        }
+
+    def serialize(self):
+        """Export to a block item.
+
+        Payloads of version 2 are msgpack-encoded, and the ones of
+        version 1 are exported to dictionaries.
+        """
+        if self.version >= 2:
+            return msgpack.packb(self.export(), use_bin_type=True)
+        return self.export()
+
+    def decode_mtr_hash(self):
+        """Hash of the Merkle tree root as bytes, or ``None``."""
+        if self.mtr_hash is None or self.version >= 2:
+            return self.mtr_hash
+        return ascii2bytes(self.mtr_hash)
+
+    def decode_nonce(self):
+        """Nonce as bytes."""
+        if self.version >= 2:
+            return self.nonce
+        return ascii2bytes(self.nonce)
+
+    def decode_params(self):
+        """Owner's public keys.
+
+        :rtype: LocalParams
+        """
+        return LocalParams.from_dict(self.metadata.params,
+                                     binary=self.version >= 2)
 
 
 @profiled
-def _build_tree(store, enc_items_map):
-    if not isinstance(store, ObjectStore):
-        store = ObjectStore(store)
-    tree = Tree(store)
-    enc_blob_map = {key: Blob(enc_item)
-                    for key, enc_item in enc_items_map.items()
-                    if not isinstance(enc_item, Blob)}
-    tree.update(enc_blob_map)
+@counts_bytes('enc_items')
+def _build_tree(store, enc_items, root_hash=None, batch_size=None):
+    # The owner's own store is trusted: only check what is written
+    store = ObjectStore(store, verify=VERIFY_ON_INGEST)
+    tree = Tree(store, root_hash=root_hash)
+    tree.update(((key, enc_item if isinstance(enc_item, Blob)
+                       else Blob(enc_item))
+                 for key, enc_item in enc_items),
+                batch_size=batch_size)
     return tree
 
 
-def _sign_block(block):
+def _sign_block(block, version=PROTOCOL_VERSION):
     sig = sign(block.hash())
-    block.aux = pet2ascii(sig)
+    if version >= 2:
+        block.aux = encode(sig)
+    else:
+        block.aux = pet2ascii(sig)
+
+
+def _decode_signature(aux):
+    """Signature of a block of any version."""
+    if isinstance(aux, bytes):
+        return decode(aux)
+    return ascii2pet(aux)
+
+
+class OwnerIndex(object):
+    """
+    VRF values of the owner's claims, by nonce and claim label.
+
+    Lets the owner read their own claims in a :py:class:`View` without
+    computing VRFs. :py:meth:`State.commit` adds the values of every
+    commit to :py:attr:`State.owner_index`.
+
+    Only the values under the ``max_nonces`` most recently added nonces
+    are kept, by default the ones of the last commit. Reading older
+    blocks then falls back to computing the VRFs. Pass ``None`` to keep
+    the values of all commits.
+
+    The values are the keys to the claims, so the index has to be kept
+    as private as the state itself. Persist it alongside the state with
+    :py:meth:`serialize`, and load it with :py:meth:`parse`.
+
+    >>> index = OwnerIndex()
+    >>> index.add(b'nonce', {b'marios': b'value'})
+    >>> index.get(b'nonce', 'marios')
+    b'value'
+    >>> OwnerIndex.parse(index.serialize()).get(b'nonce', b'marios')
+    b'value'
+    >>> index.get(b'other nonce', b'marios') is None
+    True
+    >>> index.add(b'other nonce', {b'marios': b'other value'})
+    >>> index.get(b'nonce', b'marios') is None
+    True
+
+    :param int max_nonces: Number of nonces to keep the values of, or
+            ``None`` for all
+    """
+    def __init__(self, max_nonces=1):
+        self.max_nonces = max_nonces
+        self._vrf_values_by_nonce = OrderedDict()
+
+    def add(self, nonce, vrf_value_by_label):
+        """Add VRF values of claims under a nonce.
+
+        Drops the values under the least recently added nonces beyond
+        ``max_nonces``.
+
+        :param bytes nonce: Nonce
+        :param dict vrf_value_by_label: Mapping of claim labels to
+                exported VRF values
+        """
+        vrf_values = self._vrf_values_by_nonce.pop(nonce, {})
+        vrf_values.update((ensure_binary(claim_label), vrf_value)
+                          for claim_label, vrf_value
+                          in vrf_value_by_label.items())
+        self._vrf_values_by_nonce[nonce] = vrf_values
+        if self.max_nonces is not None:
+            while len(self._vrf_values_by_nonce) > self.max_nonces:
+                self._vrf_values_by_nonce.popitem(last=False)
+
+    def get(self, nonce, claim_label):
+        """Get VRF value of a claim under a nonce, or ``None``."""
+        vrf_values = self._vrf_values_by_nonce.get(nonce)
+        if vrf_values is None:
+            return None
+        return vrf_values.get(ensure_binary(claim_label))
+
+    def __len__(self):
+        return sum(len(vrf_values)
+                   for vrf_values in self._vrf_values_by_nonce.values())
+
+    def serialize(self):
+        """Encode the index with msgpack.
+
+        :rtype: bytes
+        """
+        # Pairs rather than maps, as map keys are bytes
+        return msgpack.packb(
+                [(nonce, list(vrf_values.items()))
+                 for nonce, vrf_values in self._vrf_values_by_nonce.items()],
+                use_bin_type=True)
+
+    @staticmethod
+    def parse(data, max_nonces=1):
+        """Decode an index encoded by :py:meth:`serialize`.
+
+        :param int max_nonces: See :py:class:`OwnerIndex`
+        """
+        index = OwnerIndex(max_nonces)
+        for nonce, vrf_values in msgpack.unpackb(data, raw=False):
+            index.add(nonce, dict(vrf_values))
+        return index
 
 
 class State(object):
@@ -125,6 +310,16 @@ class State(object):
         self._vrf_value_by_label = {}
         self._payload = None
         self._tree = None
+        self._tree_store = None
+        self._nonce = None
+
+        # Encodings from the last commit, reused by incremental commits
+        self._enc_claim_by_label = {}
+        self._enc_cap_by_grant = {}
+        self._dirty_labels = set()
+
+        #: VRF values of the committed claims, see :py:class:`OwnerIndex`
+        self.owner_index = OwnerIndex()
 
     @property
     def tree(self):
@@ -133,31 +328,112 @@ class State(object):
             raise ValueError('State not committed yet.')
         return self._tree
 
-    def commit(self, target_chain, tree_store=None, nonce=None):
+    @scope('State.commit')
+    def commit(self, target_chain, tree_store=None, nonce=None,
+               incremental=False, executor=None, batch_size=None):
         """Commit state to a chain.
 
         Constructs a new block and appends to a chain.
 
+        By default every commit uses a fresh nonce, so all claims and
+        capabilities are re-encoded. With ``incremental=True`` the nonce of
+        the previous commit is kept, and only the new claims and the
+        capabilities that changed since are encoded. Each claim is
+        encrypted with a random IV, so a changed claim is safely encoded
+        again under the same nonce. The Merkle tree is updated in place,
+        rewriting only the changed entries, unless entries were removed, in
+        which case it is rebuilt from the cached encodings. The encodings
+        are only kept by incremental commits, so the first commit of a state
+        that is going to be committed incrementally should be incremental
+        as well.
+
+        Reusing the nonce means that unchanged entries keep the same lookup
+        keys and ciphertexts across blocks, so an observer of the chain can
+        tell which entries did not change. A new nonce epoch is started by
+        passing a different ``nonce``, or by committing non-incrementally.
+
         :param hippiehug.Chain target_chain: Chain to which a block will be
                 appended.
         :param utils.ObjectStore tree_store: Object store to hold tree nodes.
         :param bytes nonce: Nonce to include in the new block.
+        :param bool incremental: Reuse the previous nonce and encodings.
+        :param executor: ``concurrent.futures`` executor, such as a
+                ``ProcessPoolExecutor``, to encode claims and capabilities
+                in parallel. See :py:mod:`claimchain.parallel`.
+        :param int batch_size: Number of claims and capabilities encoded
+                at a time, and of tree values and nodes per write to the
+                tree store. Bounds the memory a non-incremental commit
+                needs, apart from the lookup keys and the VRF values. By
+                default, everything is encoded and written at once.
         """
         if tree_store is None:
             tree_store = target_chain.store
-        self._nonce = nonce = \
-                nonce or os.urandom(PublicParams.get_default().nonce_size)
+        if incremental and nonce is None:
+            nonce = self._nonce
+        nonce = nonce or os.urandom(PublicParams.get_default().nonce_size)
+
+        if not incremental or nonce != self._nonce:
+            self._enc_claim_by_label.clear()
+            self._enc_cap_by_grant.clear()
+        for claim_label in self._dirty_labels:
+            self._enc_claim_by_label.pop(claim_label, None)
+        self._nonce = nonce
 
-        # Encode claims
-        enc_items_map = {}
         vrf_value_by_label = {}
-        for claim_label, claim_content in self._claim_content_by_label.items():
-            vrf_value, lookup_key, enc_claim = encode_claim(
-                    nonce, claim_label, claim_content)
-            enc_items_map[lookup_key] = enc_claim
-            vrf_value_by_label[claim_label] = vrf_value
+        if incremental:
+            enc_items_map = self._encode_incremental(
+                    nonce, executor, vrf_value_by_label)
+            enc_items = enc_items_map.items()
+        else:
+            # Encodings are not kept, so they are streamed into the tree
+            # a batch at a time
+            enc_items_map = {}
+            enc_items = self._iter_enc_items(
+                    nonce, executor, batch_size, vrf_value_by_label)
+
+        # Stores that support it send the tree nodes and the block in
+        # one batch
+        with _batch(tree_store), _batch(target_chain.store):
+            # Put all the encrypted items in a new tree, or write the new
+            # and changed items to the previous one if nothing was removed
+            prev_items_map = self._enc_items_map
+            if incremental and prev_items_map \
+                    and tree_store is self._tree_store \
+                    and all(key in enc_items_map for key in prev_items_map):
+                changed_items_map = {
+                        key: enc_item
+                        for key, enc_item in enc_items_map.items()
+                        if prev_items_map.get(key) is not enc_item}
+                tree = _build_tree(tree_store, changed_items_map.items(),
+                                   root_hash=self._tree.root_hash)
+            else:
+                tree = _build_tree(tree_store, enc_items,
+                                   batch_size=batch_size)
+
+            # Construct payload
+            payload = Payload.build(
+                    tree=tree,
+                    identity_info=self.identity_info,
+                    nonce=nonce,
+                    version=PROTOCOL_VERSION)
+            target_chain.multi_add(
+                    [payload.serialize()],
+                    pre_commit_fn=lambda block: _sign_block(
+                            block, payload.version))
+
+        self._payload = payload
+        self._tree = tree
+        self._tree_store = tree_store
+        self._enc_items_map = enc_items_map
+        self._vrf_value_by_label = vrf_value_by_label
+        self.owner_index.add(nonce, vrf_value_by_label)
+        self._dirty_labels.clear()
+
+        return target_chain.head
 
-        # Encode capabilities
+    def _iter_grants(self, vrf_value_by_label):
+        """Capabilities to commit, as ``(reader_dh_pk, claim_label,
+        vrf_value)`` tuples."""
         for reader_dh_pk, caps in self._caps_by_reader_pk.items():
             for claim_label in caps:
                 try:
@@ -167,26 +443,123 @@ class State(object):
                                   "Skipping adding a capability." \
                                   % claim_label)
                     break
-                lookup_key, enc_cap = encode_capability(
-                        reader_dh_pk, nonce, claim_label, vrf_value)
-                enc_items_map[lookup_key] = enc_cap
+                yield reader_dh_pk, claim_label, vrf_value
 
-        # Put all the encrypted items in a new tree
-        tree = _build_tree(tree_store, enc_items_map)
+    def _iter_enc_items(self, nonce, executor, batch_size,
+                        vrf_value_by_label):
+        """Encode all claims and capabilities ``batch_size`` at a time.
 
-        # Construct payload
-        payload = Payload.build(
-                tree=tree,
-                identity_info=self.identity_info,
-                nonce=nonce)
-        target_chain.multi_add([payload.export()], pre_commit_fn=_sign_block)
+        Fills ``vrf_value_by_label`` as claims are encoded.
 
-        self._payload = payload
-        self._tree = tree
-        self._enc_items_map = enc_items_map
-        self._vrf_value_by_label = vrf_value_by_label
+        :return: Iterator over ``(lookup_key, enc_item)`` pairs
+        """
+        claims = list(self._claim_content_by_label.items())
+        encoded_claims = iter_encode_claims(
+                nonce, claims, executor, batch_size=batch_size)
+        for (claim_label, _), (vrf_value, lookup_key, enc_claim) in \
+                zip(claims, encoded_claims):
+            vrf_value_by_label[claim_label] = vrf_value
+            yield lookup_key, enc_claim
+        del claims
 
-        return target_chain.head
+        # Capabilities need the VRF values of all claims
+        encoded_caps = iter_encode_capabilities(
+                nonce, self._iter_grants(vrf_value_by_label), executor,
+                batch_size=batch_size)
+        for lookup_key, enc_cap in encoded_caps:
+            yield lookup_key, enc_cap
+
+    def _encode_incremental(self, nonce, executor, vrf_value_by_label):
+        """Encode the claims and capabilities that are not cached yet.
+
+        Fills ``vrf_value_by_label``, and keeps the encodings of the
+        committed claims and capabilities for the next commit.
+
+        :return: Dictionary mapping the lookup keys to the encoded items
+        """
+        pending_claims = [
+                (claim_label, claim_content)
+                for claim_label, claim_content
+                in self._claim_content_by_label.items()
+                if claim_label not in self._enc_claim_by_label]
+        # Ciphertexts are kept as blobs, so that the tree and in-memory
+        # stores share them instead of holding copies. The encoder output
+        # is dropped as soon as it is wrapped.
+        encoded_claims = encode_claims(nonce, pending_claims, executor)
+        for (claim_label, _), (vrf_value, lookup_key, enc_claim) in \
+                zip(pending_claims, encoded_claims):
+            self._enc_claim_by_label[claim_label] = \
+                    (vrf_value, lookup_key, Blob(enc_claim))
+        del encoded_claims
+
+        enc_items_map = {}
+        enc_claim_by_label = {}
+        for claim_label in self._claim_content_by_label:
+            encoded = self._enc_claim_by_label[claim_label]
+            vrf_value, lookup_key, enc_claim = encoded
+            enc_items_map[lookup_key] = enc_claim
+            vrf_value_by_label[claim_label] = vrf_value
+            enc_claim_by_label[claim_label] = encoded
+
+        grants = []
+        pending_grants = []
+        for reader_dh_pk, claim_label, vrf_value in \
+                self._iter_grants(vrf_value_by_label):
+            grant = (reader_dh_pk, claim_label)
+            grants.append(grant)
+            if grant not in self._enc_cap_by_grant:
+                pending_grants.append((reader_dh_pk, claim_label, vrf_value))
+        encoded_caps = encode_capabilities(nonce, pending_grants, executor)
+        for (reader_dh_pk, claim_label, _), (lookup_key, enc_cap) in \
+                zip(pending_grants, encoded_caps):
+            self._enc_cap_by_grant[(reader_dh_pk, claim_label)] = \
+                    (lookup_key, Blob(enc_cap))
+        del encoded_caps
+
+        enc_cap_by_grant = {}
+        for grant in grants:
+            encoded = self._enc_cap_by_grant[grant]
+            lookup_key, enc_cap = encoded
+            enc_items_map[lookup_key] = enc_cap
+            enc_cap_by_grant[grant] = encoded
+
+        # Only the encodings of what is committed are kept
+        self._enc_claim_by_label = enc_claim_by_label
+        self._enc_cap_by_grant = enc_cap_by_grant
+        return enc_items_map
+
+    def commit_async(self, target_chain, tree_store=None, nonce=None,
+                     incremental=False, executor=None, thread_executor=None):
+        """Commit state to a chain in asynchronous storage.
+
+        Coroutine version of :py:meth:`commit`, for chains and trees in
+        an :py:class:`claimchain.aio.AsyncObjectStore`. The commit runs
+        in an executor. Tree nodes it reads from the store are fetched
+        through the event loop, and everything it writes is sent to the
+        store in one batch at the end.
+
+        Afterwards, :py:attr:`tree` reads from the asynchronous store,
+        and can not be used from the event loop thread.
+
+        Requires Python 3.5 or later.
+
+        :param hippiehug.Chain target_chain: Chain over an
+                ``AsyncObjectStore``, to which a block will be appended.
+        :param tree_store: ``AsyncObjectStore`` to hold tree nodes. By
+                default, the store of the chain.
+        :param bytes nonce: Nonce to include in the new block.
+        :param bool incremental: Reuse the previous nonce and encodings.
+        :param executor: ``concurrent.futures`` executor to encode claims
+                and capabilities in, as in :py:meth:`commit`.
+        :param thread_executor: ``concurrent.futures`` executor with
+                threads, to run the commit in. By default, the default
+                executor of the event loop.
+        """
+        from .aio import commit_async
+        return commit_async(self, target_chain, tree_store=tree_store,
+                            nonce=nonce, incremental=incremental,
+                            executor=executor,
+                            thread_executor=thread_executor)
 
     def compute_evidence_keys(self, reader_dh_pk, claim_label):
         """List hashes of all nodes that prove inclusion of a claim label.
@@ -215,6 +588,56 @@ class State(object):
         except KeyError:
             return set()
 
+    def _evidence_lookup_keys(self, reader_label_pairs):
+        labels_by_reader_pk = defaultdict(set)
+        for reader_dh_pk, claim_label in reader_label_pairs:
+            if claim_label in self._vrf_value_by_label:
+                labels_by_reader_pk[reader_dh_pk].add(claim_label)
+
+        lookup_keys = set()
+        claim_labels = set()
+        for reader_dh_pk, reader_labels in labels_by_reader_pk.items():
+            context = CapabilityContext(reader_dh_pk, self._nonce)
+            for claim_label in reader_labels:
+                lookup_keys.add(context.lookup_key(claim_label))
+            claim_labels |= reader_labels
+        for claim_label in claim_labels:
+            lookup_keys.add(_compute_claim_key(
+                    self._vrf_value_by_label[claim_label], mode='lookup'))
+        return lookup_keys
+
+    def compute_evidence_keys_bulk(self, reader_label_pairs):
+        """List hashes of all nodes that prove inclusion of many claims.
+
+        Same as the union of :py:meth:`compute_evidence_keys` over all
+        pairs, but walks the tree once, so that the cost grows with the
+        number of distinct nodes rather than the number of paths.
+
+        :param reader_label_pairs: Iterable of ``(reader_dh_pk,
+                claim_label)`` pairs
+        """
+        lookup_keys = self._evidence_lookup_keys(reader_label_pairs)
+        _, nodes, leaves = self.tree.evidence_many(lookup_keys)
+        return {node.hid for node in nodes} | \
+               {leaf.item for leaf in leaves.values()}
+
+    def compute_evidence_bundle(self, reader_label_pairs,
+                                compression=COMPRESSION_ZLIB):
+        """Pack proofs of inclusion of many claims into a bundle.
+
+        Readers check the bundle with
+        :py:func:`utils.verify_evidence_bundle`, and can pass the result
+        as the source tree of a :py:class:`View`.
+
+        :param reader_label_pairs: Iterable of ``(reader_dh_pk,
+                claim_label)`` pairs
+        :param str compression: Compression, see
+                :py:func:`utils.encode_evidence_bundle`
+        :rtype: bytes
+        """
+        lookup_keys = self._evidence_lookup_keys(reader_label_pairs)
+        return encode_evidence_bundle(self.tree, lookup_keys, compression)
+
     def clear(self):
         """Clear buffer."""
         self._claim_content_by_label.clear()
@@ -222,8 +645,14 @@ class State(object):
 
         self._enc_items_map.clear()
         self._vrf_value_by_label.clear()
+        self._enc_claim_by_label.clear()
+        self._enc_cap_by_grant.clear()
+        self._dirty_labels.clear()
         self._payload = None
         self._tree = None
+        self._tree_store = None
+        self._nonce = None
+        self.owner_index = OwnerIndex(self.owner_index.max_nonces)
 
     def __getitem__(self, label):
         """Get queued claim by label.
@@ -239,6 +668,7 @@ class State(object):
         :param bytes claim_content: Claim content
         """
         self._claim_content_by_label[claim_label] = claim_content
+        self._dirty_labels.add(claim_label)
 
     def grant_access(self, reader_dh_pk, claim_labels):
         """Grant access for given claims a reader.
@@ -264,24 +694,211 @@ class State(object):
         return list(self._caps_by_reader_pk[reader_dh_pk])
 
 
+# Steps of reading many claims, shared by View and aio.AsyncView. Every
+# step but the lookups in the tree is pure computation.
+
+def _own_claim_keys(nonce, claim_labels, owner_index=None):
+    claim_keys = {}
+    for claim_label in claim_labels:
+        vrf_value = None
+        if owner_index is not None:
+            vrf_value = owner_index.get(nonce, claim_label)
+        if vrf_value is None:
+            vrf_value = compute_vrf_value(_salt_label(nonce, claim_label))
+        claim_keys[claim_label] = (
+                vrf_value, _compute_claim_key(vrf_value, mode='lookup'))
+    return claim_keys
+
+
+def _capability_lookup_keys(owner_dh_pk, nonce, claim_labels):
+    context = CapabilityContext(owner_dh_pk, nonce)
+    return context, {claim_label: context.lookup_key(claim_label)
+                     for claim_label in claim_labels}
+
+
+def _open_capabilities(context, cap_lookup_keys, caps, results):
+    claim_keys = {}
+    for claim_label, cap_lookup_key in cap_lookup_keys.items():
+        if cap_lookup_key not in caps:
+            results[claim_label] = KeyError(
+                    "Label does not exist or you don't have "
+                    "permission to read.")
+            continue
+        try:
+            claim_keys[claim_label] = context.decode(
+                    claim_label, caps[cap_lookup_key])
+        except Exception as e:
+            results[claim_label] = e
+    return claim_keys
+
+
+def _verify_vrf(owner_vrf_pk, vrf, salted_label):
+    try:
+        return verify_vrf(owner_vrf_pk, vrf, salted_label)
+    except Exception:
+        return False
+
+
+def _open_claims(owner_vrf_pk, nonce, claim_keys, enc_claims, results,
+                 verify=True):
+    # The owner computed the VRF values, so their proofs need no check
+    decrypted = []
+    for claim_label, (vrf_value, claim_lookup_key) in claim_keys.items():
+        if claim_lookup_key not in enc_claims:
+            results[claim_label] = KeyError(
+                    "Claim not found, but permission to read the label "
+                    "exists.")
+            continue
+        try:
+            vrf, claim_content = _decrypt_claim(
+                    vrf_value, enc_claims[claim_lookup_key])
+        except Exception as e:
+            results[claim_label] = e
+            continue
+        if verify:
+            decrypted.append((claim_label, vrf, claim_content))
+        else:
+            results[claim_label] = claim_content
+
+    vrfs = [vrf for _, vrf, _ in decrypted]
+    salted_labels = [_salt_label(nonce, claim_label)
+                     for claim_label, _, _ in decrypted]
+    try:
+        valid = verify_vrf_batch(owner_vrf_pk, vrfs, salted_labels)
+    except Exception:
+        # Some proof is malformed. Find out which one
+        valid = [_verify_vrf(owner_vrf_pk, vrf, salted_label)
+                 for vrf, salted_label in zip(vrfs, salted_labels)]
+    for (claim_label, _, claim_content), is_valid in zip(decrypted, valid):
+        if is_valid:
+            results[claim_label] = claim_content
+        else:
+            results[claim_label] = Exception("Wrong VRF value")
+
+
+class _ChainHead(object):
+    """Parsed head block of a chain, shared by all views of the head.
+
+    Holds no reference to the store, so that cached heads do not keep
+    stores alive.
+    """
+
+    def __init__(self, head, block):
+        self.head = head
+        self.block = block
+        self.payload = Payload.parse(self.block.items[0])
+        self.nonce = self.payload.decode_nonce()
+        self.mtr_hash = self.payload.decode_mtr_hash()
+
+    @cached_property
+    def params(self):
+        return self.payload.decode_params()
+
+
+def _store_ref(store):
+    try:
+        return weakref.ref(store)
+    except TypeError:
+        # Builtin containers, such as dicts, can not be weakly referenced
+        return None
+
+
+class ViewCache(object):
+    """
+    Bounded cache of parsed chain heads.
+
+    Views of the same head of the same chain store share the parsed
+    payload and owner's parameters, so that only the first view parses
+    them. Stores are only weakly referenced.
+
+    :param int maxsize: Maximum number of heads. Zero disables caching.
+    """
+    def __init__(self, maxsize=256):
+        self._heads = LRUCache(maxsize=maxsize)
+
+    def get(self, chain):
+        """Get parsed head of a chain.
+
+        :param hippiehug.Chain chain: Chain
+        """
+        chain_head = self._lookup(chain.store, chain.head)
+        if chain_head is None:
+            chain_head = _ChainHead(chain.head, chain.store[chain.head])
+            self._insert(chain.store, chain_head)
+        return chain_head
+
+    def _lookup(self, store, head):
+        entry = self._heads.get((id(store), head))
+        if entry is None:
+            return None
+        # The id of a collected store can be reused by a new one
+        store_ref, chain_head = entry
+        if store_ref is not None:
+            if store_ref() is store:
+                return chain_head
+            return None
+        # Without a weak reference, check that the store holds the block
+        try:
+            if store[head] is chain_head.block:
+                return chain_head
+        except KeyError:
+            pass
+
+    def _insert(self, store, chain_head):
+        self._heads[(id(store), chain_head.head)] = \
+                (_store_ref(store), chain_head)
+
+    def stats(self):
+        """Cache statistics, see :py:meth:`utils.LRUCache.stats`."""
+        return self._heads.stats()
+
+    def clear(self):
+        """Empty the cache and reset statistics."""
+        self._heads.clear()
+
+
+#: Process-wide cache of parsed chain heads, used by views by default.
+#: Inspect ``view_cache.stats()`` for hit rates.
+view_cache = ViewCache()
+
+
 class View(object):
     """View of an existing ClaimChain."""
 
-    def __init__(self, source_chain, source_tree=None):
+    @scope('View')
+    def __init__(self, source_chain, source_tree=None, cache=None,
+                 chain_index=None, owner_index=None, validator=None):
         """
         :param hippiehug.Chain source_chain: Chain to view
         :param utils.Tree source_tree: Tree object if available
+        :param ViewCache cache: Cache of parsed heads. By default,
+                the process-wide :py:data:`view_cache`
+        :param ChainIndex chain_index: Index of the chain, for
+                :py:meth:`at`. By default, built on first use.
+        :param OwnerIndex owner_index: VRF values of the owner's claims,
+                such as :py:attr:`State.owner_index`, for the owner to
+                look up their own claims without computing VRFs.
+        :param validation.ChainValidator validator: Validator of the
+                chain store, for :py:meth:`validate`. By default, built on
+                first use.
         """
+        if cache is None:
+            cache = view_cache
         self._viewer_params = LocalParams.get_default()
+        self._cache = cache
         self.chain = source_chain
-        self._latest_block = self.chain.store[self.chain.head]
-        self._nonce = ascii2bytes(self.payload.nonce)
-        if self.payload.mtr_hash is not None:
+        self.chain_index = chain_index
+        self.owner_index = owner_index
+        self.validator = validator
+        self._chain_head = cache.get(source_chain)
+        self._latest_block = self._chain_head.block
+        self._nonce = self._chain_head.nonce
+        if self._chain_head.mtr_hash is not None:
             self.tree = source_tree or Tree(
-                    object_store=ObjectStore(self.chain.store),
-                    root_hash=ascii2bytes(self.payload.mtr_hash))
+                    object_store=ObjectStore(source_chain.store),
+                    root_hash=self._chain_head.mtr_hash)
 
-            if ascii2bytes(self.payload.mtr_hash) != self.tree.root_hash:
+            if self._chain_head.mtr_hash != self.tree.root_hash:
                 raise ValueError("Supplied tree doesn't match MTR in the chain.")
 
     @property
@@ -289,35 +906,69 @@ class View(object):
         """Chain's head (latest block hash)."""
         return self.chain.head
 
-    @cached_property
+    @property
     def payload(self):
         """Chain's latest block payload."""
-        return Payload.from_dict(self._latest_block.items[0])
+        return self._chain_head.payload
 
-    @cached_property
+    @property
     def params(self):
         """Cryptographic params of the chain owner."""
-        return LocalParams.from_dict(self.payload.metadata.params)
-
-    # TODO: This validation is incorrect for any block but the genesis
-    def validate(self):
-        """Validate the chain.
-
-        .. note ::
-            Don't use this method. It is broken. ¯\\_(ツ)_/¯
+        return self._chain_head.params
+
+    def at(self, index=None, timestamp=None):
+        """View of the chain as of an earlier block.
+
+        The block is found through :py:attr:`chain_index`, which is
+        extended up to the viewed head if needed. Parsed payloads of the
+        blocks are kept in the cache of parsed heads, like the ones of
+        other views.
+
+        :param int index: Index of the block
+        :param timestamp: Unix-format timestamp. The view is of the
+                latest block committed by then.
+        :rtype: View
+        :raises IndexError: If there is no block with the index in the
+                viewed chain
+        :raises KeyError: If no block was committed by the timestamp
+        """
+        if (index is None) == (timestamp is None):
+            raise ValueError('Specify either index or timestamp.')
+        if self.chain_index is None:
+            self.chain_index = ChainIndex(self.chain.store)
+        head_index = self._latest_block.index
+        if len(self.chain_index) <= head_index or \
+                self.chain_index.block_hash(head_index) != self.head:
+            self.chain_index.update(self.head)
+
+        if timestamp is not None:
+            index = self.chain_index.index_at(timestamp, end=head_index + 1)
+        elif not 0 <= index <= head_index:
+            raise IndexError('Block %d is not in the chain.' % index)
+        block_hash = self.chain_index.block_hash(index)
+        return View(Chain(self.chain.store, root_hash=block_hash),
+                    cache=self._cache, chain_index=self.chain_index,
+                    owner_index=self.owner_index)
+
+    def validate(self, executor=None):
+        """Validate the chain up to the viewed head.
+
+        See :py:class:`claimchain.validation.ChainValidator`. The validator
+        is kept in :py:attr:`validator`, so that validating again only
+        checks the blocks added since.
+
+        :param executor: ``concurrent.futures`` executor to verify
+                signatures in.
+        :raises ValueError: If the chain is not valid
         """
-        owner_sig_pk = self.params.sig.pk
-        raw_sig_backup = self._latest_block.aux
-        sig = ascii2pet(raw_sig_backup)
-        self._latest_block.aux = None
-        if not verify_signature(owner_sig_pk, sig, self._latest_block.hash()):
-            self._latest_block.aux = raw_sig_backup
-            raise ValueError("Invalid signature.")
-        self._latest_block.aux = raw_sig_backup
+        if self.validator is None:
+            from .validation import ChainValidator
+            self.validator = ChainValidator(self.chain.store)
+        self.validator.validate(self.head, executor=executor)
 
     def _lookup_capability(self, claim_label):
-        cap_lookup_key = get_capability_lookup_key(
-                self.params.dh.pk, self._nonce, claim_label)
+        context = CapabilityContext(self.params.dh.pk, self._nonce)
+        cap_lookup_key = context.lookup_key(claim_label)
         try:
             cap = self.tree[cap_lookup_key]
         except KeyError:
@@ -325,10 +976,10 @@ class View(object):
                            "permission to read.")
         except AttributeError:
             raise ValueError("The chain does not have a claim map.")
-        return decode_capability(self.params.dh.pk, self._nonce,
-                                 claim_label, cap)
+        return context.decode(claim_label, cap)
 
-    def _lookup_claim(self, claim_label, vrf_value, claim_lookup_key):
+    def _lookup_claim(self, claim_label, vrf_value, claim_lookup_key,
+                      verify=True):
         try:
             enc_claim = self.tree[claim_lookup_key]
         except KeyError:
@@ -336,24 +987,82 @@ class View(object):
                            "exists.")
         except AttributeError:
             raise ValueError("The chain does not have a claim map.")
+        if not verify:
+            _, claim_content = _decrypt_claim(vrf_value, enc_claim)
+            return claim_content
         return decode_claim(self.params.vrf.pk, self._nonce,
                             claim_label, vrf_value, enc_claim)
 
+    def _is_owner(self):
+        return self._viewer_params.vrf.pk == self.params.vrf.pk
+
+    @scope('View.__getitem__')
     def __getitem__(self, claim_label):
         """Get claim by label.
 
+        The owner of the chain gets the VRF values of their claims from
+        :py:attr:`owner_index` if it has them, and otherwise computes
+        them without proofs.
+
         :param bytes claim_label: Claim label
         :raises: ``KeyError`` if claim not found or not accessible
         """
-        if self._viewer_params.vrf.pk == self.params.vrf.pk:
-            vrf_value, claim_lookup_key, enc_claim = encode_claim(
-                    self._nonce, claim_label, "")
-            claim = self._lookup_claim(claim_label, vrf_value, claim_lookup_key)
+        if self._is_owner():
+            vrf_value, claim_lookup_key = _own_claim_keys(
+                    self._nonce, [claim_label], self.owner_index)[claim_label]
+            claim = self._lookup_claim(claim_label, vrf_value,
+                                       claim_lookup_key, verify=False)
         else:
             vrf_value, claim_lookup_key = self._lookup_capability(claim_label)
             claim = self._lookup_claim(claim_label, vrf_value, claim_lookup_key)
         return claim
 
+    @scope('View.get_many')
+    def get_many(self, claim_labels):
+        """Get many claims by label.
+
+        Same as getting every label with :py:meth:`__getitem__`, but
+        computes the shared secret once, looks up all capabilities and
+        then all claims in a single walk of the tree each, and verifies
+        the VRFs as a batch.
+
+        :param claim_labels: Iterable of claim labels
+        :return: Dictionary mapping every label to its claim, or to the
+                 exception that :py:meth:`__getitem__` would raise
+        """
+        claim_labels = list(claim_labels)
+        if not hasattr(self, 'tree'):
+            error = ValueError("The chain does not have a claim map.")
+            return {claim_label: error for claim_label in claim_labels}
+
+        results = {}
+        is_owner = self._is_owner()
+        if is_owner:
+            claim_keys = _own_claim_keys(self._nonce, claim_labels,
+                                         self.owner_index)
+        else:
+            context, cap_lookup_keys = _capability_lookup_keys(
+                    self.params.dh.pk, self._nonce, claim_labels)
+            caps = self._get_many_from_tree(cap_lookup_keys.values())
+            claim_keys = _open_capabilities(
+                    context, cap_lookup_keys, caps, results)
+        enc_claims = self._get_many_from_tree(
+                claim_lookup_key for _, claim_lookup_key in claim_keys.values())
+        _open_claims(self.params.vrf.pk, self._nonce, claim_keys, enc_claims,
+                     results, verify=not is_owner)
+        return results
+
+    def _get_many_from_tree(self, lookup_keys):
+        if hasattr(self.tree, 'get_many'):
+            return self.tree.get_many(lookup_keys)
+        values = {}
+        for lookup_key in lookup_keys:
+            try:
+                values[lookup_key] = self.tree[lookup_key]
+            except KeyError:
+                pass
+        return values
+
     def get(self, claim_label):
         """Get claim by label.
 
@@ -1,3 +1,7 @@
 from .misc import *
 from .encodings import *
 from .wrappers import *
+from .filestore import *
+from .evidence import *
+from .redisstore import *
+from .nodecache import *
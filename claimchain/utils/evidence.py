@@ -0,0 +1,269 @@
+"""
+Compact bundles of inclusion proofs against a single tree root.
+
+A bundle packs the union of the paths to many lookup keys as a table of
+nodes. Every node is shipped once, children before their parents, and
+branches refer to shipped children by their position in the table.
+Hashes are only shipped for subtrees that are not part of any path.
+
+The format is a header, followed by a (possibly compressed) stream of
+msgpack objects: the root hash, and then the node table entries, the
+last of which is the root::
+
+    [0, key, value]                 Leaf, with the value it commits to
+    [1, key, item_hash]             Leaf, with only the hash of the value
+    [2, pivot, left_ref, right_ref] Branch
+
+where a reference is either an ``int`` index into the table, or the
+``bytes`` hash of a subtree that is not included.
+"""
+
+import zlib
+from itertools import chain
+
+import msgpack
+import hippiehug
+
+from .encodings import ensure_binary
+from .wrappers import Blob
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+__all__ = ['COMPRESSION_NONE', 'COMPRESSION_ZLIB', 'COMPRESSION_ZSTD',
+           'encode_evidence_bundle', 'verify_evidence_bundle',
+           'VerifiedEvidence']
+
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_ZSTD = 'zstd'
+
+_MAGIC = b'CCEV\x01'
+_COMPRESSION_CODES = {
+    COMPRESSION_NONE: b'\x00',
+    COMPRESSION_ZLIB: b'\x01',
+    COMPRESSION_ZSTD: b'\x02',
+}
+_HEADER_SIZE = len(_MAGIC) + 1
+
+_LEAF = 0
+_LEAF_HASH = 1
+_BRANCH = 2
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def _compressor(compression):
+    if compression == COMPRESSION_NONE:
+        return None
+    elif compression == COMPRESSION_ZLIB:
+        return zlib.compressobj(9)
+    elif compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError('zstd compression requires zstandard.')
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError('Unknown compression: %s' % compression)
+
+
+def _decompressor(code):
+    if code == _COMPRESSION_CODES[COMPRESSION_NONE]:
+        return None
+    elif code == _COMPRESSION_CODES[COMPRESSION_ZLIB]:
+        return zlib.decompressobj()
+    elif code == _COMPRESSION_CODES[COMPRESSION_ZSTD]:
+        if zstandard is None:
+            raise ValueError('zstd compression requires zstandard.')
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError('Unknown compression code: %r' % code)
+
+
+def encode_evidence_bundle(tree, lookup_keys, compression=COMPRESSION_ZLIB):
+    """
+    Pack inclusion proofs for many lookup keys into a bundle.
+
+    Values are shipped for leaves holding the requested keys. Keys that
+    are not in the tree are skipped.
+
+    :param utils.Tree tree: Tree
+    :param lookup_keys: Iterable of lookup keys
+    :param str compression: One of :py:data:`COMPRESSION_NONE`,
+            :py:data:`COMPRESSION_ZLIB`, and :py:data:`COMPRESSION_ZSTD`
+    :rtype: bytes
+    """
+    lookup_keys = {ensure_binary(key) for key in lookup_keys}
+    compressor = _compressor(compression)
+    root_hash, nodes, _ = tree.evidence_many(lookup_keys)
+
+    # Nodes come parents first; ship them children first
+    index_by_hash = {}
+    packer = msgpack.Packer(use_bin_type=True)
+    chunks = [packer.pack(root_hash)]
+    for node in reversed(nodes):
+        if isinstance(node, hippiehug.Nodes.Branch):
+            entry = [_BRANCH, node.pivot,
+                     index_by_hash.get(node.left_branch, node.left_branch),
+                     index_by_hash.get(node.right_branch, node.right_branch)]
+        elif node.key in lookup_keys:
+            entry = [_LEAF, node.key, bytes(tree.object_store[node.item])]
+        else:
+            entry = [_LEAF_HASH, node.key, node.item]
+        index_by_hash[node.hid] = len(index_by_hash)
+        chunks.append(packer.pack(entry))
+
+    body = b''.join(chunks)
+    if compressor is not None:
+        body = compressor.compress(body) + compressor.flush()
+    return _MAGIC + _COMPRESSION_CODES[compression] + body
+
+
+class VerifiedEvidence(object):
+    """
+    Values proven to be in a tree with a given root.
+
+    Can be used in place of a :py:class:`utils.Tree` as the source
+    tree of a :py:class:`claimchain.View`.
+    """
+    def __init__(self, root_hash, values):
+        self.root_hash = root_hash
+        self._values = values
+
+    def __getitem__(self, lookup_key):
+        return self._values[ensure_binary(lookup_key)]
+
+    def __contains__(self, lookup_key):
+        return ensure_binary(lookup_key) in self._values
+
+    def get_many(self, lookup_keys):
+        values = {}
+        for lookup_key in lookup_keys:
+            lookup_key = ensure_binary(lookup_key)
+            if lookup_key in self._values:
+                values[lookup_key] = self._values[lookup_key]
+        return values
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return self._values.keys()
+
+    def items(self):
+        return self._values.items()
+
+
+def _iter_chunks(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield bytes(source)
+        return
+    while True:
+        chunk = source.read(_READ_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_objects(source):
+    chunks = _iter_chunks(source)
+    header = b''
+    for chunk in chunks:
+        header += chunk
+        if len(header) >= _HEADER_SIZE:
+            break
+    if header[:len(_MAGIC)] != _MAGIC or len(header) < _HEADER_SIZE:
+        raise ValueError('Not an evidence bundle.')
+    decompressor = _decompressor(header[len(_MAGIC):_HEADER_SIZE])
+
+    unpacker = msgpack.Unpacker(raw=False)
+    for chunk in chain([header[_HEADER_SIZE:]], chunks, [None]):
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk) if chunk is not None \
+                    else decompressor.flush()
+        if chunk:
+            unpacker.feed(chunk)
+        for obj in unpacker:
+            yield obj
+
+
+def _check_child(ref, index, referenced):
+    if isinstance(ref, bytes):
+        return None
+    if not 0 <= ref < index or referenced[ref]:
+        raise ValueError('Invalid node reference.')
+    referenced[ref] = True
+    return ref
+
+
+def verify_evidence_bundle(source, root_hash):
+    """
+    Check a bundle against a root hash, without building a tree.
+
+    The bundle is read and decompressed incrementally. Every node is
+    hashed once. Apart from the values, only the hash and the key range
+    of every node are kept in memory.
+
+    The bundle is rejected unless its nodes form a single subtree
+    hanging from the root, and the leaves lie on the search paths of
+    their keys.
+
+    :param source: Bundle as bytes, or a binary file-like object
+    :param bytes root_hash: Expected root hash
+    :rtype: VerifiedEvidence
+    :raises ValueError: If the bundle is malformed or does not match
+    """
+    objects = _iter_objects(source)
+    if next(objects, None) != root_hash:
+        raise ValueError('Evidence is for a different root.')
+
+    # Per node: hash, and smallest and largest key of the included leaves
+    hashes = []
+    key_ranges = []
+    referenced = []
+    values = {}
+    for entry in objects:
+        try:
+            node, key_range = _verify_entry(
+                    entry, hashes, key_ranges, referenced, values)
+        except (TypeError, IndexError, AssertionError):
+            raise ValueError('Malformed node: %r' % (entry,))
+        hashes.append(node.hid)
+        key_ranges.append(key_range)
+        referenced.append(False)
+
+    if not hashes or hashes[-1] != root_hash or not all(referenced[:-1]):
+        raise ValueError('Evidence does not match the root.')
+    return VerifiedEvidence(root_hash, values)
+
+
+def _verify_entry(entry, hashes, key_ranges, referenced, values):
+    index = len(hashes)
+    kind = entry[0]
+    if kind == _LEAF or kind == _LEAF_HASH:
+        _, key, data = entry
+        if kind == _LEAF:
+            value = Blob(data)
+            values[key] = value
+            data = value.hid
+        node = hippiehug.Nodes.Leaf(data, key)
+        key_range = (key, key)
+    elif kind == _BRANCH:
+        _, pivot, left_ref, right_ref = entry
+        left = _check_child(left_ref, index, referenced)
+        right = _check_child(right_ref, index, referenced)
+        left_range = key_ranges[left] if left is not None else None
+        right_range = key_ranges[right] if right is not None else None
+        if left_range is not None and left_range[1] > pivot or \
+                right_range is not None and right_range[0] <= pivot:
+            raise ValueError('Leaf is not on the search path of its key.')
+        node = hippiehug.Nodes.Branch(
+                pivot,
+                hashes[left] if left is not None else left_ref,
+                hashes[right] if right is not None else right_ref)
+        ranges = [r for r in (left_range, right_range) if r is not None]
+        key_range = (ranges[0][0], ranges[-1][1]) if ranges else None
+    else:
+        raise ValueError('Unknown node type: %r' % kind)
+    return node, key_range
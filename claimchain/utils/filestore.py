@@ -0,0 +1,474 @@
+"""
+Append-only, file-backed object store.
+"""
+
+import os
+import mmap
+import shutil
+import struct
+import threading
+import zlib
+
+import hippiehug
+from hippiehug.Utils import binary_hash
+from petlib.pack import encode, decode
+
+from .wrappers import Blob, serialize_object
+
+
+LOG_FILENAME = 'objects.log'
+INDEX_FILENAME = 'objects.idx'
+
+# Record: body length, CRC32 of body; body: type, key length, key, payload
+_RECORD_HEADER = struct.Struct('>II')
+_RECORD_PREFIX = struct.Struct('>cH')
+
+# Index: magic, capacity, number of keys, indexed log size, dirty flag;
+# followed by slots of (key tag, record offset + 1), zero for empty slots
+_INDEX_HEADER = struct.Struct('>8sQQQQ')
+_INDEX_SLOT = struct.Struct('>QQ')
+_INDEX_MAGIC = b'CCIDX001'
+_MAX_LOAD = 0.6
+_KEY_TAG = struct.Struct('>Q')
+
+_BLOB = b'O'
+_LEAF = b'L'
+_BRANCH = b'N'
+_BLOCK = b'K'
+
+
+def _pack_object(obj):
+    if isinstance(obj, hippiehug.Nodes.Leaf):
+        return _LEAF, encode(serialize_object(obj))
+    elif isinstance(obj, hippiehug.Nodes.Branch):
+        return _BRANCH, encode(serialize_object(obj))
+    elif isinstance(obj, hippiehug.Block):
+        return _BLOCK, encode(serialize_object(obj))
+    elif isinstance(obj, bytes):
+        return _BLOB, bytes(obj)
+    raise TypeError('Can not store object of type %s' % type(obj))
+
+
+def _unpack_object(type_tag, payload):
+    if type_tag == _BLOB:
+        return Blob(payload)
+    elif type_tag == _LEAF:
+        key, item = decode(bytes(payload))
+        return hippiehug.Nodes.Leaf(item, key)
+    elif type_tag == _BRANCH:
+        pivot, left_branch, right_branch = decode(bytes(payload))
+        return hippiehug.Nodes.Branch(pivot, left_branch, right_branch)
+    elif type_tag == _BLOCK:
+        index, fingers, items, aux = decode(bytes(payload))
+        return hippiehug.Block(items, index=index, fingers=fingers, aux=aux)
+    raise ValueError('Unknown record type %r' % type_tag)
+
+
+def _key_tag(key):
+    return _KEY_TAG.unpack(binary_hash(key)[:_KEY_TAG.size])[0]
+
+
+def _create_index(path, capacity, log_size=0):
+    with open(path, 'wb') as f:
+        f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, capacity, 0, log_size, 1))
+        f.truncate(_INDEX_HEADER.size + capacity * _INDEX_SLOT.size)
+
+
+class FileStore(object):
+    """
+    Persistent store of blobs, tree nodes, and chain blocks.
+
+    Objects are appended to a log file as content-addressed records, and
+    located through an open-addressing hash index kept in a second file.
+    Both files are read through ``mmap``, so lookups do not load the
+    store into the process heap, and the resident memory does not grow
+    with the number of objects.
+
+    A store can be used as the ``backend`` of :py:class:`ObjectStore`,
+    as the store of :py:class:`Tree`, and as the store of
+    ``hippiehug.Chain``.
+
+    >>> import tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> store = FileStore(path)
+    >>> blob = Blob(b'test')
+    >>> store[blob.hid] = blob
+    >>> store.close()
+    >>> with FileStore(path) as store:
+    ...     store[blob.hid]
+    b'test'
+
+    Records carry a checksum. If the process stops in the middle of an
+    append, the index is rebuilt from the log on the next start, and the
+    incomplete record is discarded.
+
+    :param str path: Directory holding the store files. Created if
+            it does not exist.
+    :param bool sync: ``fsync`` the log after every write.
+    :param int initial_capacity: Initial number of index slots.
+    """
+    def __init__(self, path, sync=False, initial_capacity=1024):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.sync = sync
+        self._lock = threading.RLock()
+        self._log_path = os.path.join(path, LOG_FILENAME)
+        self._index_path = os.path.join(path, INDEX_FILENAME)
+        self._open(initial_capacity)
+
+    def _open(self, initial_capacity):
+        """Open the log and the index, rebuilding the index if needed."""
+        self._log_file = open(self._log_path, 'ab')
+        self._log_reader = open(self._log_path, 'rb')
+        self._log_size = os.path.getsize(self._log_path)
+        self._log_map = None
+
+        self._index_file = None
+        self._index = None
+        self._dirty = False
+        if not self._open_index():
+            self._rebuild_index(initial_capacity)
+            self._dirty = True
+
+    # Index maintenance
+
+    def _open_index(self):
+        if not os.path.exists(self._index_path):
+            return False
+        self._index_file = open(self._index_path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        try:
+            magic, capacity, count, log_size, dirty = \
+                    _INDEX_HEADER.unpack_from(self._index, 0)
+        except struct.error:
+            magic = None
+        if magic != _INDEX_MAGIC or dirty or log_size != self._log_size \
+                or len(self._index) != \
+                _INDEX_HEADER.size + capacity * _INDEX_SLOT.size:
+            self._close_index()
+            return False
+        self._capacity = capacity
+        self._count = count
+        return True
+
+    def _close_index(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+    def _rebuild_index(self, capacity):
+        """Index all valid records, and truncate the log after them."""
+        valid_size = 0
+        keys = []
+        for offset, size, _, key, _ in self._scan(check=True):
+            keys.append((key, offset))
+            valid_size = offset + size
+        if valid_size != self._log_size:
+            self._log_file.truncate(valid_size)
+            self._log_file.flush()
+            self._log_size = valid_size
+            self._log_map = None
+
+        while len(keys) > capacity * _MAX_LOAD:
+            capacity *= 2
+        tmp_path = self._index_path + '.tmp'
+        _create_index(tmp_path, capacity, self._log_size)
+        self._close_index()
+        os.rename(tmp_path, self._index_path)
+        self._index_file = open(self._index_path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        self._capacity = capacity
+        self._count = 0
+        for key, offset in keys:
+            slot, found = self._find_slot(key, _key_tag(key))
+            if found is None:
+                self._write_slot(slot, _key_tag(key), offset)
+
+    def _write_header(self, dirty):
+        _INDEX_HEADER.pack_into(self._index, 0, _INDEX_MAGIC, self._capacity,
+                                self._count, self._log_size, int(dirty))
+
+    def _set_dirty(self, dirty):
+        self._dirty = dirty
+        self._write_header(dirty)
+        self._index.flush()
+
+    def _write_slot(self, slot, tag, offset):
+        _INDEX_SLOT.pack_into(self._index,
+                              _INDEX_HEADER.size + slot * _INDEX_SLOT.size,
+                              tag, offset + 1)
+        self._count += 1
+
+    def _find_slot(self, key, tag):
+        """Find the record offset of a key, or a free slot for it."""
+        capacity = self._capacity
+        slot = tag % capacity
+        while True:
+            slot_tag, ref = _INDEX_SLOT.unpack_from(
+                    self._index, _INDEX_HEADER.size + slot * _INDEX_SLOT.size)
+            if ref == 0:
+                return slot, None
+            if slot_tag == tag and self._read_key(ref - 1) == key:
+                return slot, ref - 1
+            slot = (slot + 1) % capacity
+
+    def _grow(self):
+        old_index, old_capacity = self._index, self._capacity
+        old_index_file = self._index_file
+        capacity = old_capacity * 2
+        tmp_path = self._index_path + '.tmp'
+        _create_index(tmp_path, capacity, self._log_size)
+        index_file = open(tmp_path, 'r+b')
+        index = mmap.mmap(index_file.fileno(), 0)
+        for old_slot in range(old_capacity):
+            tag, ref = _INDEX_SLOT.unpack_from(
+                    old_index, _INDEX_HEADER.size + old_slot * _INDEX_SLOT.size)
+            if ref == 0:
+                continue
+            slot = tag % capacity
+            while _INDEX_SLOT.unpack_from(
+                    index, _INDEX_HEADER.size + slot * _INDEX_SLOT.size)[1]:
+                slot = (slot + 1) % capacity
+            _INDEX_SLOT.pack_into(
+                    index, _INDEX_HEADER.size + slot * _INDEX_SLOT.size,
+                    tag, ref)
+        self._index, self._index_file = index, index_file
+        self._capacity = capacity
+        self._write_header(self._dirty)
+        index.flush()
+        old_index.close()
+        old_index_file.close()
+        os.rename(tmp_path, self._index_path)
+
+    # Log access
+
+    def _map(self, end):
+        if self._log_map is None or len(self._log_map) < end:
+            self._log_file.flush()
+            # Mapped views handed out before stay valid: the previous map
+            # is not closed, only dropped.
+            self._log_map = mmap.mmap(self._log_reader.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        return self._log_map
+
+    def _read_key(self, offset):
+        start = offset + _RECORD_HEADER.size
+        log_map = self._map(start + _RECORD_PREFIX.size)
+        _, key_size = _RECORD_PREFIX.unpack_from(log_map, start)
+        start += _RECORD_PREFIX.size
+        return self._map(start + key_size)[start:start + key_size]
+
+    def _read_record(self, offset):
+        log_map = self._map(offset + _RECORD_HEADER.size)
+        body_size, _ = _RECORD_HEADER.unpack_from(log_map, offset)
+        start = offset + _RECORD_HEADER.size
+        log_map = self._map(start + body_size)
+        type_tag, key_size = _RECORD_PREFIX.unpack_from(log_map, start)
+        payload_start = start + _RECORD_PREFIX.size + key_size
+        return type_tag, memoryview(log_map)[payload_start:start + body_size]
+
+    def _scan(self, check=False, log_map=None, log_size=None):
+        """Iterate over ``(offset, size, type, key, payload)`` of records.
+
+        Scans the given map of the log up to ``log_size``, by default the
+        current map up to the current size.
+        """
+        if log_map is None:
+            log_size = self._log_size
+            if log_size == 0:
+                return
+            log_map = self._map(log_size)
+        offset = 0
+        while offset + _RECORD_HEADER.size <= log_size:
+            body_size, crc = _RECORD_HEADER.unpack_from(log_map, offset)
+            start = offset + _RECORD_HEADER.size
+            end = start + body_size
+            if end > log_size or body_size < _RECORD_PREFIX.size:
+                return
+            if check and zlib.crc32(log_map[start:end]) & 0xffffffff != crc:
+                return
+            type_tag, key_size = _RECORD_PREFIX.unpack_from(log_map, start)
+            key_start = start + _RECORD_PREFIX.size
+            key = log_map[key_start:key_start + key_size]
+            payload = memoryview(log_map)[key_start + key_size:end]
+            yield offset, end - offset, type_tag, key, payload
+            offset = end
+
+    def _append(self, key, type_tag, payload):
+        body = _RECORD_PREFIX.pack(type_tag, len(key)) + key + payload
+        record = _RECORD_HEADER.pack(
+                len(body), zlib.crc32(body) & 0xffffffff) + body
+        offset = self._log_size
+        self._log_file.write(record)
+        self._log_size += len(record)
+        return offset
+
+    def _put(self, key, type_tag, payload):
+        if not self._dirty:
+            self._set_dirty(True)
+        tag = _key_tag(key)
+        slot, found = self._find_slot(key, tag)
+        if found is not None:
+            return False
+        offset = self._append(key, type_tag, payload)
+        self._write_slot(slot, tag, offset)
+        if self._count > self._capacity * _MAX_LOAD:
+            self._grow()
+        return True
+
+    def _commit_writes(self):
+        self._log_file.flush()
+        if self.sync:
+            os.fsync(self._log_file.fileno())
+
+    # Mapping interface
+
+    def __getitem__(self, lookup_key):
+        with self._lock:
+            _, offset = self._find_slot(lookup_key, _key_tag(lookup_key))
+            if offset is None:
+                raise KeyError(lookup_key)
+            type_tag, payload = self._read_record(offset)
+            return _unpack_object(type_tag, payload)
+
+    def get(self, lookup_key, default=None):
+        try:
+            return self[lookup_key]
+        except KeyError:
+            return default
+
+    def raw(self, lookup_key):
+        """Get a zero-copy view of the serialized object.
+
+        The view stays valid while the store is open.
+        """
+        with self._lock:
+            _, offset = self._find_slot(lookup_key, _key_tag(lookup_key))
+            if offset is None:
+                raise KeyError(lookup_key)
+            return self._read_record(offset)[1]
+
+    def __setitem__(self, lookup_key, value):
+        type_tag, payload = _pack_object(value)
+        with self._lock:
+            self._put(lookup_key, type_tag, payload)
+            self._commit_writes()
+
+    def update(self, items):
+        """Add many objects, with a single flush of the log.
+
+        :param items: Dictionary or iterable of ``(key, value)`` pairs
+        """
+        if hasattr(items, 'items'):
+            items = items.items()
+        with self._lock:
+            for lookup_key, value in items:
+                type_tag, payload = _pack_object(value)
+                self._put(lookup_key, type_tag, payload)
+            self._commit_writes()
+
+    def __contains__(self, lookup_key):
+        with self._lock:
+            return self._find_slot(lookup_key, _key_tag(lookup_key))[1] \
+                    is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.keys()
+
+    def _snapshot(self):
+        """Map of the log and its current size.
+
+        Records up to the size can be scanned without holding the lock, as
+        the log is only appended to, and maps handed out stay valid.
+        """
+        with self._lock:
+            log_size = self._log_size
+            if log_size == 0:
+                return None, 0
+            self._log_file.flush()
+            return self._map(log_size), log_size
+
+    def keys(self):
+        log_map, log_size = self._snapshot()
+        if log_map is None:
+            return
+        for _, _, _, key, _ in self._scan(log_map=log_map, log_size=log_size):
+            yield key
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def items(self):
+        log_map, log_size = self._snapshot()
+        if log_map is None:
+            return
+        for _, _, type_tag, key, payload in self._scan(log_map=log_map,
+                                                       log_size=log_size):
+            yield key, _unpack_object(type_tag, payload)
+
+    # Lifecycle
+
+    def flush(self):
+        """Persist the log and mark the index consistent with it."""
+        with self._lock:
+            self._log_file.flush()
+            os.fsync(self._log_file.fileno())
+            self._set_dirty(False)
+
+    def close(self):
+        """Flush and close the store files."""
+        with self._lock:
+            if self._index is None:
+                return
+            self.flush()
+            self._close_index()
+            self._log_map = None
+            self._log_file.close()
+            self._log_reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def compact(self, keep=None):
+        """Rewrite the store, leaving out unneeded records.
+
+        :param keep: Container of keys, or a predicate on keys, that
+                selects the objects to retain. By default all objects are
+                retained, and only the index is resized to fit.
+        """
+        if keep is None:
+            should_keep = lambda key: True
+        elif callable(keep):
+            should_keep = keep
+        else:
+            should_keep = lambda key: key in keep
+
+        with self._lock:
+            tmp_path = os.path.join(self.path, '.compact')
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+            self._log_file.flush()
+            capacity = max(16, int(self._count / _MAX_LOAD) + 1)
+            compacted = FileStore(tmp_path, initial_capacity=capacity)
+            for _, _, type_tag, key, payload in self._scan():
+                if should_keep(key):
+                    compacted._put(key, type_tag, bytes(payload))
+            compacted.close()
+
+            self.close()
+            os.rename(os.path.join(tmp_path, LOG_FILENAME), self._log_path)
+            os.rename(os.path.join(tmp_path, INDEX_FILENAME),
+                      self._index_path)
+            shutil.rmtree(tmp_path)
+            self._open(capacity)
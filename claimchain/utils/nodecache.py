@@ -0,0 +1,254 @@
+"""
+Cache of decoded tree nodes in front of a slow object store.
+"""
+
+import threading
+from collections import OrderedDict, defaultdict
+
+import six
+import hippiehug
+
+from .wrappers import serialize_object, _get_many, _batch
+
+
+__all__ = ['CachingObjectStore']
+
+
+# Rough size of a decoded object on top of its contents, in bytes
+_OBJECT_OVERHEAD = 200
+
+# Number of most recently walked roots to remember
+_MAX_ROOTS = 64
+
+
+def _content_size(fields):
+    if isinstance(fields, (bytes, six.text_type)):
+        return len(fields)
+    if isinstance(fields, (list, tuple)):
+        return sum(_content_size(field) for field in fields)
+    return 0
+
+
+def _object_size(obj):
+    return _OBJECT_OVERHEAD + _content_size(serialize_object(obj))
+
+
+class CachingObjectStore(object):
+    """
+    Object store keeping decoded objects of a backend store in memory.
+
+    Every lookup in a tree starts at the root, so the upper levels of a
+    tree are read all the time. This store keeps the nodes of the top
+    ``pinned_levels`` levels until everything else has been evicted,
+    and the rest of the objects in LRU order, within ``max_bytes``.
+
+    Depths are known for the roots of the trees that
+    :py:class:`utils.Tree` walks, and for the children of cached
+    branches. Objects of unknown depth, such as values and blocks, are
+    only kept in LRU order.
+
+    >>> from claimchain.utils import Tree, Blob
+    >>> store = CachingObjectStore({}, pinned_levels=1)
+    >>> tree = Tree(store)
+    >>> tree.update({b'a': Blob(b'1'), b'b': Blob(b'2')})
+    >>> tree[b'a']
+    b'1'
+    >>> stats = store.stats()
+    >>> stats['by_depth'][0]['hits'], stats['by_depth'][1]['hits']
+    (1, 1)
+    >>> stats['pinned']
+    1
+
+    :param backend: Dictionary-like backend store, such as
+            :py:class:`FileStore` or :py:class:`RedisObjectStore`
+    :param int max_bytes: Budget for the cached objects, estimated from
+            the sizes of their contents.
+    :param int pinned_levels: Number of top tree levels to pin.
+    """
+    def __init__(self, backend, max_bytes=16 * 1024 * 1024, pinned_levels=4):
+        if max_bytes < 0:
+            raise ValueError('Cache budget can not be negative.')
+        self._backend = backend
+        self.max_bytes = max_bytes
+        self.pinned_levels = pinned_levels
+
+        self._lock = threading.Lock()
+        # Lookup key -> (object, depth, size)
+        self._pinned = OrderedDict()
+        self._lru = OrderedDict()
+        self._size = 0
+        # Lookup key -> depth, for roots and children of cached branches
+        self._depth_hints = {}
+        self._roots = OrderedDict()
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+        self.evictions = 0
+
+    def mark_root(self, root_hash):
+        """Record that ``root_hash`` is the root of a tree."""
+        with self._lock:
+            self._roots.pop(root_hash, None)
+            self._roots[root_hash] = True
+            self._depth_hints[root_hash] = 0
+            while len(self._roots) > _MAX_ROOTS:
+                old_root_hash, _ = self._roots.popitem(last=False)
+                self._depth_hints.pop(old_root_hash, None)
+
+    def _place(self, lookup_key, obj, depth, size):
+        if depth is not None and depth < self.pinned_levels:
+            self._pinned[lookup_key] = (obj, depth, size)
+        else:
+            self._lru[lookup_key] = (obj, depth, size)
+        if depth is not None and isinstance(obj, hippiehug.Nodes.Branch):
+            for child_hash in (obj.left_branch, obj.right_branch):
+                self._depth_hints.setdefault(child_hash, depth + 1)
+
+    def _lookup(self, lookup_key):
+        entries = self._pinned if lookup_key in self._pinned else self._lru
+        entry = entries.pop(lookup_key, None)
+        if entry is None:
+            self._misses[self._depth_hints.get(lookup_key)] += 1
+            return None
+        obj, depth, size = entry
+        # Objects written before their tree was walked get their depth
+        # when they are first read
+        depth = self._depth_hints.get(lookup_key, depth)
+        self._place(lookup_key, obj, depth, size)
+        self._hits[depth] += 1
+        return obj
+
+    def _insert(self, lookup_key, obj):
+        if lookup_key in self._pinned or lookup_key in self._lru:
+            return
+        size = _object_size(obj)
+        if size > self.max_bytes:
+            return
+        self._place(lookup_key, obj, self._depth_hints.get(lookup_key), size)
+        self._size += size
+        while self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = self._lru if self._lru else self._pinned
+        _, (obj, _, size) = entries.popitem(last=False)
+        self._size -= size
+        self.evictions += 1
+        if isinstance(obj, hippiehug.Nodes.Branch):
+            for child_hash in (obj.left_branch, obj.right_branch):
+                if child_hash not in self._roots:
+                    self._depth_hints.pop(child_hash, None)
+
+    def __getitem__(self, lookup_key):
+        with self._lock:
+            obj = self._lookup(lookup_key)
+        if obj is None:
+            obj = self._backend[lookup_key]
+            with self._lock:
+                self._insert(lookup_key, obj)
+        return obj
+
+    def get(self, lookup_key, default=None):
+        try:
+            return self[lookup_key]
+        except KeyError:
+            return default
+
+    def get_many(self, lookup_keys):
+        """Get values of many lookup keys, fetching the ones that are
+        not cached from the backend at once.
+
+        :param lookup_keys: Iterable of lookup keys
+        :return: Dictionary mapping the keys that are in the store to
+                 their values
+        """
+        values = {}
+        missing = []
+        with self._lock:
+            for lookup_key in lookup_keys:
+                obj = self._lookup(lookup_key)
+                if obj is None:
+                    missing.append(lookup_key)
+                else:
+                    values[lookup_key] = obj
+        if missing:
+            fetched = _get_many(self._backend, missing)
+            with self._lock:
+                for lookup_key, obj in fetched.items():
+                    self._insert(lookup_key, obj)
+            values.update(fetched)
+        return values
+
+    def __setitem__(self, lookup_key, value):
+        self._backend[lookup_key] = value
+        with self._lock:
+            self._insert(lookup_key, value)
+
+    def update(self, items):
+        """Add many values, with a single write to the backend if it
+        supports it.
+
+        :param items: Iterable of ``(lookup_key, value)`` pairs
+        """
+        items = list(items)
+        if hasattr(self._backend, 'update'):
+            self._backend.update(items)
+        else:
+            for lookup_key, value in items:
+                self._backend[lookup_key] = value
+        with self._lock:
+            for lookup_key, value in items:
+                self._insert(lookup_key, value)
+
+    def batch(self):
+        """Batch of writes to the backend, if it supports batching."""
+        return _batch(self._backend)
+
+    def __contains__(self, lookup_key):
+        return lookup_key in self._pinned or lookup_key in self._lru \
+                or lookup_key in self._backend
+
+    def __len__(self):
+        return len(self._backend)
+
+    @property
+    def cached_count(self):
+        """Number of cached objects."""
+        return len(self._pinned) + len(self._lru)
+
+    def clear(self):
+        """Drop all cached objects and reset the counters."""
+        with self._lock:
+            self._pinned.clear()
+            self._lru.clear()
+            self._size = 0
+            self._depth_hints = {root_hash: 0 for root_hash in self._roots}
+            self._hits.clear()
+            self._misses.clear()
+            self.evictions = 0
+
+    def stats(self):
+        """
+        Return cache counters, and hit ratios per tree depth.
+
+        Depth ``None`` stands for objects of unknown depth.
+        """
+        with self._lock:
+            by_depth = {}
+            for depth in set(self._hits) | set(self._misses):
+                hits = self._hits[depth]
+                misses = self._misses[depth]
+                by_depth[depth] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': float(hits) / (hits + misses),
+                }
+            return {
+                'hits': sum(self._hits.values()),
+                'misses': sum(self._misses.values()),
+                'evictions': self.evictions,
+                'size': self.cached_count,
+                'pinned': len(self._pinned),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'by_depth': by_depth,
+            }
@@ -0,0 +1,213 @@
+"""
+Object store kept in Redis.
+"""
+
+import threading
+from contextlib import contextmanager
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from .misc import LRUCache
+from .filestore import _pack_object, _unpack_object
+
+
+__all__ = ['RedisObjectStore']
+
+
+# Values are stored under the prefixed lookup key as type tag and payload,
+# as in the records of FileStore
+_TYPE_TAG_SIZE = 1
+
+# Number of values per MSET command in a write pipeline
+_WRITE_CHUNK_SIZE = 1000
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def _connection_pool(url):
+    with _connection_pools_lock:
+        pool = _connection_pools.get(url)
+        if pool is None:
+            pool = redis.ConnectionPool.from_url(url)
+            _connection_pools[url] = pool
+        return pool
+
+
+def _dump(value):
+    type_tag, payload = _pack_object(value)
+    return type_tag + payload
+
+
+def _load(data):
+    return _unpack_object(data[:_TYPE_TAG_SIZE], data[_TYPE_TAG_SIZE:])
+
+
+class RedisObjectStore(object):
+    """
+    Store of blobs, tree nodes, and chain blocks in Redis.
+
+    Can be used wherever :py:class:`FileStore` can. Lookups of many keys
+    go to Redis in a single ``MGET``, and writes in a single pipeline,
+    so that :py:meth:`Tree.evidence_many` takes one round trip per tree
+    level, and building a tree takes one round trip in total.
+
+    Objects read or written are kept in a local LRU cache. As every
+    lookup starts at the root, the cache ends up holding the upper
+    levels of the trees. Objects are immutable, so the cache never goes
+    stale.
+
+    :param client: ``redis.Redis`` client. By default, a client of
+            ``url``, from a connection pool shared by the process.
+    :param str url: Redis URL, used if no client is given.
+    :param bytes prefix: Prefix of the keys in Redis.
+    :param int cache_size: Number of objects kept in the local cache.
+            Zero disables the cache.
+    :param int max_pending: Number of writes held back in the
+            batches of a thread, after which they are sent early. By
+            default, there is no limit.
+    """
+    def __init__(self, client=None, url='redis://localhost:6379/0',
+                 prefix=b'cc:', cache_size=1024, max_pending=None):
+        if client is None:
+            if redis is None:
+                raise ImportError('RedisObjectStore requires redis.')
+            client = redis.StrictRedis(connection_pool=_connection_pool(url))
+        self._client = client
+        self._prefix = prefix
+        self.cache = LRUCache(maxsize=cache_size)
+
+        # Batches are per thread, so that threads sharing the store do
+        # not send or drop each other's writes
+        self._local = threading.local()
+        self._max_pending = max_pending
+
+    def _key(self, lookup_key):
+        return self._prefix + lookup_key
+
+    def _batches(self):
+        """Pending writes of the open batches of this thread, innermost
+        last."""
+        batches = getattr(self._local, 'batches', None)
+        if batches is None:
+            batches = self._local.batches = []
+        return batches
+
+    def _get_pending(self, lookup_key):
+        for pending in reversed(self._batches()):
+            value = pending.get(lookup_key)
+            if value is not None:
+                return value
+        return None
+
+    def __getitem__(self, lookup_key):
+        value = self._get_pending(lookup_key)
+        if value is None:
+            value = self.cache.get(lookup_key)
+        if value is None:
+            data = self._client.get(self._key(lookup_key))
+            if data is None:
+                raise KeyError(lookup_key)
+            value = _load(data)
+            self.cache[lookup_key] = value
+        return value
+
+    def get(self, lookup_key, default=None):
+        try:
+            return self[lookup_key]
+        except KeyError:
+            return default
+
+    def get_many(self, lookup_keys):
+        """Get values of many lookup keys with at most one ``MGET``.
+
+        :param lookup_keys: Iterable of lookup keys
+        :return: Dictionary mapping the keys that are in the store to
+                 their values
+        """
+        values = {}
+        missing = []
+        for lookup_key in lookup_keys:
+            value = self._get_pending(lookup_key)
+            if value is None:
+                value = self.cache.get(lookup_key)
+            if value is None:
+                missing.append(lookup_key)
+            else:
+                values[lookup_key] = value
+        if missing:
+            fetched = self._client.mget(
+                    [self._key(lookup_key) for lookup_key in missing])
+            for lookup_key, data in zip(missing, fetched):
+                if data is not None:
+                    value = _load(data)
+                    self.cache[lookup_key] = value
+                    values[lookup_key] = value
+        return values
+
+    def __setitem__(self, lookup_key, value):
+        self.update([(lookup_key, value)])
+
+    def update(self, items):
+        """Add many values in one pipeline.
+
+        Within :py:meth:`batch`, the values are only sent when the
+        batch ends.
+
+        :param items: Iterable of ``(lookup_key, value)`` pairs
+        """
+        items = list(items)
+        batches = self._batches()
+        if batches:
+            batches[-1].update(items)
+            if self._max_pending is None \
+                    or sum(map(len, batches)) < self._max_pending:
+                return
+            items = []
+            for pending in batches:
+                items.extend(pending.items())
+                pending.clear()
+        self._write(items)
+
+    def _write(self, items):
+        if not items:
+            return
+        pipeline = self._client.pipeline(transaction=False)
+        for i in range(0, len(items), _WRITE_CHUNK_SIZE):
+            pipeline.mset({self._key(lookup_key): _dump(value)
+                           for lookup_key, value
+                           in items[i:i + _WRITE_CHUNK_SIZE]})
+        pipeline.execute()
+        for lookup_key, value in items:
+            self.cache[lookup_key] = value
+
+    @contextmanager
+    def batch(self):
+        """
+        Context in which writes are buffered, and sent in one pipeline
+        when it ends. Buffered values can be read back before then.
+
+        Batches are per thread. A batch within another one hands its
+        writes to the outer batch when it ends. If the context exits with
+        an exception, the writes of this batch not sent yet are dropped.
+        """
+        batches = self._batches()
+        pending = {}
+        batches.append(pending)
+        try:
+            yield self
+        finally:
+            batches.pop()
+        if batches:
+            batches[-1].update(pending)
+        else:
+            self._write(list(pending.items()))
+
+    def __contains__(self, lookup_key):
+        if self._get_pending(lookup_key) is not None \
+                or lookup_key in self.cache:
+            return True
+        return bool(self._client.exists(self._key(lookup_key)))
@@ -1,7 +1,11 @@
+from bisect import bisect_right
+from contextlib import contextmanager
+
 import hippiehug
 from hippiehug.Utils import binary_hash
 
 from .encodings import ensure_binary
+from .misc import cached_property
 
 
 # TODO: Move to hippiehug 1.0
@@ -9,7 +13,7 @@ from .encodings import ensure_binary
 
 
 class Blob(bytes):
-    @property
+    @cached_property
     def hid(self):
         return binary_hash(self)
 
@@ -19,42 +23,112 @@ def _check_hash(key, value):
         raise ValueError('Hash of the value is not the lookup key')
 
 
-class ObjectStore(object):
+#: Check the hash of every value read from or written to the store
+VERIFY_ALWAYS = 'always'
+#: Check the hash of a value the first time its key is read or written
+VERIFY_ONCE = 'once'
+#: Only check the hashes of values written to the store
+VERIFY_ON_INGEST = 'ingest'
+
+_VERIFY_POLICIES = (VERIFY_ALWAYS, VERIFY_ONCE, VERIFY_ON_INGEST)
+
+
+class _VerifyingStore(object):
+    """
+    Checks of values against their lookup keys, according to the
+    verification policy in ``_verify``. Keys verified so far are in
+    ``_verified``.
+    """
+    def _set_verify(self, verify):
+        if verify not in _VERIFY_POLICIES:
+            raise ValueError('Unknown verification policy: %s' % verify)
+        self._verify = verify
+
+    def _check_read(self, lookup_key, value):
+        if self._verify == VERIFY_ALWAYS:
+            _check_hash(lookup_key, value)
+        elif self._verify == VERIFY_ONCE \
+                and lookup_key not in self._verified:
+            _check_hash(lookup_key, value)
+            self._verified.add(lookup_key)
+
+    def _check_writes(self, items):
+        for lookup_key, value in items:
+            _check_hash(lookup_key, value)
+
+    def _mark_written(self, lookup_keys):
+        if self._verify == VERIFY_ONCE:
+            self._verified.update(lookup_keys)
+
+
+class ObjectStore(_VerifyingStore):
     """
     >>> store = ObjectStore()
     >>> blob = Blob(b'test')
     >>> store.add(blob)
     >>> store[blob.hid]
     b'test'
+
+    Wrapping a backend does not touch its contents. Values are checked
+    against their lookup keys when accessed, according to the
+    verification policy:
+
+    >>> backend = {blob.hid: Blob(b'tampered')}
+    >>> store = ObjectStore(backend)
+    >>> store[blob.hid]
+    Traceback (most recent call last):
+    ValueError: Hash of the value is not the lookup key
+    >>> store = ObjectStore(backend, verify=VERIFY_ON_INGEST)
+    >>> store[blob.hid]
+    b'tampered'
+    >>> store[blob.hid] = Blob(b'tampered')
+    Traceback (most recent call last):
+    ValueError: Hash of the value is not the lookup key
+
+    :param backend: Dictionary-like backend, or another ``ObjectStore``,
+            whose backend is then shared.
+    :param str verify: Verification policy, one of
+            :py:data:`VERIFY_ALWAYS`, :py:data:`VERIFY_ONCE`, and
+            :py:data:`VERIFY_ON_INGEST`. By default, the policy of the
+            wrapped ``ObjectStore``, or :py:data:`VERIFY_ALWAYS`.
     """
-    def __init__(self, backend=None):
+    def __init__(self, backend=None, verify=None):
         self._backend = backend
+        self._verified = set()
         if backend is None:
             self._backend = {}
 
-        # Check hashes if it is a plain dictionary
-        if not isinstance(self._backend, ObjectStore):
-            for lookup_key, value in self._backend.items():
-                _check_hash(lookup_key, value)
-        else:
-            # If input is another ObjectStore, unwrap the
-            # underlying dictionary
-            self._backend = self._backend._backend
+        # If input is another ObjectStore, unwrap the underlying
+        # dictionary, and keep what it has already verified
+        if isinstance(self._backend, ObjectStore):
+            wrapped = self._backend
+            self._backend = wrapped._backend
+            if verify is None or verify == wrapped._verify:
+                verify = wrapped._verify
+                self._verified = wrapped._verified
+
+        if verify is None:
+            verify = VERIFY_ALWAYS
+        self._set_verify(verify)
 
     def __getitem__(self, lookup_key):
         value = self._backend[lookup_key]
-        _check_hash(lookup_key, value)
+        self._check_read(lookup_key, value)
         return value
 
     def get(self, lookup_key):
         try:
-            return self._backend[lookup_key]
+            return self[lookup_key]
         except KeyError:
             return None
 
     def __setitem__(self, lookup_key, value):
         _check_hash(lookup_key, value)
         self._backend[lookup_key] = value
+        self._mark_written([lookup_key])
+
+    def __contains__(self, lookup_key):
+        return lookup_key in self._backend
 
     def keys(self):
         return self._backend.keys()
@@ -69,6 +143,45 @@ class ObjectStore(object):
         lookup_key = value.hid
         self._backend[lookup_key] = value
 
+    def get_many(self, lookup_keys):
+        """Get values of many lookup keys.
+
+        Uses the ``get_many`` method of the backend if it has one, so
+        that backends can fetch all values at once.
+
+        :param lookup_keys: Iterable of lookup keys
+        :return: Dictionary mapping the keys that are in the store to
+                 their values
+        """
+        values = _get_many(self._backend, lookup_keys)
+        for lookup_key, value in values.items():
+            self._check_read(lookup_key, value)
+        return values
+
+    def batch(self):
+        """
+        Context in which the backend may hold writes back, and send them
+        at once when it ends. See :py:meth:`RedisObjectStore.batch`.
+        """
+        return _batch(self._backend)
+
+    def update(self, items):
+        """Add many values at once.
+
+        Uses the ``update`` method of the backend if it has one, so
+        that backends can write the whole batch at once.
+
+        :param items: Iterable of ``(lookup_key, value)`` pairs
+        """
+        items = list(items)
+        self._check_writes(items)
+        if hasattr(self._backend, 'update'):
+            self._backend.update(items)
+        else:
+            for lookup_key, value in items:
+                self._backend[lookup_key] = value
+        self._mark_written(lookup_key for lookup_key, _ in items)
+
 
 
 # TODO: (Higher priority) move this to hippiehug classes themselves
@@ -157,6 +270,32 @@ class Tree(object):
             self.object_store = ObjectStore()
         self.tree = hippiehug.Tree(self.object_store, root_hash=root_hash)
 
+    @staticmethod
+    def from_items(object_store, items, batch_size=None):
+        """
+        Build a tree from scratch.
+
+        Produces the same tree as adding the items one by one in their
+        iteration order, but computes every node once, and writes all
+        values and nodes to the store in a single batch.
+
+        Note that the shape of the tree depends on the insertion order,
+        and is only balanced when the keys come in random order (as
+        lookup keys do). Adding sorted keys yields a tree as deep as
+        the number of keys.
+
+        :param object_store: Object store, or ``None`` for a new one
+        :param items: dictionary, or iterable of ``(lookup_key, value)``
+                      pairs, where the values are objects with ``hid``
+                      property (e.g. ``Blob`` objects)
+        :param int batch_size: Number of values and nodes per write to
+                      the store. By default, everything is written at
+                      once.
+        """
+        tree = Tree(object_store)
+        tree.update(items, batch_size=batch_size)
+        return tree
+
     @property
     def root_hash(self):
         return self.tree.root()
@@ -195,24 +334,77 @@ class Tree(object):
 
         self.tree.store[value_hash] = value
 
-    def update(self, items):
+    def update(self, items, batch_size=None):
         """
-        Add multiple values.
+        Add multiple values, replacing the values of existing keys.
+
+        >>> tree = Tree()
+        >>> tree.update({b'a': Blob(b'1'), b'b': Blob(b'2')})
+        >>> tree.update({b'a': Blob(b'3'), b'c': Blob(b'4')})
+        >>> tree[b'a'] == Blob(b'3')
+        True
+        >>> tree[b'c'] == Blob(b'4')
+        True
+
+        When the tree is empty, values are consumed one at a time, and
+        written to the store along with the new nodes in batches. Only
+        the keys and the value hashes are kept in memory while the tree
+        is built.
 
         TODO: Add transactions. If this fails or stops at some point,
         storage will be left in a screwed up state.
 
-        :param items: dictionary, where the values are objects with
-                      ``hid`` property (e.g. ``Blob`` objects)
+        :param items: dictionary, or iterable of ``(lookup_key, value)``
+                      pairs, where the values are objects with ``hid``
+                      property (e.g. ``Blob`` objects)
+        :param int batch_size: Number of values and nodes per write to
+                      the store when building a tree from scratch. By
+                      default, everything is written at once.
         """
-        items = {ensure_binary(key): value for key, value in items.items()}
+        if hasattr(items, 'items'):
+            items = items.items()
+        store = self.tree.store
+        if self.tree.root_hash is None:
+            writer = _BatchWriter(store, batch_size)
+            entries = []
+            for key, value in items:
+                if not hasattr(value, 'hid'):
+                    raise TypeError('Value is not a valid object.')
+                entries.append((ensure_binary(key), value.hid))
+                writer.add(value.hid, value)
+            if not entries:
+                return
+            root = _build_nodes(entries, writer.add)
+            writer.flush()
+            self.tree.root_hash = root.hid
+            return
+
+        items = {ensure_binary(key): value for key, value in items}
         for value in items.values():
             if not hasattr(value, 'hid'):
                 raise TypeError('Value is not a valid object.')
-            self.tree.store[value.hid] = value
-
-        if len(items) > 0:
-            self.tree.multi_add(list(items.values()), list(items.keys()))
+        if len(items) == 0:
+            return
+        with _batch(store):
+            # Walk the paths to all keys level by level, which also
+            # fetches what multi_add is going to read, for backends
+            # that cache what they fetch
+            _, _, leaves = self.evidence_many(items.keys())
+            for value in items.values():
+                store[value.hid] = value
+            # ``multi_add`` keeps the values of existing keys, so their
+            # leaves are replaced separately
+            replaced = sorted((key, value.hid)
+                              for key, value in items.items()
+                              if leaves[key].key == key)
+            if replaced:
+                self.tree.root_hash = _replace_leaves(
+                        store, self.tree.root_hash, replaced)
+            added = [(key, value) for key, value in items.items()
+                     if leaves[key].key != key]
+            if added:
+                self.tree.multi_add([value for _, value in added],
+                                    [key for key, _ in added])
 
     def __contains__(self, lookup_key):
         lookup_key = ensure_binary(lookup_key)
@@ -220,11 +412,239 @@ class Tree(object):
         return evidence != [] and evidence[-1].key == lookup_key
 
     def evidence(self, lookup_key):
+        _mark_root(self.tree.store, self.tree.root())
         result = self.tree.evidence(key=lookup_key)
         if not result:
             result = None, []
         return result
 
+    def get_many(self, lookup_keys):
+        """
+        Get values of many lookup keys in one walk of the tree.
+
+        >>> tree = Tree()
+        >>> tree.update({b'a': Blob(b'1'), b'b': Blob(b'2')})
+        >>> sorted(tree.get_many([b'a', b'c']).items())
+        [(b'a', b'1')]
+
+        :param lookup_keys: Iterable of lookup keys
+        :return: Dictionary mapping the keys that are in the tree to
+                 their values
+        """
+        _, _, leaves = self.evidence_many(lookup_keys)
+        found = {key: leaf.item for key, leaf in leaves.items()
+                 if leaf.key == key}
+        values = _get_many(self.tree.store, set(found.values()))
+        return {key: values[item_hash] for key, item_hash in found.items()}
+
+    def evidence_many(self, lookup_keys):
+        """
+        Gather evidence for many lookup keys in one walk of the tree.
+
+        Keys are walked down in sorted order, so that paths sharing a
+        prefix fetch each node of the prefix only once. The tree is
+        walked level by level, fetching all nodes of a level from the
+        store at once.
+
+        >>> tree = Tree()
+        >>> tree.update({b'a': Blob(b'1'), b'b': Blob(b'2'), b'c': Blob(b'3')})
+        >>> root_hash, nodes, leaves = tree.evidence_many([b'a', b'c'])
+        >>> check_evidence(root_hash, nodes, b'a')
+        True
+        >>> leaves[b'c'].item == Blob(b'3').hid
+        True
+
+        :param lookup_keys: Iterable of lookup keys
+        :return: Tuple of the root hash, list of all distinct nodes on
+                 the paths to the keys (level by level), and
+                 a dictionary mapping every key to the last node on its
+                 path. The leaf holds the key only if the key is in
+                 the tree.
+        """
+        lookup_keys = sorted({ensure_binary(key) for key in lookup_keys})
+        root_hash = self.tree.root()
+        if root_hash is None or not lookup_keys:
+            return root_hash, [], {}
+
+        store = self.tree.store
+        _mark_root(store, root_hash)
+        nodes = []
+        leaves = {}
+        level = [(root_hash, 0, len(lookup_keys))]
+        while level:
+            fetched = _get_many(store, [node_hash for node_hash, _, _ in level])
+            next_level = []
+            for node_hash, start, end in level:
+                node = fetched[node_hash]
+                nodes.append(node)
+                next_level.extend(
+                        _descend(node, lookup_keys, start, end, leaves))
+            level = next_level
+        return root_hash, nodes, leaves
+
+
+def _descend(node, lookup_keys, start, end, leaves):
+    """
+    Step of a walk of sorted lookup keys ``lookup_keys[start:end]`` down
+    the tree, at ``node``.
+
+    :return: List of ``(child_hash, start, end)`` to visit next, left
+             child first. Empty at a leaf, which is then recorded in
+             ``leaves`` for each key.
+    """
+    if isinstance(node, hippiehug.Nodes.Branch):
+        split = bisect_right(lookup_keys, node.pivot, start, end)
+        children = []
+        if start < split:
+            children.append((node.left_branch, start, split))
+        if split < end:
+            children.append((node.right_branch, split, end))
+        return children
+    for key in lookup_keys[start:end]:
+        leaves[key] = node
+    return []
+
+
+def _replace_leaves(store, node_hash, entries):
+    """
+    Replace the item hashes of existing keys, rewriting the nodes on
+    the paths to their leaves.
+
+    :param entries: Sorted list of ``(key, item hash)`` pairs
+    :return: Hash of the new node
+    """
+    node = store[node_hash]
+    if isinstance(node, hippiehug.Nodes.Branch):
+        split = bisect_right([key for key, _ in entries], node.pivot)
+        left_hash, right_hash = node.left_branch, node.right_branch
+        if split > 0:
+            left_hash = _replace_leaves(store, left_hash, entries[:split])
+        if split < len(entries):
+            right_hash = _replace_leaves(store, right_hash, entries[split:])
+        new_node = hippiehug.Nodes.Branch(node.pivot, left_hash, right_hash)
+    else:
+        (key, item_hash), = entries
+        new_node = hippiehug.Nodes.Leaf(item_hash, key)
+    store[new_node.hid] = new_node
+    return new_node.hid
+
+
+def _build_nodes(entries, add_node):
+    """
+    Build tree nodes for ``(key, item hash)`` entries bottom-up.
+
+    Reproduces the structure that ``hippiehug.Tree.multi_add`` gives
+    the same entries. There, the first two entries of a sequence
+    become a branch pivoted at the smaller key, and the rest of the
+    sequence is split between the two sides, order preserved. The
+    first of repeated keys wins.
+
+    :param add_node: Function called with the hash and the node of
+            every new node, children before their parents
+    :return: Root node
+    """
+    seen = set()
+    unique_entries = []
+    for key, item in entries:
+        if key not in seen:
+            seen.add(key)
+            unique_entries.append((key, item))
+
+    # Top-down pass, fixing pivots. Parents precede their children in
+    # ``branches``, so reversing it visits children first.
+    branches = []
+    results = {}
+    stack = [(unique_entries, None, None)]
+    while stack:
+        seq, parent, side = stack.pop()
+        if len(seq) == 1:
+            key, item = seq[0]
+            node = hippiehug.Nodes.Leaf(item, key)
+            add_node(node.hid, node)
+            results[(parent, side)] = node
+            continue
+        pivot = min(seq[0][0], seq[1][0])
+        left = [entry for entry in seq if entry[0] <= pivot]
+        right = [entry for entry in seq if entry[0] > pivot]
+        branch_id = len(branches)
+        branches.append((pivot, parent, side))
+        stack.append((left, branch_id, 'left'))
+        stack.append((right, branch_id, 'right'))
+
+    # Bottom-up pass, hashing every branch once
+    for branch_id in reversed(range(len(branches))):
+        pivot, parent, side = branches[branch_id]
+        node = hippiehug.Nodes.Branch(pivot,
+                results.pop((branch_id, 'left')).hid,
+                results.pop((branch_id, 'right')).hid)
+        add_node(node.hid, node)
+        results[(parent, side)] = node
+
+    return results[(None, None)]
+
+
+def _store_batch(store, items):
+    if hasattr(store, 'update'):
+        store.update(items)
+    else:
+        for lookup_key, value in items:
+            store[lookup_key] = value
+
+
+class _BatchWriter(object):
+    """Writes values to a store in batches of ``batch_size``."""
+    def __init__(self, store, batch_size=None):
+        self._store = store
+        self._batch_size = batch_size
+        self._items = []
+
+    def add(self, lookup_key, value):
+        self._items.append((lookup_key, value))
+        if self._batch_size and len(self._items) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._items:
+            _store_batch(self._store, self._items)
+            self._items = []
+
+
+def _unwrap(store):
+    if isinstance(store, ObjectStore):
+        return store._backend
+    return store
+
+
+def _get_many(store, lookup_keys):
+    if hasattr(store, 'get_many'):
+        return store.get_many(lookup_keys)
+    values = {}
+    for lookup_key in lookup_keys:
+        try:
+            values[lookup_key] = store[lookup_key]
+        except KeyError:
+            pass
+    return values
+
+
+def _mark_root(store, root_hash):
+    """Tell a caching store where the walk of a tree starts."""
+    store = _unwrap(store)
+    if root_hash is not None and hasattr(store, 'mark_root'):
+        store.mark_root(root_hash)
+
+
+@contextmanager
+def _no_batch():
+    yield
+
+
+def _batch(store):
+    """Batch of writes to a store, if the store supports batching."""
+    if hasattr(store, 'batch'):
+        return store.batch()
+    return _no_batch()
+
 
 def check_evidence(root_hash, evidence, lookup_key):
     """
@@ -0,0 +1,240 @@
+"""
+Validation of whole chains.
+
+Signatures are verified in worker processes if an executor is given.
+Like in :py:mod:`claimchain.parallel`, public parameters are shipped to
+the workers exported, along with the signatures and keys in their
+ASCII encodings.
+"""
+
+import os
+from copy import copy
+
+from hippiehug.Chain import get_fingers
+from petlib.ec import EcPt
+
+from .crypto import PublicParams, verify_signature
+from .parallel import export_public_params, import_public_params
+from .state import Payload, _decode_signature
+from .utils import ascii2pet
+
+
+DEFAULT_CHUNK_SIZE = 256
+
+
+def _unsigned_hash(block):
+    # Blocks are signed before the signature is put into ``aux``. Hash
+    # a copy, so that blocks shared with other readers are not touched.
+    unsigned = copy(block)
+    unsigned.aux = None
+    return unsigned.hash()
+
+
+def _expected_fingers(prev_hash, prev_block):
+    finger_index = get_fingers(prev_block.index + 1)
+    return [(prev_block.index, prev_hash)] + \
+           [tuple(f) for f in prev_block.fingers if f[0] in finger_index]
+
+
+def _import_key(sig_pk, binary):
+    if binary:
+        return EcPt.from_binary(sig_pk, PublicParams.get_default().ec_group)
+    return ascii2pet(sig_pk)
+
+
+def _same_key(key, other_key):
+    if key == other_key:
+        return True
+    # Keys of blocks of different payload versions are encoded differently
+    try:
+        return _import_key(*key) == _import_key(*other_key)
+    except Exception:
+        return False
+
+
+def _verify_signatures(tasks):
+    keys = {}
+    invalid = []
+    for index, message, aux, sig_pk, binary in tasks:
+        try:
+            pk = keys.get(sig_pk)
+            if pk is None:
+                pk = keys[sig_pk] = _import_key(sig_pk, binary)
+            valid = verify_signature(pk, _decode_signature(aux), message)
+        except Exception:
+            valid = False
+        if not valid:
+            invalid.append(index)
+    return invalid
+
+
+# Imported public parameters in this (worker) process, keyed by export
+_imported_public_params = {}
+
+
+def _verify_signatures_chunk(exported_pp, tasks):
+    pp = _imported_public_params.get(exported_pp)
+    if pp is None:
+        pp = import_public_params(dict(exported_pp))
+        _imported_public_params.clear()
+        _imported_public_params[exported_pp] = pp
+    with pp.as_default():
+        return _verify_signatures(tasks)
+
+
+class ChainValidator(object):
+    """
+    Validator of a chain, block by block, from the genesis block.
+
+    Every block has to be stored under its hash, have the index and the
+    fingers that ``hippiehug`` gives the successor of the previous
+    block, and carry a valid signature of the unsigned block under the
+    signing key in the metadata of its payload. The signing key is the
+    one of the genesis block: a block that declares another key is
+    rejected, even if it is validly signed with it.
+
+    The last validated block is kept as a checkpoint. Validating a later
+    head of the same chain only reads and checks the blocks added since.
+
+    >>> import hippiehug
+    >>> from claimchain import State, LocalParams
+    >>> with LocalParams.generate().as_default():
+    ...     state = State()
+    ...     chain = hippiehug.Chain({})
+    ...     head = state.commit(chain)
+    ...     head = state.commit(chain)
+    >>> validator = ChainValidator(chain.store)
+    >>> validator.validate(chain.head)
+    2
+    >>> validator.validate(chain.head)
+    0
+
+    :param store: Store holding the chain
+    :param str checkpoint_path: File to persist the checkpoint in
+    """
+    def __init__(self, store, checkpoint_path=None):
+        self.store = store
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = None
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'rb') as f:
+                index, _, block_hash = f.read().partition(b' ')
+            self.checkpoint = (int(index), block_hash)
+
+    def _save_checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        index, block_hash = self.checkpoint
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(str(index).encode('ascii') + b' ' + block_hash)
+        os.rename(tmp_path, self.checkpoint_path)
+
+    def _read_block(self, block_hash):
+        try:
+            block = self.store[block_hash]
+        except KeyError:
+            raise ValueError('Block is missing from the store.')
+        if block.hid != block_hash:
+            raise ValueError('Hash of the block is not the lookup key')
+        return block
+
+    def _signing_key(self, block):
+        try:
+            payload = Payload.parse(block.items[0])
+            sig_pk = payload.metadata.params['sig_pk']
+        except Exception:
+            raise ValueError('Block %d has no valid payload.' % block.index)
+        return sig_pk, payload.version >= 2
+
+    def _signature_task(self, block, signing_key):
+        if block.aux is None:
+            raise ValueError('Block %d is not signed.' % block.index)
+        sig_pk, binary = signing_key
+        return (block.index, _unsigned_hash(block), block.aux, sig_pk,
+                binary)
+
+    def validate(self, head, executor=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Validate the chain up to ``head``.
+
+        The chain is walked back from the head to the checkpoint, or to
+        the genesis block. Signatures are collected along the way, and
+        verified in chunks, in parallel if an executor is given. Only
+        when all blocks are valid, the head becomes the checkpoint.
+
+        :param bytes head: Head of the chain
+        :param executor: ``concurrent.futures`` executor, such as a
+                ``ProcessPoolExecutor``. If ``None``, verify serially.
+        :param int chunk_size: Number of signatures per task
+        :return: Number of newly validated blocks
+        :raises ValueError: If the chain is not valid, or does not extend
+                the checkpoint
+        """
+        exported_pp = tuple(sorted(
+                export_public_params(PublicParams.get_default()).items()))
+        results = []
+        tasks = []
+
+        def submit(tasks):
+            if executor is None:
+                results.append(_verify_signatures(tasks))
+            else:
+                results.append(executor.submit(
+                        _verify_signatures_chunk, exported_pp, tasks))
+
+        num_blocks = 0
+        block_hash = head
+        block = self._read_block(block_hash)
+        head_index = block.index
+        if self.checkpoint is not None and head_index < self.checkpoint[0]:
+            raise ValueError('Head is behind the checkpoint.')
+        # Signing key of the block after the current one
+        next_key = None
+        while True:
+            checkpoint_reached = self.checkpoint is not None \
+                    and block.index <= self.checkpoint[0]
+            if checkpoint_reached \
+                    and (block.index, block_hash) != self.checkpoint:
+                raise ValueError('Chain does not extend the validated chain.')
+            if not checkpoint_reached or next_key is not None:
+                signing_key = self._signing_key(block)
+                if next_key is not None \
+                        and not _same_key(signing_key, next_key):
+                    raise ValueError('Block %d changes the signing key.'
+                                     % (block.index + 1))
+                next_key = signing_key
+            if checkpoint_reached:
+                break
+
+            num_blocks += 1
+            tasks.append(self._signature_task(block, signing_key))
+            if len(tasks) >= chunk_size:
+                submit(tasks)
+                tasks = []
+
+            if block.index == 0:
+                if block.fingers:
+                    raise ValueError('Genesis block has fingers.')
+                break
+            if not block.fingers or block.fingers[0][0] != block.index - 1:
+                raise ValueError('Block %d does not link to the previous '
+                                 'block.' % block.index)
+            prev_hash = block.fingers[0][1]
+            prev_block = self._read_block(prev_hash)
+            fingers = [tuple(finger) for finger in block.fingers]
+            if fingers != _expected_fingers(prev_hash, prev_block):
+                raise ValueError('Block %d has wrong fingers.' % block.index)
+            block_hash, block = prev_hash, prev_block
+        if tasks:
+            submit(tasks)
+
+        for result in results:
+            invalid = result if executor is None else result.result()
+            if invalid:
+                raise ValueError('Invalid signature in block %d.'
+                                 % min(invalid))
+
+        if num_blocks:
+            self.checkpoint = (head_index, head)
+            self._save_checkpoint()
+        return num_blocks
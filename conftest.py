@@ -0,0 +1,6 @@
+import sys
+
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore += ['claimchain/aio.py', 'tests/test_aio.py']
@@ -28,13 +28,15 @@ setup(
     ],
     install_requires=[
         'six',
-        'petlib',
+        # Relies on the bindings of petlib: _C, _FFI, and get_ctx
+        'petlib >= 0.0.43, < 0.1',
         'pyyaml',
         'attrs',
         'base58',
         'statistics',
         'defaultcontext',
         'hippiehug >= 0.1.3',
+        'msgpack >= 0.5.2',
         'profiled'
     ],
 
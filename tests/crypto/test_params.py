@@ -1,7 +1,7 @@
 import json
 import pytest
 
-from petlib.ec import EcPt
+from petlib.ec import EcGroup, EcPt
 
 from claimchain.crypto.params import PublicParams, LocalParams
 
@@ -48,3 +48,40 @@ def test_local_params_private_export(local_params):
 
     assert local_params1.vrf.sk == local_params.vrf.sk
     assert local_params1.sig.sk == local_params.sig.sk
+
+
+def test_public_params_mul_generator():
+    pp = PublicParams(ec_group=EcGroup(optimize_mult=False))
+    G = pp.ec_group
+    g = G.generator()
+    k, m = G.order().random(), G.order().random()
+    pt = m * g
+
+    assert pp.mul_generator(k) == k * g
+    assert pp.mul_generator(k, pt, m) == k * g + m * pt
+
+
+def test_public_params_mul_generator_from_threads(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from claimchain.crypto import params
+
+    precomputed = []
+    bindings = params._C
+    class CountingBindings(object):
+        def __getattr__(self, name):
+            return getattr(bindings, name)
+
+        def EC_GROUP_precompute_mult(self, *args):
+            precomputed.append(args)
+            return bindings.EC_GROUP_precompute_mult(*args)
+    monkeypatch.setattr(params, "_C", CountingBindings())
+
+    pp = PublicParams(ec_group=EcGroup(optimize_mult=False))
+    G = pp.ec_group
+    g = G.generator()
+    scalars = [G.order().random() for _ in range(32)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(pp.mul_generator, scalars))
+
+    assert results == [k * g for k in scalars]
+    assert len(precomputed) == 1
@@ -1,7 +1,8 @@
 import pytest
 
 from claimchain.crypto.params import LocalParams
-from claimchain.crypto.vrf import compute_vrf, verify_vrf
+from claimchain.crypto.vrf import compute_vrf, compute_vrf_value, verify_vrf
+from claimchain.crypto.vrf import compute_vrf_batch, verify_vrf_batch
 
 
 @pytest.fixture()
@@ -37,3 +38,25 @@ def test_vrf_deterministic_value(local_params):
     vrf2 = compute_vrf(b"test@test.com")
     assert vrf1.value == vrf2.value
 
+
+def test_vrf_value_without_proof(local_params):
+    vrf = compute_vrf(b"test@test.com")
+    assert compute_vrf_value(b"test@test.com") == vrf.value
+
+
+def test_vrf_batch_correct(local_params):
+    messages = [b"test%d@test.com" % i for i in range(5)]
+    vrfs = compute_vrf_batch(messages)
+    assert [vrf.value for vrf in vrfs] == \
+           [compute_vrf(message).value for message in messages]
+    assert all(verify_vrf(local_params.vrf.pk, vrf, message)
+               for vrf, message in zip(vrfs, messages))
+    assert verify_vrf_batch(local_params.vrf.pk, vrfs, messages) == [True] * 5
+
+
+def test_vrf_batch_incorrect_items(local_params):
+    messages = [b"test%d@test.com" % i for i in range(3)]
+    vrfs = [compute_vrf(message) for message in messages]
+    vrfs[1] = vrfs[0]
+    assert verify_vrf_batch(local_params.vrf.pk, vrfs, messages) == \
+           [True, False, True]
@@ -0,0 +1,212 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from hippiehug import Chain
+
+from claimchain import State, View, ViewCache, LocalParams
+from claimchain.aio import AsyncObjectStore, AsyncTree, AsyncView
+from claimchain.utils import Tree, Blob
+
+
+class CountingBackend(object):
+    """Asynchronous in-memory backend that counts requests."""
+
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+        self.writes = 0
+
+    async def get_many(self, lookup_keys):
+        self.reads += 1
+        await asyncio.sleep(0)
+        return [self.data.get(lookup_key) for lookup_key in lookup_keys]
+
+    async def update(self, items):
+        self.writes += 1
+        self.data.update(items)
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def local_params():
+    with LocalParams.generate().as_default() as params:
+        yield params
+
+
+def test_async_store(loop):
+    backend = CountingBackend()
+    store = AsyncObjectStore(backend)
+    blob = Blob(b"test")
+
+    loop.run_until_complete(store.update([(blob.hid, blob)]))
+    assert loop.run_until_complete(store.get(blob.hid)) == b"test"
+    with pytest.raises(KeyError):
+        loop.run_until_complete(store.get(b"missing"))
+
+    backend.data[blob.hid] = Blob(b"tampered")
+    with pytest.raises(ValueError):
+        loop.run_until_complete(store.get(blob.hid))
+
+
+def test_async_tree_fetches_level_by_level(loop):
+    items = {b"key%d" % i: Blob(b"value%d" % i) for i in range(100)}
+    backend = CountingBackend()
+    tree = Tree.from_items(backend.data, items)
+    # Plain dictionaries work too
+    for store_backend in [backend, backend.data]:
+        async_tree = AsyncTree(AsyncObjectStore(store_backend),
+                               tree.root_hash)
+        values = loop.run_until_complete(
+                async_tree.get_many(list(items) + [b"missing"]))
+        assert values == items
+
+    backend.reads = 0
+    async_tree = AsyncTree(AsyncObjectStore(backend), tree.root_hash)
+    root_hash, nodes, leaves = loop.run_until_complete(
+            async_tree.evidence_many(items))
+    _, expected_nodes, _ = tree.evidence_many(items)
+    assert {node.hid for node in nodes} == \
+           {node.hid for node in expected_nodes}
+    depth = max(len(tree.evidence(key)[1]) for key in items)
+    assert backend.reads == depth
+
+
+def commit_claims_async(loop, state, backend, claims, caps):
+    for claim_label, claim_content in claims:
+        state[claim_label] = claim_content
+    for reader_dh_pk, claim_labels in caps:
+        state.grant_access(reader_dh_pk, claim_labels)
+    chain = Chain(AsyncObjectStore(backend))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        head = loop.run_until_complete(
+                state.commit_async(chain, thread_executor=executor))
+    assert chain.head == head
+    return chain
+
+
+def test_commit_async_and_async_view(loop):
+    reader_params = LocalParams.generate()
+    backend = CountingBackend()
+    state = State()
+    chain = commit_claims_async(loop, state, backend,
+            [("marios", "test1"), ("bogdan", "test2")],
+            [(reader_params.dh.pk, ["marios"])])
+    assert backend.writes == 1
+
+    # Readable synchronously from the same data
+    assert View(Chain(backend.data, root_hash=chain.head))["marios"] == \
+           b"test1"
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        own_view = loop.run_until_complete(AsyncView.load(
+                chain.store, chain.head, executor=executor,
+                cache=ViewCache()))
+        assert loop.run_until_complete(own_view.lookup("bogdan")) == b"test2"
+
+        with reader_params.as_default():
+            view = loop.run_until_complete(AsyncView.load(
+                    chain.store, chain.head, executor=executor))
+            claims = loop.run_until_complete(
+                    view.get_many(["marios", "bogdan"]))
+            assert claims["marios"] == b"test1"
+            assert isinstance(claims["bogdan"], KeyError)
+            assert loop.run_until_complete(view.get("bogdan")) is None
+
+
+def test_commit_async_incremental(loop):
+    backend = CountingBackend()
+    state = State()
+    chain = commit_claims_async(loop, state, backend,
+            [("label%d" % i, "content%d" % i) for i in range(10)], [])
+    first_head = chain.head
+
+    state["label10"] = "content10"
+    head = loop.run_until_complete(state.commit_async(chain,
+                                                      incremental=True))
+    assert head != first_head
+    assert backend.writes == 2
+
+    view = loop.run_until_complete(AsyncView.load(chain.store, head))
+    claims = loop.run_until_complete(
+            view.get_many(["label%d" % i for i in range(11)]))
+    assert claims == {"label%d" % i: b"content%d" % i for i in range(11)}
+
+
+def test_concurrent_commits_to_one_store(loop):
+    backend = CountingBackend()
+    store = AsyncObjectStore(backend)
+    states = []
+    for i in range(4):
+        state = State()
+        for j in range(10):
+            state["label%d" % j] = "content%d-%d" % (i, j)
+        states.append(state)
+
+    async def commit_all(executor):
+        return await asyncio.gather(*[
+                state.commit_async(Chain(store), thread_executor=executor)
+                for state in states])
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        heads = loop.run_until_complete(commit_all(executor))
+
+    for i, head in enumerate(heads):
+        view = loop.run_until_complete(
+                AsyncView.load(AsyncObjectStore(backend), head))
+        claims = loop.run_until_complete(
+                view.get_many(["label%d" % j for j in range(10)]))
+        assert claims == {"label%d" % j: b"content%d-%d" % (i, j)
+                          for j in range(10)}
+
+
+def test_blocking_stores_do_not_keep_loops_alive():
+    import gc
+    store = AsyncObjectStore(CountingBackend())
+    state = State()
+    state["marios"] = "test"
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(state.commit_async(Chain(store)))
+    loop.close()
+    del loop
+    gc.collect()
+    assert len(store._blocking_stores) == 0
+
+
+def test_commit_async_with_process_pool(loop):
+    from concurrent.futures import ProcessPoolExecutor
+    backend = CountingBackend()
+    state = State()
+    for i in range(10):
+        state["label%d" % i] = "content%d" % i
+    chain = Chain(AsyncObjectStore(backend))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        head = loop.run_until_complete(
+                state.commit_async(chain, executor=executor))
+
+    view = loop.run_until_complete(AsyncView.load(chain.store, head))
+    claims = loop.run_until_complete(
+            view.get_many(["label%d" % i for i in range(10)]))
+    assert claims == {"label%d" % i: b"content%d" % i for i in range(10)}
+
+
+def test_many_concurrent_lookups(loop):
+    backend = CountingBackend()
+    state = State()
+    chain = commit_claims_async(loop, state, backend,
+            [("label%d" % i, "content%d" % i) for i in range(10)], [])
+    view = loop.run_until_complete(AsyncView.load(chain.store, chain.head))
+
+    async def lookup_all():
+        return await asyncio.gather(*[view.lookup("label%d" % (i % 10))
+                                      for i in range(50)])
+
+    claims = loop.run_until_complete(lookup_all())
+    assert claims == [b"content%d" % (i % 10) for i in range(50)]
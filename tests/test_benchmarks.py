@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from benchmarks import run_benchmarks, compare_results
+from benchmarks.__main__ import main
+
+
+@pytest.fixture(scope='module')
+def results():
+    config = {'claims': [8, 16], 'readers': [2], 'grants': [2]}
+    return run_benchmarks(config, pattern='wrappers.Tree.evidence',
+                          repeat=2)
+
+
+def test_results_per_parameter_combination(results):
+    names_and_params = sorted(
+            (result['name'], result['params']['claims'])
+            for result in results['results'])
+    assert names_and_params == [
+        ('wrappers.Tree.evidence', 8),
+        ('wrappers.Tree.evidence', 16),
+        ('wrappers.Tree.evidence_many', 8),
+        ('wrappers.Tree.evidence_many', 16),
+    ]
+    for result in results['results']:
+        assert len(result['times']) == 2
+        # Claims, and two capabilities for each of the two readers
+        assert result['ops'] == result['params']['claims'] + 4
+        assert result['ops_per_sec'] > 0
+        assert 'peak_memory_bytes' in result
+    json.dumps(results)
+
+
+def test_benchmarks_only_run_for_their_params():
+    config = {'claims': [4], 'readers': [1, 2], 'grants': [1]}
+    results = run_benchmarks(config, pattern='crypto.sign', repeat=1,
+                             memory=False)
+    assert [result['params'] for result in results['results']] == \
+           [{'claims': 4}]
+    assert results['results'][0]['peak_memory_bytes'] is None
+
+
+def test_compare_flags_regressions(results):
+    slower = json.loads(json.dumps(results))
+    slower['results'][0]['ops_per_sec'] *= 0.5
+    slower['results'][1]['ops_per_sec'] *= 0.95
+
+    rows = compare_results(results, slower, threshold=0.1)
+    assert len(rows) == len(results['results'])
+    assert [row[-1] for row in rows] == [True, False, False, False]
+    assert rows[0][4] == pytest.approx(-0.5)
+
+
+def test_compare_command(tmpdir, results):
+    baseline = tmpdir.join('baseline.json')
+    baseline.write(json.dumps(results))
+    assert main(['compare', str(baseline), str(baseline)]) == 0
+
+    slower = json.loads(json.dumps(results))
+    for result in slower['results']:
+        result['ops_per_sec'] /= 2
+    current = tmpdir.join('current.json')
+    current.write(json.dumps(slower))
+    assert main(['compare', str(baseline), str(current)]) == 1
+    assert main(['compare', str(baseline), str(current),
+                 '--threshold', '0.6']) == 0
@@ -1,9 +1,12 @@
+import pytest
+
 from petlib.ec import EcGroup
 
-from claimchain.core import encode_claim, decode_claim
+from claimchain.core import encode_claim, decode_claim, encode_claim_batch
 from claimchain.core import encode_capability, decode_capability, \
         get_capability_lookup_key
 from claimchain.core import _compute_claim_key
+from claimchain.core import shared_secret_cache, CapabilityContext, Codec
 from claimchain.crypto import PublicParams, LocalParams
 
 
@@ -21,6 +24,20 @@ def test_encode_claim_correctness():
         assert claim2 == claim_body
 
 
+def test_encode_claim_batch_correctness():
+    nonce = b"42"
+    claims = [(b"label%d" % i, b"claim%d" % i) for i in range(3)]
+
+    with LocalParams.generate().as_default() as params:
+        encoded = encode_claim_batch(nonce, claims)
+        for (claim_label, claim_body), enc in zip(claims, encoded):
+            vrf_value, lookup_key, encrypted_body = enc
+            assert (vrf_value, lookup_key) == \
+                    encode_claim(nonce, claim_label, claim_body)[:2]
+            assert decode_claim(params.vrf.pk, nonce, claim_label,
+                                vrf_value, encrypted_body) == claim_body
+
+
 def test_encode_cap_correctness():
     owner_params = LocalParams.generate()
     reader_params = LocalParams.generate()
@@ -46,3 +63,111 @@ def test_encode_cap_correctness():
 
     claim_lookup_key = _compute_claim_key(vrf_value, mode='lookup')
     assert claim_lookup_key == claim_lookup_key2
+
+
+def test_shared_secret_cache_one_dh_per_reader():
+    owner_params = LocalParams.generate()
+    reader_params = LocalParams.generate()
+    nonce = b"42"
+    labels = [b"label%d" % i for i in range(5)]
+    shared_secret_cache.clear()
+
+    with owner_params.as_default():
+        encoded = [encode_capability(reader_params.dh.pk, nonce, label, b"1337")
+                   for label in labels]
+    assert shared_secret_cache.misses == 1
+    assert shared_secret_cache.hits == len(labels) - 1
+
+    with reader_params.as_default():
+        for label, (lookup_key, encrypted_capability) in zip(labels, encoded):
+            assert lookup_key == get_capability_lookup_key(
+                    owner_params.dh.pk, nonce, label)
+            vrf_value, _ = decode_capability(
+                    owner_params.dh.pk, nonce, label, encrypted_capability)
+            assert vrf_value == b"1337"
+    assert shared_secret_cache.misses == 2
+
+
+def test_capability_context_matches_key_derivation():
+    owner_params = LocalParams.generate()
+    reader_params = LocalParams.generate()
+    nonce = b"42"
+    labels = [b"label%d" % i for i in range(5)]
+
+    with owner_params.as_default():
+        pp = PublicParams.get_default()
+        shared_secret = owner_params.dh.sk * reader_params.dh.pk
+        shared_secret_hash = pp.hash_func(shared_secret.export()).digest()
+        context = CapabilityContext(reader_params.dh.pk, nonce)
+        for label in labels:
+            assert context.lookup_key(label) == pp.hash_func(
+                    b"cap_lookup|42|%s|%s" % (shared_secret_hash, label)) \
+                    .digest()[:pp.lookup_key_size]
+            assert context.enc_key(label) == pp.hash_func(
+                    b"cap_enc|42|%s|%s" % (shared_secret_hash, label)) \
+                    .digest()[:pp.enc_key_size]
+        encoded = [context.encode(label, b"1337") for label in labels]
+
+    with reader_params.as_default():
+        context = CapabilityContext(owner_params.dh.pk, nonce)
+        for label, (lookup_key, encrypted_capability) in zip(labels, encoded):
+            assert context.lookup_key(label) == lookup_key
+            vrf_value, claim_lookup_key = context.decode(
+                    label, encrypted_capability)
+            assert vrf_value == b"1337"
+            assert claim_lookup_key == _compute_claim_key(
+                    b"1337", mode='lookup')
+
+
+def test_codec_without_defaults():
+    owner_params = LocalParams.generate()
+    reader_params = LocalParams.generate()
+    pp = PublicParams()
+    owner_codec = Codec(pp, owner_params)
+    reader_codec = Codec(pp, reader_params)
+    nonce = b"42"
+    claims = [(b"label%d" % i, b"claim%d" % i) for i in range(3)]
+
+    encoded = owner_codec.encode_claim_batch(nonce, claims)
+    for (claim_label, claim_body), enc in zip(claims, encoded):
+        vrf_value, lookup_key, encrypted_body = enc
+        assert lookup_key == owner_codec.compute_claim_key(
+                vrf_value, mode='lookup')
+        assert vrf_value == owner_codec.compute_vrf_value(
+                b"lab_42.%s" % claim_label)
+
+        cap_lookup_key, encrypted_capability = owner_codec.encode_capability(
+                reader_params.dh.pk, nonce, claim_label, vrf_value)
+        assert cap_lookup_key == reader_codec.get_capability_lookup_key(
+                owner_params.dh.pk, nonce, claim_label)
+        assert reader_codec.decode_capability(
+                owner_params.dh.pk, nonce, claim_label,
+                encrypted_capability) == (vrf_value, lookup_key)
+        assert reader_codec.decode_claim(
+                owner_params.vrf.pk, nonce, claim_label, vrf_value,
+                encrypted_body) == claim_body
+
+    with pytest.raises(ValueError):
+        owner_codec.compute_claim_key(b"1337", mode='other')
+
+
+def test_codec_matches_module_functions():
+    nonce = b"42"
+    claim_label = b"marios@marios.com"
+    reader_params = LocalParams.generate()
+
+    with LocalParams.generate().as_default() as params:
+        codec = Codec()
+        assert codec.local_params is params
+        vrf_value, lookup_key, encrypted_body = codec.encode_claim(
+                nonce, claim_label, b"content")
+        assert (vrf_value, lookup_key) == \
+                encode_claim(nonce, claim_label, b"content")[:2]
+        assert decode_claim(params.vrf.pk, nonce, claim_label, vrf_value,
+                            encrypted_body) == b"content"
+        assert codec.compute_claim_key(vrf_value) == \
+                _compute_claim_key(vrf_value)
+        assert codec.capability_context(reader_params.dh.pk, nonce) \
+                .enc_key(claim_label) == \
+                CapabilityContext(reader_params.dh.pk, nonce) \
+                .enc_key(claim_label)
@@ -0,0 +1,59 @@
+import pytest
+import hippiehug
+
+from claimchain import ChainIndex
+
+
+def build_chain(store, num_blocks, start=0):
+    chain = hippiehug.Chain(store)
+    for i in range(start, start + num_blocks):
+        chain.multi_add([{"timestamp": 10 * i}])
+    return chain
+
+
+def test_index_is_built_incrementally():
+    chain = build_chain({}, 5)
+    chain_index = ChainIndex(chain.store)
+    assert chain_index.update(chain.head) == 5
+    assert chain_index.update(chain.head) == 0
+
+    for i in range(5, 8):
+        chain.multi_add([{"timestamp": 10 * i}])
+    assert chain_index.update(chain.head) == 3
+    assert len(chain_index) == 8
+    assert chain_index.head == chain.head
+    assert chain_index.index_at(70) == 7
+    assert chain_index.index_at(69.9) == 6
+    assert chain_index.index_at(1000, end=4) == 3
+    with pytest.raises(KeyError):
+        chain_index.index_at(-1)
+
+
+def test_index_rejects_other_chain():
+    store = {}
+    chain = build_chain(store, 3)
+    chain_index = ChainIndex(store)
+    chain_index.update(chain.head)
+    other_chain = build_chain(store, 4, start=100)
+    with pytest.raises(ValueError):
+        chain_index.update(other_chain.head)
+
+
+def test_index_persists(tmpdir):
+    path = str(tmpdir.join("chain.idx"))
+    chain = build_chain({}, 5)
+    with ChainIndex(chain.store, path=path) as chain_index:
+        chain_index.update(chain.head)
+
+    chain.multi_add([{"timestamp": 50}])
+    with ChainIndex(chain.store, path=path) as chain_index:
+        assert len(chain_index) == 5
+        assert chain_index.update(chain.head) == 1
+
+    # Incomplete record at the end is dropped
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 5)
+    with ChainIndex(chain.store, path=path) as chain_index:
+        assert len(chain_index) == 6
+        assert chain_index.block_hash(5) == chain.head
+        assert chain_index.timestamp(5) == 50
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+import hippiehug
+
+from claimchain import View, LocalParams
+from claimchain.host import ClaimChainHost
+from claimchain.utils import FileStore
+
+
+class FileStoreFactory(object):
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, owner_id):
+        return FileStore(os.path.join(self.root, owner_id))
+
+
+@pytest.fixture
+def owners():
+    return {"owner%d" % i: LocalParams.generate() for i in range(4)}
+
+
+def read_claim(root, owner_id, head, reader_params, claim_label):
+    with FileStore(os.path.join(root, owner_id)) as store:
+        with reader_params.as_default():
+            return View(hippiehug.Chain(store, root_hash=head))[claim_label]
+
+
+def test_commits_of_many_owners(tmpdir, owners):
+    reader_params = LocalParams.generate()
+    root = str(tmpdir)
+    with ClaimChainHost(num_shards=2,
+                        store_factory=FileStoreFactory(root)) as host:
+        futures = {}
+        for owner_id, params in owners.items():
+            host.add_owner(owner_id, params)
+            futures[owner_id] = host.commit(
+                    owner_id, claims={"marios": "test %s" % owner_id},
+                    grants=[(reader_params.dh.pk, ["marios"])])
+        heads = {owner_id: future.result(timeout=30)
+                 for owner_id, future in futures.items()}
+        stats = host.stats()
+
+    assert sum(shard["owners"] for shard in stats) == len(owners)
+    assert sum(shard["commits"] for shard in stats) == len(owners)
+    for owner_id, head in heads.items():
+        assert host.head(owner_id) == head
+        assert read_claim(root, owner_id, head, reader_params, "marios") \
+               == ("test %s" % owner_id).encode()
+
+
+def test_requests_are_coalesced(tmpdir, owners):
+    owner_id, params = sorted(owners.items())[0]
+    reader_params = LocalParams.generate()
+    root = str(tmpdir)
+    with ClaimChainHost(num_shards=1,
+                        store_factory=FileStoreFactory(root)) as host:
+        host.add_owner(owner_id, params)
+        # Keep the shard busy while the next requests come in
+        first = host.commit(owner_id, claims=[
+                ("label%d" % i, "content") for i in range(50)])
+        futures = [host.commit(owner_id, claims={"marios": "test%d" % i})
+                   for i in range(5)]
+        futures.append(host.commit(
+                owner_id, grants=[(reader_params.dh.pk, ["marios"])]))
+        heads = [future.result(timeout=30) for future in futures]
+        stats = host.stats()[0]
+
+    assert len(set(heads)) == 1
+    assert heads[0] != first.result()
+    assert stats["requests"] == 7
+    assert stats["commits"] == 2
+    assert stats["latency_max"] >= stats["latency_p50"] > 0
+    assert read_claim(root, owner_id, heads[0], reader_params, "marios") \
+           == b"test4"
+
+
+class FailingStore(dict):
+    def __setitem__(self, key, value):
+        raise IOError("Disk full")
+
+    def update(self, items):
+        raise IOError("Disk full")
+
+
+def failing_store(owner_id):
+    return FailingStore()
+
+
+def test_failed_commit(owners):
+    owner_id, params = sorted(owners.items())[0]
+    with ClaimChainHost(num_shards=1, store_factory=failing_store) as host:
+        host.add_owner(owner_id, params)
+        with pytest.raises(ValueError):
+            host.add_owner(owner_id, params)
+        with pytest.raises(KeyError):
+            host.commit("unknown", claims={"marios": "test"})
+
+        future = host.commit(owner_id, claims={"marios": "test"})
+        with pytest.raises(IOError):
+            future.result(timeout=30)
+        assert host.stats()[0]["failures"] == 1
+        assert host.head(owner_id) is None
+
+    with pytest.raises(RuntimeError):
+        host.commit(owner_id, claims={"marios": "test"})
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+import hippiehug
+from profiled import Profiler
+
+from claimchain import State, View, LocalParams
+from claimchain import instrumentation
+from claimchain.core import encode_claim
+from claimchain.instrumentation import Recorder
+
+
+@pytest.fixture(scope="module", autouse=True)
+def local_params():
+    with LocalParams.generate().as_default() as params:
+        yield params
+
+
+@pytest.fixture
+def chain():
+    reader_params = LocalParams.generate()
+    state = State()
+    state["marios"] = "test"
+    state["carmela"] = "test"
+    state.grant_access(reader_params.dh.pk, ["marios", "carmela"])
+    chain = hippiehug.Chain({})
+    state.commit(chain)
+    return chain, reader_params
+
+
+def metrics_by_key(recorder):
+    return {(metric["function"], metric["scope"]): metric
+            for metric in recorder.snapshot()["metrics"]}
+
+
+def test_nothing_recorded_while_disabled():
+    recorder = Recorder()
+    encode_claim(b"nonce", b"label", b"content")
+    assert recorder.snapshot() == {"metrics": []}
+    assert instrumentation.get_recorder() is None
+    assert Profiler.get_default() is None
+
+
+def test_enable_and_disable():
+    recorder = instrumentation.enable()
+    assert instrumentation.get_recorder() is recorder
+    encode_claim(b"nonce", b"label", b"content")
+    instrumentation.disable()
+    encode_claim(b"nonce", b"label", b"content")
+    assert Profiler.get_default() is None
+
+    metric = metrics_by_key(recorder)[("encode_claim", None)]
+    assert metric["calls"] == 1
+
+
+def test_profiled_functions_are_recorded():
+    from profiled import profiled
+
+    @profiled
+    def instrumented():
+        return 42
+
+    with Recorder() as recorder:
+        assert isinstance(Profiler.get_default(), Profiler)
+        assert instrumented() == 42
+    assert Profiler.get_default() is None
+    func_id = getattr(instrumented, "__qualname__", instrumented.__name__)
+    metric = metrics_by_key(recorder)[(func_id, None)]
+    assert metric["calls"] == 1
+
+
+def test_calls_attributed_to_commit():
+    state = State()
+    state["marios"] = "test"
+    state.grant_access(LocalParams.generate().dh.pk, ["marios"])
+    with Recorder() as recorder:
+        state.commit(hippiehug.Chain({}))
+
+    metrics = metrics_by_key(recorder)
+    assert metrics[("State.commit", "State.commit")]["calls"] == 1
+    assert metrics[("_build_tree", "State.commit")]["calls"] == 1
+    assert metrics[("_build_tree", "State.commit")]["bytes"] > 0
+    assert all(scope == "State.commit" for _, scope in metrics)
+
+    # Batched helpers on the commit path are recorded
+    assert metrics[("encode_claim_batch", "State.commit")]["calls"] == 1
+    assert metrics[("compute_vrf_batch", "State.commit")]["calls"] == 1
+    assert metrics[("CapabilityContext.encode", "State.commit")]["calls"] \
+            == 1
+
+
+def test_calls_attributed_to_views(chain):
+    chain, reader_params = chain
+    with reader_params.as_default(), Recorder() as recorder:
+        view = View(chain)
+        assert view["marios"] == b"test"
+        view.get_many(["marios", "carmela"])
+
+    metrics = metrics_by_key(recorder)
+    assert metrics[("View.__getitem__", "View.__getitem__")]["calls"] == 1
+    assert metrics[("View.get_many", "View.get_many")]["calls"] == 1
+    assert metrics[("decode_claim", "View.__getitem__")]["calls"] == 1
+    assert metrics[("verify_vrf_batch", "View.get_many")]["calls"] == 1
+    assert metrics[("CapabilityContext.decode", "View.get_many")]["calls"] \
+            == 2
+    assert ("decode_claim", None) not in metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    recorder = Recorder(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        recorder.record("f", seconds)
+    metric = metrics_by_key(recorder)[("f", None)]
+    assert metric["calls"] == 4
+    assert metric["seconds"] == pytest.approx(6.05)
+    assert metric["buckets"] == [[0.1, 1], [1.0, 3], [None, 4]]
+    json.loads(recorder.to_json())
+
+
+def test_prometheus_export():
+    recorder = Recorder(buckets=(0.1,))
+    recorder.record("f", 0.05)
+    recorder.record_bytes("f", 10)
+    lines = recorder.to_prometheus().splitlines()
+    assert '# TYPE claimchain_call_duration_seconds histogram' in lines
+    assert 'claimchain_calls_total{function="f",scope=""} 1' in lines
+    assert 'claimchain_input_bytes_total{function="f",scope=""} 10' in lines
+    assert 'claimchain_call_duration_seconds_bucket' \
+           '{function="f",scope="",le="0.1"} 1' in lines
+    assert 'claimchain_call_duration_seconds_bucket' \
+           '{function="f",scope="",le="+Inf"} 1' in lines
+    assert 'claimchain_call_duration_seconds_count' \
+           '{function="f",scope=""} 1' in lines
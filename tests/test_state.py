@@ -3,12 +3,12 @@ import pytest
 import hippiehug
 from petlib.pack import encode, decode
 
-from claimchain.state import State, View, Payload
+from claimchain.state import State, View, ViewCache, Payload, OwnerIndex
 from claimchain.core import get_capability_lookup_key
 from claimchain.core import _compute_claim_key, _salt_label
 from claimchain.crypto import PublicParams, LocalParams, compute_vrf
 from claimchain.utils import ascii2bytes
-from claimchain.utils import Tree, ObjectStore
+from claimchain.utils import Tree, Blob, ObjectStore, verify_evidence_bundle
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -36,6 +36,40 @@ def test_parse_payload(local_params):
     assert isinstance(exported['metadata'], dict)
 
 
+def test_parse_payload_versions(local_params):
+    tree = Tree()
+    tree[b"label"] = Blob(b"test")
+    for version in [1, 2]:
+        payload = Payload.build(tree, b"nonce", version=version)
+        item = payload.serialize()
+        assert isinstance(item, bytes) == (version == 2)
+        parsed = Payload.parse(item)
+        assert parsed == payload
+        assert parsed.decode_nonce() == b"nonce"
+        assert parsed.decode_mtr_hash() == tree.root_hash
+        assert parsed.decode_params().sig.pk == local_params.sig.pk
+
+
+def test_version_1_chain_stays_readable(state, monkeypatch):
+    import claimchain.state
+    from claimchain.validation import ChainValidator
+
+    state["marios"] = "test1"
+    chain = hippiehug.Chain({})
+    monkeypatch.setattr(claimchain.state, "PROTOCOL_VERSION", 1)
+    state.commit(chain)
+    assert isinstance(chain.store[chain.head].items[0], dict)
+    monkeypatch.undo()
+
+    state["marios"] = "test2"
+    state.commit(chain)
+    assert isinstance(chain.store[chain.head].items[0], bytes)
+    view = View(chain)
+    assert view["marios"] == b"test2"
+    assert view.at(index=0)["marios"] == b"test1"
+    assert ChainValidator(chain.store).validate(chain.head) == 2
+
+
 def test_add_claim(state):
     state["marios"] = "test"
     assert state["marios"] == "test"
@@ -72,11 +106,11 @@ def commit_claims(state, claims, caps=None):
     head = state.commit(chain)
 
     block = store[head]
-    block_content = block.items[0]
-    nonce = ascii2bytes(block_content['nonce'])
+    payload = Payload.parse(block.items[0])
+    nonce = payload.decode_nonce()
 
     # Get associated Merkle tree
-    mtr_hash = ascii2bytes(block_content['mtr_hash'])
+    mtr_hash = payload.decode_mtr_hash()
     tree = hippiehug.Tree(store, root_hash=mtr_hash)
     return nonce, chain, tree
 
@@ -127,6 +161,50 @@ def test_evidence(state):
         assert view["marios"] == b"test"
 
 
+def test_evidence_bulk(state):
+    readers = [LocalParams.generate() for _ in range(3)]
+    labels = ["label%d" % i for i in range(10)]
+    claims = [(label, "content %s" % label) for label in labels]
+    caps = [(reader.dh.pk, labels[:5 + i]) for i, reader in enumerate(readers)]
+    nonce, chain, tree = commit_claims(state, claims, caps)
+
+    pairs = [(reader_pk, label)
+             for reader_pk, reader_labels in caps
+             for label in reader_labels]
+    pairs.append((readers[0].dh.pk, "non-existent"))
+    evidence = state.compute_evidence_keys_bulk(pairs)
+    expected = set()
+    for reader_pk, label in pairs:
+        expected |= state.compute_evidence_keys(reader_pk, label)
+    assert evidence == expected
+
+    evidence_store = ObjectStore({k: tree.store[k] for k in evidence})
+    verification_tree = Tree(object_store=evidence_store, root_hash=tree.root())
+    for reader, (_, reader_labels) in zip(readers, caps):
+        with reader.as_default():
+            view = View(source_chain=chain, source_tree=verification_tree)
+            for label in reader_labels:
+                assert view[label] == ("content %s" % label).encode()
+
+
+def test_evidence_bundle(state):
+    reader_params = LocalParams.generate()
+    labels = ["label%d" % i for i in range(10)]
+    nonce, chain, tree = commit_claims(state,
+            [(label, "content %s" % label) for label in labels],
+            [(reader_params.dh.pk, labels[:5])])
+
+    bundle = state.compute_evidence_bundle(
+            [(reader_params.dh.pk, label) for label in labels[:5]])
+    evidence = verify_evidence_bundle(bundle, tree.root())
+    with reader_params.as_default():
+        view = View(source_chain=chain, source_tree=evidence)
+        for label in labels[:5]:
+            assert view[label] == ("content %s" % label).encode()
+        with pytest.raises(KeyError):
+            view[labels[5]]
+
+
 def test_view_missing_and_non_existent_label(state):
     reader_params = LocalParams.generate()
     _, chain, tree = commit_claims(state,
@@ -155,3 +233,419 @@ def test_view_label_retrieval(state):
         view = View(chain)
         assert view["marios"] == b"test1"
         assert view["bogdan"] == b"test2"
+
+
+def test_view_get_many(state):
+    reader_params = LocalParams.generate()
+    _, chain, tree = commit_claims(state,
+            [("marios", "test1"), ("bogdan", "test2"), ("george", "test3")],
+            [(reader_params.dh.pk, ["marios", "bogdan"])])
+    labels = ["marios", "bogdan", "george", "alice"]
+
+    own_claims = View(chain).get_many(labels)
+    assert own_claims["marios"] == b"test1"
+    assert own_claims["bogdan"] == b"test2"
+    assert own_claims["george"] == b"test3"
+    assert isinstance(own_claims["alice"], KeyError)
+
+    with reader_params.as_default():
+        view = View(chain)
+        claims = view.get_many(labels)
+        assert set(claims) == set(labels)
+        assert claims["marios"] == view["marios"] == b"test1"
+        assert claims["bogdan"] == view["bogdan"] == b"test2"
+        # No capability
+        assert isinstance(claims["george"], KeyError)
+        assert isinstance(claims["alice"], KeyError)
+
+
+def test_view_get_many_reports_errors_per_label(state):
+    reader_params = LocalParams.generate()
+    nonce, chain, tree = commit_claims(state,
+            [("marios", "test1"), ("bogdan", "test2")],
+            [(reader_params.dh.pk, ["marios", "bogdan"])])
+
+    # Swap the encrypted claim of one label for the other
+    vrf_value = state._vrf_value_by_label["marios"]
+    claim_lookup_key = _compute_claim_key(vrf_value, mode='lookup')
+    other_vrf_value = state._vrf_value_by_label["bogdan"]
+    other_enc_claim = state.tree[
+            _compute_claim_key(other_vrf_value, mode='lookup')]
+
+    class TamperedTree(object):
+        root_hash = tree.root()
+
+        def __getitem__(self, key):
+            if key == claim_lookup_key:
+                return other_enc_claim
+            return state.tree[key]
+
+    with reader_params.as_default():
+        view = View(chain, source_tree=TamperedTree())
+        claims = view.get_many(["marios", "bogdan"])
+    assert claims["bogdan"] == b"test2"
+    assert isinstance(claims["marios"], Exception)
+
+
+def test_view_cache_skips_parsing_unchanged_head(state, monkeypatch):
+    reader_params = LocalParams.generate()
+    _, chain, tree = commit_claims(state,
+            [("marios", "test1"), ("bogdan", "test2")],
+            [(reader_params.dh.pk, ["marios", "bogdan"])])
+
+    parsed = []
+    from_dict = Payload.from_dict
+    def counting_from_dict(exported):
+        parsed.append(exported)
+        return from_dict(exported)
+    monkeypatch.setattr(Payload, "from_dict", staticmethod(counting_from_dict))
+
+    cache = ViewCache(maxsize=2)
+    with reader_params.as_default():
+        for _ in range(5):
+            view = View(chain, cache=cache)
+            assert view["marios"] == b"test1"
+    assert len(parsed) == 1
+    assert cache.stats()["hits"] == 4
+    assert cache.stats()["misses"] == 1
+
+    # New head is parsed again
+    state["marios"] = "test3"
+    state.commit(chain)
+    assert View(chain, cache=cache)["marios"] == b"test3"
+    assert len(parsed) == 2
+
+    # So is the same head in another store
+    other_chain = hippiehug.Chain(dict(chain.store), root_hash=chain.head)
+    assert View(other_chain, cache=cache)["marios"] == b"test3"
+    assert len(parsed) == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_view_cache_does_not_keep_stores_alive(state):
+    import gc
+    import weakref
+
+    state["marios"] = "test1"
+    store = ObjectStore()
+    chain = hippiehug.Chain(store)
+    state.commit(chain)
+    head = chain.head
+
+    cache = ViewCache()
+    assert View(chain, cache=cache)["marios"] == b"test1"
+    store_ref = weakref.ref(store)
+    state.clear()
+    del chain, store
+    gc.collect()
+    assert store_ref() is None
+
+    # A new store does not get the head of the collected one
+    other_chain = hippiehug.Chain(ObjectStore(), root_hash=head)
+    with pytest.raises(KeyError):
+        View(other_chain, cache=cache)
+
+
+def test_view_cache_disabled(state):
+    _, chain, _ = commit_claims(state, [("marios", "test1")])
+    cache = ViewCache(maxsize=0)
+    assert View(chain, cache=cache).payload is not \
+           View(chain, cache=cache).payload
+    assert cache.stats()["size"] == 0
+
+
+def test_incremental_commit_reuses_nonce_and_encodings(state, monkeypatch):
+    reader_params = LocalParams.generate()
+    state["marios"] = "test1"
+    state["bogdan"] = "test2"
+    state.grant_access(reader_params.dh.pk, ["marios"])
+
+    store = {}
+    chain = hippiehug.Chain(store)
+    state.commit(chain, incremental=True)
+    nonce = state._nonce
+
+    import claimchain.parallel
+    encoded_labels = []
+    encode_claim_batch = claimchain.parallel.encode_claim_batch
+    def counting_encode_claim_batch(nonce, claims):
+        encoded_labels.extend(claim_label for claim_label, _ in claims)
+        return encode_claim_batch(nonce, claims)
+    monkeypatch.setattr(claimchain.parallel, "encode_claim_batch",
+                        counting_encode_claim_batch)
+
+    state["george"] = "test4"
+    state.grant_access(reader_params.dh.pk, ["george", "bogdan"])
+    state.commit(chain, incremental=True)
+
+    assert state._nonce == nonce
+    assert encoded_labels == ["george"]
+
+    own_view = View(chain)
+    assert own_view["marios"] == b"test1"
+    assert own_view["bogdan"] == b"test2"
+    assert own_view["george"] == b"test4"
+
+    with reader_params.as_default():
+        view = View(chain)
+        assert view["marios"] == b"test1"
+        assert view["bogdan"] == b"test2"
+        assert view["george"] == b"test4"
+
+
+def test_incremental_commit_never_reuses_claim_key_and_iv(state, monkeypatch):
+    from claimchain import core
+    encryptions = []
+    encrypt_claim = core.Codec._encrypt_claim
+    def recording_encrypt_claim(codec, vrf, claim_content):
+        enc_key = codec.compute_claim_key(vrf.value, mode='enc')
+        encoded = encrypt_claim(codec, vrf, claim_content)
+        _, _, iv = decode(encoded[-1])
+        encryptions.append((enc_key, iv))
+        return encoded
+    monkeypatch.setattr(core.Codec, "_encrypt_claim",
+                        recording_encrypt_claim)
+
+    state["marios"] = "test1"
+    state["bogdan"] = "A"
+    chain = hippiehug.Chain({})
+    state.commit(chain, incremental=True)
+    nonce = state._nonce
+
+    state["bogdan"] = "B"
+    state.commit(chain, incremental=True)
+    state.commit(chain, nonce=nonce)
+
+    assert len(encryptions) == 5
+    assert len(set(encryptions)) == len(encryptions)
+    assert View(chain)["bogdan"] == b"B"
+
+
+def test_incremental_commit_rewrites_changed_claims(state):
+    state["marios"] = "test1"
+    state["bogdan"] = "A"
+    chain = hippiehug.Chain({})
+    old_head = state.commit(chain, incremental=True)
+    nonce = state._nonce
+    prev_items = dict(state._enc_items_map)
+
+    state["bogdan"] = "B"
+    state.commit(chain, incremental=True)
+    assert state._nonce == nonce
+
+    changed_keys = [lookup_key
+                    for lookup_key, enc_item in state._enc_items_map.items()
+                    if prev_items.get(lookup_key) is not enc_item]
+    assert changed_keys == [state._enc_claim_by_label["bogdan"][1]]
+    assert set(state._enc_items_map) == set(prev_items)
+
+    assert View(chain)["bogdan"] == b"B"
+    assert View(chain)["marios"] == b"test1"
+    old_chain = hippiehug.Chain(chain.store, root_hash=old_head)
+    assert View(old_chain)["bogdan"] == b"A"
+
+
+def test_incremental_commit_extends_tree_on_additions(state):
+    reader_params = LocalParams.generate()
+    state["marios"] = "test1"
+
+    store = {}
+    chain = hippiehug.Chain(store)
+    state.commit(chain, incremental=True)
+    prev_items = dict(state._enc_items_map)
+
+    state["bogdan"] = "test2"
+    state.grant_access(reader_params.dh.pk, ["bogdan"])
+    state.commit(chain, incremental=True)
+
+    for lookup_key in list(prev_items) + list(state._enc_items_map):
+        assert lookup_key in state.tree
+
+    state.revoke_access(reader_params.dh.pk, ["bogdan"])
+    state.commit(chain, incremental=True)
+    assert len(state._enc_items_map) == 2
+    with reader_params.as_default():
+        with pytest.raises(KeyError):
+            View(chain)["bogdan"]
+
+
+def test_incremental_commit_with_new_nonce_reencodes(state):
+    state["marios"] = "test1"
+
+    store = {}
+    chain = hippiehug.Chain(store)
+    state.commit(chain, incremental=True)
+    old_lookup_keys = set(state._enc_items_map)
+
+    state.commit(chain, nonce=b"new epoch nonce!", incremental=True)
+    assert state._nonce == b"new epoch nonce!"
+    assert not old_lookup_keys & set(state._enc_items_map)
+    assert View(chain)["marios"] == b"test1"
+
+
+def test_commit_in_batches(state):
+    class BatchStore(dict):
+        batch_sizes = []
+
+        def update(self, items):
+            self.batch_sizes.append(len(items))
+            super(BatchStore, self).update(items)
+
+    reader_params = LocalParams.generate()
+    claims = [("label%d" % i, "content%d" % i) for i in range(10)]
+    for label, content in claims:
+        state[label] = content
+    state.grant_access(reader_params.dh.pk, [label for label, _ in claims])
+
+    store = BatchStore()
+    chain = hippiehug.Chain(store)
+    state.commit(chain, batch_size=8)
+    assert len(store.batch_sizes) > 1
+    assert max(store.batch_sizes) <= 8
+
+    with reader_params.as_default():
+        view = View(chain)
+        for label, content in claims:
+            assert view[label] == content.encode()
+
+
+def test_commit_streams_encodings(state, monkeypatch):
+    import claimchain.parallel
+    batch_sizes = []
+    encode_claim_batch = claimchain.parallel.encode_claim_batch
+    def recording_encode_claim_batch(nonce, claims):
+        batch_sizes.append(len(claims))
+        return encode_claim_batch(nonce, claims)
+    monkeypatch.setattr(claimchain.parallel, "encode_claim_batch",
+                        recording_encode_claim_batch)
+
+    reader_params = LocalParams.generate()
+    labels = ["label%d" % i for i in range(10)]
+    for label in labels:
+        state[label] = "content"
+    state.grant_access(reader_params.dh.pk, labels)
+
+    chain = hippiehug.Chain({})
+    state.commit(chain, batch_size=4)
+    assert batch_sizes == [4, 4, 2]
+    # Encodings are only kept for incremental commits
+    assert not state._enc_items_map
+    assert not state._enc_claim_by_label
+    assert not state._enc_cap_by_grant
+
+    with reader_params.as_default():
+        assert View(chain).get_many(labels) == {
+                label: b"content" for label in labels}
+
+
+def test_commit_with_process_pool(state):
+    futures = pytest.importorskip("concurrent.futures")
+    reader_params = LocalParams.generate()
+    claims = [("label%d" % i, "content%d" % i) for i in range(20)]
+    caps = [(reader_params.dh.pk, [label for label, _ in claims[:10]])]
+
+    with futures.ProcessPoolExecutor(max_workers=2) as executor:
+        for label, content in claims:
+            state[label] = content
+        state.grant_access(*caps[0])
+        chain = hippiehug.Chain({})
+        state.commit(chain, executor=executor)
+
+    own_view = View(chain)
+    for label, content in claims:
+        assert own_view[label] == content.encode()
+
+    with reader_params.as_default():
+        view = View(chain)
+        for i, (label, content) in enumerate(claims):
+            if i < 10:
+                assert view[label] == content.encode()
+            else:
+                with pytest.raises(KeyError):
+                    view[label]
+
+
+def test_view_at_earlier_blocks(state):
+    store = {}
+    chain = hippiehug.Chain(store)
+    timestamps = []
+    for i in range(5):
+        state["marios"] = "test%d" % i
+        state.commit(chain)
+        timestamps.append(state._payload.timestamp)
+
+    view = View(chain)
+    for i in range(5):
+        assert view.at(index=i)["marios"] == b"test%d" % i
+        assert view.at(timestamp=timestamps[i])["marios"] == b"test%d" % i
+    with pytest.raises(IndexError):
+        view.at(index=5)
+    with pytest.raises(KeyError):
+        view.at(timestamp=timestamps[0] - 1)
+
+    # Views of earlier blocks do not see later ones
+    old_view = view.at(index=2)
+    assert old_view.at(timestamp=timestamps[4])["marios"] == b"test2"
+
+
+def test_owner_reads_without_vrf_proofs(state, monkeypatch):
+    import claimchain.state
+    _, chain, _ = commit_claims(state,
+            [("marios", "test1"), ("bogdan", "test2")])
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Owner reads need no VRF proofs")
+    monkeypatch.setattr(claimchain.state, "compute_vrf_batch", fail)
+    monkeypatch.setattr(claimchain.state, "encode_claim", fail)
+    monkeypatch.setattr(claimchain.state, "decode_claim", fail)
+    monkeypatch.setattr(claimchain.state, "verify_vrf_batch", fail)
+
+    view = View(chain)
+    assert view["marios"] == b"test1"
+    assert view.get_many(["marios", "bogdan"]) == \
+           {"marios": b"test1", "bogdan": b"test2"}
+    with pytest.raises(KeyError):
+        view["george"]
+
+
+def test_owner_index_skips_vrfs(state, monkeypatch):
+    import claimchain.state
+    state.owner_index = OwnerIndex(max_nonces=None)
+    chain = hippiehug.Chain({})
+    for i in range(3):
+        state["marios"] = "test%d" % i
+        state.commit(chain)
+    assert len(state.owner_index) == 3
+
+    # The index survives persisting
+    owner_index = OwnerIndex.parse(state.owner_index.serialize(),
+                                   max_nonces=None)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("VRF computed despite the index")
+    monkeypatch.setattr(claimchain.state, "compute_vrf_value", fail)
+
+    view = View(chain, owner_index=owner_index)
+    assert view["marios"] == b"test2"
+    assert view.get_many(["marios"]) == {"marios": b"test2"}
+    assert view.at(index=0)["marios"] == b"test0"
+
+    # Labels missing from the index fall back to computing the VRF
+    monkeypatch.undo()
+    with pytest.raises(KeyError):
+        view["george"]
+
+
+def test_owner_index_keeps_last_commit_by_default(state):
+    chain = hippiehug.Chain({})
+    for i in range(3):
+        state["marios"] = "test%d" % i
+        state.commit(chain)
+    assert len(state.owner_index) == 1
+    assert state.owner_index.get(state._nonce, "marios") is not None
+    assert View(chain, owner_index=state.owner_index).at(index=0)["marios"] \
+            == b"test0"
+
+    state.clear()
+    assert len(state.owner_index) == 0
+    assert state._nonce is None
@@ -0,0 +1,131 @@
+import pytest
+import hippiehug
+
+from claimchain import State, View
+from claimchain.crypto import LocalParams
+from claimchain.utils import FileStore
+from claimchain.validation import ChainValidator
+
+
+@pytest.fixture(scope="module", autouse=True)
+def local_params():
+    with LocalParams.generate().as_default() as params:
+        yield params
+
+
+def build_chain(store, num_blocks):
+    state = State()
+    chain = hippiehug.Chain(store)
+    for i in range(num_blocks):
+        state["marios"] = "test%d" % i
+        state.commit(chain)
+    return state, chain
+
+
+def test_validate_chain():
+    state, chain = build_chain({}, 10)
+    validator = ChainValidator(chain.store)
+    assert validator.validate(chain.head, chunk_size=3) == 10
+    assert validator.checkpoint == (9, chain.head)
+
+    # Only the new blocks are validated
+    state.commit(chain)
+    assert validator.validate(chain.head) == 1
+    View(chain).validate()
+
+
+def test_view_reuses_validator():
+    state, chain = build_chain({}, 3)
+    view = View(chain)
+    view.validate()
+    validator = view.validator
+    assert validator.checkpoint == (2, chain.head)
+    view.validate()
+    assert view.validator is validator
+
+    # Only the new block is validated
+    state.commit(chain)
+    validated = []
+    validate = validator.validate
+    def counting_validate(*args, **kwargs):
+        validated.append(validate(*args, **kwargs))
+    validator.validate = counting_validate
+    View(chain, validator=validator).validate()
+    assert validated == [1]
+    assert validator.checkpoint == (3, chain.head)
+
+
+def test_validate_with_process_pool():
+    futures = pytest.importorskip("concurrent.futures")
+    _, chain = build_chain({}, 10)
+    with futures.ProcessPoolExecutor(max_workers=2) as executor:
+        validator = ChainValidator(chain.store)
+        assert validator.validate(chain.head, executor=executor,
+                                  chunk_size=3) == 10
+
+
+def test_invalid_signature_is_detected():
+    _, chain = build_chain({}, 6)
+    head_block = chain.store[chain.head]
+    prev_block = chain.store[head_block.fingers[0][1]]
+    # Head block with the signature of the previous block
+    forged_block = hippiehug.Block(head_block.items, index=head_block.index,
+                                   fingers=head_block.fingers,
+                                   aux=prev_block.aux)
+    chain.store[forged_block.hid] = forged_block
+    with pytest.raises(ValueError, match="signature in block 5"):
+        ChainValidator(chain.store).validate(forged_block.hid)
+    # Blocks are not touched by validation
+    assert chain.store[chain.head].aux is not None
+
+
+def append_block_of_other_signer(chain):
+    other_chain = hippiehug.Chain(chain.store, root_hash=chain.head)
+    with LocalParams.generate().as_default():
+        other_state = State()
+        other_state["marios"] = "forged"
+        return other_state.commit(other_chain)
+
+
+def test_signing_key_change_is_detected():
+    _, chain = build_chain({}, 3)
+    head = append_block_of_other_signer(chain)
+    with pytest.raises(ValueError, match="Block 3 changes the signing key"):
+        ChainValidator(chain.store).validate(head)
+
+
+def test_signing_key_change_after_checkpoint_is_detected():
+    _, chain = build_chain({}, 3)
+    validator = ChainValidator(chain.store)
+    assert validator.validate(chain.head) == 3
+    head = append_block_of_other_signer(chain)
+    with pytest.raises(ValueError, match="Block 3 changes the signing key"):
+        validator.validate(head)
+    assert validator.checkpoint == (2, chain.head)
+
+
+def test_wrong_fingers_are_detected():
+    _, chain = build_chain({}, 4)
+    head_block = chain.store[chain.head]
+    bad_block = hippiehug.Block(head_block.items, index=head_block.index,
+                                fingers=head_block.fingers[:1],
+                                aux=head_block.aux)
+    chain.store[bad_block.hid] = bad_block
+    with pytest.raises(ValueError):
+        ChainValidator(chain.store).validate(bad_block.hid)
+
+
+def test_checkpoint_persists(tmpdir):
+    path = str(tmpdir.join("checkpoint"))
+    with FileStore(str(tmpdir.join("store"))) as store:
+        state, chain = build_chain(store, 3)
+        assert ChainValidator(store, checkpoint_path=path).validate(
+                chain.head) == 3
+        state.commit(chain)
+        validator = ChainValidator(store, checkpoint_path=path)
+        assert validator.checkpoint[0] == 2
+        assert validator.validate(chain.head) == 1
+
+        other_state, other_chain = build_chain(store, 5)
+        with pytest.raises(ValueError):
+            validator.validate(other_chain.head)
@@ -0,0 +1,89 @@
+import io
+import os
+
+import pytest
+import msgpack
+
+from claimchain.utils import Tree, Blob
+from claimchain.utils import encode_evidence_bundle, verify_evidence_bundle
+from claimchain.utils import COMPRESSION_NONE, COMPRESSION_ZLIB
+from claimchain.utils.evidence import _MAGIC, _COMPRESSION_CODES
+
+
+@pytest.fixture
+def items():
+    return {os.urandom(8): Blob(os.urandom(64)) for _ in range(500)}
+
+
+@pytest.fixture
+def tree(items):
+    return Tree.from_items(None, items)
+
+
+@pytest.mark.parametrize('compression', [COMPRESSION_NONE, COMPRESSION_ZLIB])
+def test_bundle_roundtrip(tree, items, compression):
+    keys = list(items)[:100]
+    bundle = encode_evidence_bundle(
+            tree, keys + [b'non-existent'], compression=compression)
+    evidence = verify_evidence_bundle(bundle, tree.root_hash)
+    assert evidence.root_hash == tree.root_hash
+    assert set(evidence.keys()) == set(keys)
+    for key in keys:
+        assert evidence[key] == items[key]
+    assert b'non-existent' not in evidence
+
+    # Streaming from a file
+    evidence = verify_evidence_bundle(io.BytesIO(bundle), tree.root_hash)
+    assert set(evidence.keys()) == set(keys)
+
+
+def test_bundle_smaller_than_independent_proofs(tree, items):
+    keys = list(items)[:100]
+    bundle = encode_evidence_bundle(tree, keys, compression=COMPRESSION_NONE)
+    separate = [encode_evidence_bundle(tree, [key],
+                                       compression=COMPRESSION_NONE)
+                for key in keys]
+    assert len(bundle) < 0.5 * sum(len(proof) for proof in separate)
+
+
+def test_bundle_rejects_wrong_root(tree, items):
+    bundle = encode_evidence_bundle(tree, list(items)[:10])
+    with pytest.raises(ValueError):
+        verify_evidence_bundle(bundle, os.urandom(32))
+
+
+def rewrite_bundle(bundle, rewrite_entries):
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(bundle[len(_MAGIC) + 1:])
+    objects = list(unpacker)
+    entries = rewrite_entries(objects[1:])
+    return _MAGIC + _COMPRESSION_CODES[COMPRESSION_NONE] + b''.join(
+            msgpack.packb(obj, use_bin_type=True)
+            for obj in [objects[0]] + entries)
+
+
+def test_bundle_rejects_tampering(tree, items):
+    keys = list(items)[:10]
+    bundle = encode_evidence_bundle(tree, keys, compression=COMPRESSION_NONE)
+
+    def tamper_value(entries):
+        for entry in entries:
+            if entry[0] == 0:
+                entry[2] = b'tampered'
+                break
+        return entries
+
+    def add_dangling_leaf(entries):
+        return [[0, b'extra', b'value']] + [
+                [entry[0], entry[1]] + [ref + 1 if isinstance(ref, int) else ref
+                                        for ref in entry[2:]]
+                if entry[0] == 2 else entry
+                for entry in entries]
+
+    def truncate(entries):
+        return entries[:-1]
+
+    for rewrite in [tamper_value, add_dangling_leaf, truncate]:
+        with pytest.raises(ValueError):
+            verify_evidence_bundle(
+                    rewrite_bundle(bundle, rewrite), tree.root_hash)
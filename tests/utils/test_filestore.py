@@ -0,0 +1,112 @@
+import os
+
+import pytest
+import hippiehug
+
+from claimchain import State, View
+from claimchain.crypto import LocalParams
+from claimchain.utils import FileStore, ObjectStore, Tree, Blob
+
+
+@pytest.fixture
+def store_path(tmpdir):
+    return str(tmpdir.join("store"))
+
+
+def test_store_blobs_and_nodes(store_path):
+    with FileStore(store_path, initial_capacity=4) as store:
+        tree = Tree(ObjectStore(store))
+        tree.update({b"label%d" % i: Blob(b"value%d" % i) for i in range(20)})
+        root_hash = tree.root_hash
+        num_objects = len(store)
+
+    with FileStore(store_path) as store:
+        assert len(store) == num_objects
+        assert len(list(store.keys())) == num_objects
+        tree = Tree(store, root_hash=root_hash)
+        for i in range(20):
+            assert tree[b"label%d" % i] == b"value%d" % i
+
+
+def test_store_chain(store_path):
+    with LocalParams.generate().as_default():
+        state = State()
+        state["marios"] = "test"
+        with FileStore(store_path) as store:
+            head = state.commit(hippiehug.Chain(store))
+
+        with FileStore(store_path) as store:
+            view = View(hippiehug.Chain(store, root_hash=head))
+            assert view["marios"] == b"test"
+
+
+def test_store_recovers_from_torn_append(store_path):
+    blob = Blob(b"test")
+    with FileStore(store_path) as store:
+        store[blob.hid] = blob
+    with open(os.path.join(store_path, "objects.log"), "ab") as f:
+        f.write(b"\x00\x00\x00\xfftorn")
+
+    with FileStore(store_path) as store:
+        assert len(store) == 1
+        assert store[blob.hid] == b"test"
+        other = Blob(b"other")
+        store[other.hid] = other
+        assert store[other.hid] == b"other"
+
+
+def test_store_recovers_from_unclean_shutdown(store_path):
+    store = FileStore(store_path)
+    blobs = [Blob(b"value%d" % i) for i in range(10)]
+    store.update({blob.hid: blob for blob in blobs})
+    del store
+
+    with FileStore(store_path) as store:
+        for blob in blobs:
+            assert store[blob.hid] == blob
+
+
+def test_store_raw_view(store_path):
+    blob = Blob(b"test")
+    with FileStore(store_path) as store:
+        store[blob.hid] = blob
+        assert bytes(store.raw(blob.hid)) == b"test"
+        with pytest.raises(KeyError):
+            store.raw(b"missing")
+
+
+def test_store_compact(store_path):
+    blobs = [Blob(b"value%d" % i) for i in range(10)]
+    with FileStore(store_path) as store:
+        store.update({blob.hid: blob for blob in blobs})
+        store.compact(keep={blob.hid for blob in blobs[:3]})
+        assert len(store) == 3
+        assert blobs[0].hid in store
+        assert blobs[5].hid not in store
+
+    with FileStore(store_path) as store:
+        assert len(store) == 3
+        assert store[blobs[2].hid] == blobs[2]
+
+
+def test_store_writes_during_iteration(store_path):
+    import threading
+    blobs = [Blob(b"value%d" % i) for i in range(10)]
+    with FileStore(store_path) as store:
+        store.update({blob.hid: blob for blob in blobs[:5]})
+        items = store.items()
+        first = next(items)
+
+        # Iterating does not hold the lock
+        writer = threading.Thread(target=store.update,
+                                  args=({blob.hid: blob
+                                         for blob in blobs[5:]},))
+        writer.daemon = True
+        writer.start()
+        writer.join(timeout=5)
+        assert not writer.is_alive()
+
+        # Only the records written before iterating started are seen
+        assert dict([first] + list(items)) == \
+               {blob.hid: blob for blob in blobs[:5]}
+        assert len(list(store.keys())) == 10
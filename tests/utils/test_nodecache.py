@@ -0,0 +1,83 @@
+import hippiehug
+
+from claimchain import State, View
+from claimchain.crypto import LocalParams
+from claimchain.utils import CachingObjectStore, ObjectStore, Tree, Blob
+
+
+class CountingBackend(dict):
+    def __init__(self, *args, **kwargs):
+        super(CountingBackend, self).__init__(*args, **kwargs)
+        self.reads = 0
+
+    def __getitem__(self, lookup_key):
+        self.reads += 1
+        return super(CountingBackend, self).__getitem__(lookup_key)
+
+
+def build_tree(num_items=200):
+    items = {b"label%d" % i: Blob(b"value%d" % i) for i in range(num_items)}
+    backend = CountingBackend()
+    root_hash = Tree.from_items(backend, items).root_hash
+    return backend, root_hash, items
+
+
+def test_repeated_lookups_hit_the_cache():
+    backend, root_hash, items = build_tree()
+    store = CachingObjectStore(backend)
+    tree = Tree(ObjectStore(store), root_hash=root_hash)
+    for key in items:
+        assert tree[key] == items[key]
+    reads = backend.reads
+
+    for key in items:
+        assert key in tree
+    assert backend.reads == reads
+
+    stats = store.stats()
+    assert stats["by_depth"][0]["hits"] >= len(items)
+    assert stats["by_depth"][0]["misses"] == 1
+    top_nodes = {node.hid for key in items
+                 for node in tree.evidence(key)[1][:store.pinned_levels]}
+    assert stats["pinned"] == len(top_nodes)
+
+
+def test_byte_budget_keeps_pinned_levels():
+    backend, root_hash, items = build_tree()
+    store = CachingObjectStore(backend, max_bytes=8 * 1024, pinned_levels=2)
+    tree = Tree(store, root_hash=root_hash)
+    for key in items:
+        tree[key]
+    stats = store.stats()
+    assert stats["bytes"] <= store.max_bytes
+    assert stats["evictions"] > 0
+    assert stats["pinned"] == 3
+
+    # Top levels are not fetched again
+    backend.reads = 0
+    tree[b"label0"]
+    depth = len(tree.evidence(b"label0")[1])
+    assert backend.reads <= depth - 2 + 1
+
+
+def test_view_over_caching_store():
+    with LocalParams.generate().as_default():
+        state = State()
+        state["marios"] = "test"
+        store = CachingObjectStore({}, pinned_levels=2)
+        head = state.commit(hippiehug.Chain(store))
+        view = View(hippiehug.Chain(store, root_hash=head))
+        assert view["marios"] == b"test"
+        assert view["marios"] == b"test"
+    assert store.stats()["by_depth"][0]["hits"] >= 2
+
+
+def test_len_is_size_of_backend():
+    backend, root_hash, items = build_tree(num_items=20)
+    store = CachingObjectStore(backend)
+    assert store.cached_count == 0
+    assert len(store) == len(backend)
+
+    Tree(ObjectStore(store), root_hash=root_hash)[b"label0"]
+    assert 0 < store.cached_count < len(store)
+    assert len(store) == len(backend)
@@ -0,0 +1,180 @@
+import pytest
+import hippiehug
+
+from claimchain import State, View
+from claimchain.crypto import LocalParams
+from claimchain.utils import RedisObjectStore, ObjectStore, Tree, Blob
+
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class CountingClient(object):
+    """Redis client counting the requests sent to the server."""
+    def __init__(self):
+        self._client = fakeredis.FakeStrictRedis()
+        self.requests = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == "pipeline":
+            def pipeline(*args, **kwargs):
+                pipe = attr(*args, **kwargs)
+                execute = pipe.execute
+                def counted_execute():
+                    self.requests += 1
+                    return execute()
+                pipe.execute = counted_execute
+                return pipe
+            return pipeline
+
+        def counted(*args, **kwargs):
+            self.requests += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+@pytest.fixture
+def client():
+    return CountingClient()
+
+
+def test_store_blobs_and_nodes(client):
+    items = {b"label%d" % i: Blob(b"value%d" % i) for i in range(50)}
+    tree = Tree.from_items(ObjectStore(RedisObjectStore(client)), items)
+    # Values and nodes are written in one pipeline
+    assert client.requests == 1
+
+    store = RedisObjectStore(client, cache_size=0)
+    tree = Tree(ObjectStore(store), root_hash=tree.root_hash)
+    assert tree[b"label1"] == b"value1"
+    assert b"missing" not in tree
+    assert tree.get_many(items) == items
+
+    # Stores with other prefixes do not see the objects
+    assert tree.root_hash not in RedisObjectStore(client, prefix=b"other:")
+
+
+def test_evidence_many_fetches_a_level_at_a_time(client):
+    items = {b"label%d" % i: Blob(b"value%d" % i) for i in range(100)}
+    root_hash = Tree.from_items(RedisObjectStore(client), items).root_hash
+
+    store = RedisObjectStore(client)
+    tree = Tree(store, root_hash=root_hash)
+    client.requests = 0
+    _, nodes, _ = tree.evidence_many(items)
+    depth = max(len(tree.evidence(key)[1]) for key in items)
+    assert client.requests == depth
+    assert len(nodes) == len(store.cache)
+
+    # Cached nodes are not fetched again
+    client.requests = 0
+    tree.evidence_many(items)
+    assert client.requests == 0
+
+
+def test_batch(client):
+    store = RedisObjectStore(client)
+    blob1, blob2 = Blob(b"value1"), Blob(b"value2")
+    with store.batch():
+        store[blob1.hid] = blob1
+        with store.batch():
+            store[blob2.hid] = blob2
+        assert store[blob1.hid] == blob1
+        assert client.requests == 0
+    assert client.requests == 1
+    assert RedisObjectStore(client).get_many([blob1.hid, blob2.hid]) == \
+           {blob1.hid: blob1, blob2.hid: blob2}
+
+    blob3 = Blob(b"value3")
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store[blob3.hid] = blob3
+            raise RuntimeError()
+    assert blob3.hid not in store
+
+
+def test_failed_batch_drops_only_its_writes(client):
+    store = RedisObjectStore(client)
+    blob1, blob2 = Blob(b"value1"), Blob(b"value2")
+    with store.batch():
+        store[blob1.hid] = blob1
+        with pytest.raises(RuntimeError):
+            with store.batch():
+                store[blob2.hid] = blob2
+                raise RuntimeError()
+        assert blob2.hid not in store
+    assert blob1.hid in RedisObjectStore(client)
+    assert blob2.hid not in RedisObjectStore(client)
+
+
+def test_batches_are_per_thread(client):
+    import threading
+    store = RedisObjectStore(client)
+    blob1, blob2 = Blob(b"value1"), Blob(b"value2")
+    entered, written = threading.Event(), threading.Event()
+    errors = []
+
+    def write_failing_batch():
+        try:
+            with store.batch():
+                store[blob2.hid] = blob2
+                entered.set()
+                written.wait()
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=write_failing_batch)
+    thread.start()
+    entered.wait()
+    with store.batch():
+        store[blob1.hid] = blob1
+        # Writes pending in the other thread are not seen here
+        assert blob2.hid not in store
+    written.set()
+    thread.join()
+
+    assert not errors
+    assert blob1.hid in RedisObjectStore(client)
+    assert blob2.hid not in RedisObjectStore(client)
+
+
+def test_batch_sends_early_past_max_pending(client):
+    store = RedisObjectStore(client, max_pending=3)
+    blobs = [Blob(b"value%d" % i) for i in range(5)]
+    with store.batch():
+        store.update((blob.hid, blob) for blob in blobs[:3])
+        assert client.requests == 1
+        store.update((blob.hid, blob) for blob in blobs[3:])
+        assert client.requests == 1
+    assert client.requests == 2
+    assert len(RedisObjectStore(client).get_many(
+            blob.hid for blob in blobs)) == 5
+
+
+def test_commit_and_view(client):
+    with LocalParams.generate().as_default():
+        state = State()
+        state["marios"] = "test"
+        state["bogdan"] = "test2"
+        store = RedisObjectStore(client)
+        chain = hippiehug.Chain(store)
+        client.requests = 0
+        head = state.commit(chain)
+        # Reading the previous head, and writing the nodes and the block
+        assert client.requests <= 2
+
+        state["carmela"] = "test3"
+        client.requests = 0
+        head = state.commit(chain, incremental=True)
+        requests = client.requests
+
+        view = View(hippiehug.Chain(RedisObjectStore(client),
+                                    root_hash=head))
+        assert view["marios"] == b"test"
+        assert view["carmela"] == b"test3"
+    # Single pipeline for all writes of the incremental commit
+    assert requests <= 2
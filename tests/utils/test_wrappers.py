@@ -0,0 +1,84 @@
+import os
+
+import pytest
+import hippiehug
+
+from claimchain.utils import Tree, Blob, ObjectStore, check_evidence
+
+
+def incremental_root(items):
+    tree = hippiehug.Tree({})
+    for key, value in items:
+        tree.add(value, key=key)
+    return tree.root()
+
+
+@pytest.mark.parametrize('key_order', ['random', 'sorted'])
+def test_tree_from_items_same_root_as_incremental(key_order):
+    items = [(os.urandom(8), Blob(os.urandom(16))) for _ in range(100)]
+    if key_order == 'sorted':
+        items.sort()
+    tree = Tree.from_items(None, dict(items))
+    assert tree.root_hash == incremental_root(items)
+    for key, value in items:
+        assert tree[key] == value
+        root_hash, evidence = tree.evidence(key)
+        assert root_hash == tree.root_hash
+        assert check_evidence(root_hash, evidence, key)
+
+
+def test_tree_from_items_writes_single_batch():
+    class BatchStore(dict):
+        batches = 0
+
+        def update(self, items):
+            self.batches += 1
+            super(BatchStore, self).update(items)
+
+    store = BatchStore()
+    items = {os.urandom(8): Blob(os.urandom(16)) for _ in range(50)}
+    tree = Tree.from_items(ObjectStore(store), items)
+    assert store.batches == 1
+    # Values, leaves, and branches; no intermediate nodes
+    assert len(store) == 50 + 50 + 49
+    assert tree.root_hash in store
+
+
+def test_tree_from_items_streams_batches():
+    class BatchStore(dict):
+        batch_sizes = []
+
+        def update(self, items):
+            self.batch_sizes.append(len(items))
+            super(BatchStore, self).update(items)
+
+    store = BatchStore()
+    items = [(os.urandom(8), Blob(os.urandom(16))) for _ in range(50)]
+    tree = Tree.from_items(store, iter(items), batch_size=16)
+    assert tree.root_hash == incremental_root(items)
+    assert max(store.batch_sizes) == 16
+    assert sum(store.batch_sizes) == 50 + 50 + 49
+
+
+def test_tree_update_after_from_items():
+    items = [(os.urandom(8), Blob(os.urandom(16))) for _ in range(20)]
+    tree = Tree.from_items(None, dict(items[:10]))
+    tree.update(dict(items[10:]))
+    assert tree.root_hash == incremental_root(items)
+
+
+def test_tree_evidence_many_is_union_of_paths():
+    items = {os.urandom(8): Blob(os.urandom(16)) for _ in range(200)}
+    tree = Tree.from_items(None, items)
+    keys = list(items)[:50] + [b"non-existent"]
+
+    root_hash, nodes, leaves = tree.evidence_many(keys)
+    assert root_hash == tree.root_hash
+    expected = {}
+    for key in keys:
+        _, path = tree.evidence(key)
+        expected.update((node.hid, node) for node in path)
+        assert leaves[key].hid == path[-1].hid
+    assert [node.hid for node in nodes] == \
+           list({node.hid: None for node in nodes})
+    assert {node.hid for node in nodes} == set(expected)